@@ -18,14 +18,26 @@ def _env_float(name: str, default: float) -> float:
     return float(raw)
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "si", "sí")
+
+
 class EmailConfig:
     SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
     SMTP_PORT = _env_int("SMTP_PORT", 587)
+    # SMTP_SSL para el puerto 465; STARTTLS por defecto salvo que se use SSL.
+    SMTP_SSL = _env_bool("SMTP_SSL", False)
+    SMTP_STARTTLS = _env_bool("SMTP_STARTTLS", not SMTP_SSL)
+    SMTP_TIMEOUT = _env_float("SMTP_TIMEOUT", 10.0)
     EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS", "")
+    # Sin contraseña no se hace login (relay local o de la red interna).
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")
     ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "")
     NOTIFICATION_THRESHOLD_DAYS = _env_float("NOTIFICATION_THRESHOLD_DAYS", 7.0)
 
     @classmethod
     def is_configured(cls) -> bool:
-        return bool(cls.EMAIL_ADDRESS and cls.EMAIL_PASSWORD and cls.ADMIN_EMAIL and cls.SMTP_SERVER)
+        return bool(cls.EMAIL_ADDRESS and cls.ADMIN_EMAIL and cls.SMTP_SERVER)
@@ -1,5 +1,6 @@
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.ext.declarative import declarative_base
 import os
 from pathlib import Path
@@ -32,11 +33,18 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+# Prefijo de los índices que declara models.py (a mano o con index=True). Al
+# arrancar, uno con este prefijo que models.py ya no declara se borra, y uno
+# declarado que falta se crea: los índices se definen en un solo lugar.
+MANAGED_INDEX_PREFIX = "ix_"
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -116,3 +124,132 @@ def ensure_zone_schema():
                       AND IFNULL(r.hideFromHistorial, 0) = 0
                 )
             """))
+
+    if not _column_exists("items", "original_name"):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE items ADD COLUMN original_name VARCHAR"))
+            conn.execute(text("ALTER TABLE items ADD COLUMN is_deleted BOOLEAN NOT NULL DEFAULT 0"))
+            conn.execute(text("ALTER TABLE items ADD COLUMN deleted_at DATETIME"))
+            # Borrados y recreaciones viejas renombraban el ítem a
+            # <nombre>__DELETED_<ts> / <nombre>__OLD_<ts>: se recupera el nombre real.
+            conn.execute(text("""
+                UPDATE items
+                SET original_name = CASE
+                        WHEN instr(name, '__DELETED_') > 0
+                            THEN substr(name, 1, instr(name, '__DELETED_') - 1)
+                        WHEN instr(name, '__OLD_') > 0
+                            THEN substr(name, 1, instr(name, '__OLD_') - 1)
+                        ELSE name
+                    END,
+                    is_deleted = CASE WHEN status = 0 THEN 1 ELSE 0 END,
+                    deleted_at = CASE
+                        WHEN status = 0 THEN (
+                            SELECT max(d.deleted_at) FROM deleted_items AS d
+                            WHERE d.item_id = items.id
+                        )
+                    END
+            """))
+            conn.execute(text(
+                "UPDATE items SET name = original_name WHERE name != original_name"
+            ))
+
+    if not _column_exists("items", "lineage_id"):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE items ADD COLUMN lineage_id INTEGER"))
+            conn.execute(text("ALTER TABLE movements ADD COLUMN lineage_id INTEGER"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_items_original_name ON items (original_name)"
+            ))
+            # Hasta ahora "el mismo producto" era el mismo nombre y categoría.
+            conn.execute(text("""
+                UPDATE items
+                SET lineage_id = (
+                    SELECT min(other.id) FROM items AS other
+                    WHERE other.original_name IS items.original_name
+                      AND other.category IS items.category
+                )
+            """))
+            conn.execute(text("""
+                UPDATE movements
+                SET lineage_id = (
+                    SELECT items.lineage_id FROM items WHERE items.id = movements.item_id
+                )
+            """))
+
+    if not _column_exists("observations", "thread_id"):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE observations ADD COLUMN thread_id INTEGER REFERENCES observation_threads(id)"
+            ))
+            conn.execute(text(
+                "ALTER TABLE items ADD COLUMN observation_thread_id INTEGER REFERENCES observation_threads(id)"
+            ))
+            # Cada ítem con observaciones pasa a tener su propio hilo, con su mismo id.
+            conn.execute(text("""
+                INSERT INTO observation_threads (id, created_at)
+                SELECT item_id, min(date) FROM observations
+                WHERE item_id IS NOT NULL
+                GROUP BY item_id
+            """))
+            conn.execute(text("UPDATE observations SET thread_id = item_id"))
+            conn.execute(text("""
+                UPDATE items SET observation_thread_id = id
+                WHERE id IN (SELECT id FROM observation_threads)
+            """))
+
+    if not _column_exists("import_jobs", "owner"):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE import_jobs ADD COLUMN owner VARCHAR"))
+            conn.execute(text("ALTER TABLE import_jobs ADD COLUMN heartbeat_at DATETIME"))
+
+    if not _column_exists("email_outbox", "claimed_by"):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE email_outbox ADD COLUMN claimed_by VARCHAR"))
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS items_lineage_ai AFTER INSERT ON items
+            WHEN new.lineage_id IS NULL BEGIN
+                UPDATE items SET lineage_id = new.id WHERE id = new.id;
+            END
+        """))
+        sync_indexes(conn)
+
+
+def _index_sql(sql: str) -> str:
+    return " ".join(sql.replace('"', "").split()).lower()
+
+
+def sync_indexes(conn) -> bool:
+    """Make the ``ix_`` indexes of the model tables match ``Base.metadata``.
+
+    Indexes models.py no longer declares are dropped; missing ones, or ones
+    whose definition changed, are created. Returns True if anything changed.
+    """
+    declared = {
+        index.name: index
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+        if index.name.startswith(MANAGED_INDEX_PREFIX)
+    }
+    existing = {
+        name: sql for name, table, sql in conn.execute(text(
+            "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        ))
+        if name.startswith(MANAGED_INDEX_PREFIX) and table in Base.metadata.tables
+    }
+    stale = set(existing) - set(declared)
+    for name, index in declared.items():
+        wanted = _index_sql(str(CreateIndex(index).compile(dialect=conn.dialect)))
+        if name in existing and _index_sql(existing[name]) != wanted:
+            stale.add(name)
+    missing = (set(declared) - set(existing)) | (stale & set(declared))
+    for name in sorted(stale):
+        conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+    for name in sorted(missing):
+        declared[name].create(conn)
+    if not (stale or missing):
+        return False
+    # Estadísticas para que el planificador elija entre los índices nuevos.
+    conn.execute(text("ANALYZE"))
+    return True
@@ -13,6 +13,7 @@ class ItemResponseDTO(BaseModel):
     zone_id: Optional[int] = None
     zone_name: Optional[str] = None
     status: int
+    lineage_id: Optional[int] = None
 
     class Config:
         from_attributes = True
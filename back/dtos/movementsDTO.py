@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -13,6 +13,14 @@ class MovementCreateDTO(BaseModel):
     to_zone_id: int
 
 
+class RelocationDTO(BaseModel):
+    from_zone_id: int
+    to_zone_id: int
+    # Sin item_ids se mueve toda la zona.
+    item_ids: Optional[List[int]] = None
+    username: Optional[str] = None
+
+
 class MovementResponseDTO(BaseModel):
     id: int
     item_id_origen: int
@@ -1,8 +1,19 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class RetiroDTO(BaseModel):
     itemId: int
     amount: int
     place: str
     personWhoTook: Optional[str] = None  
+
+
+class RetiroLineaDTO(BaseModel):
+    itemId: int
+    amount: int
+
+
+class RetiroLoteDTO(BaseModel):
+    place: str
+    personWhoTook: Optional[str] = None
+    items: List[RetiroLineaDTO]
@@ -1,8 +1,13 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class DevolucionDTO(BaseModel):
     itemId: int
     amount: int
     personWhoReturned: Optional[str] = None  
     place: str  
+
+
+class DevolucionLoteDTO(BaseModel):
+    personWhoReturned: Optional[str] = None
+    items: List[DevolucionDTO]
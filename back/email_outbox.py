@@ -0,0 +1,334 @@
+"""Outgoing email queue.
+
+Requests never talk to the SMTP server: they add a row to ``email_outbox``
+in their own transaction. A background thread sends what is due in batches
+over one SMTP connection that it keeps open between messages, and retries
+failures with exponential backoff up to ``OUTBOX_MAX_ATTEMPTS``.
+
+Every worker process runs its own sender, so a batch is claimed with one
+guarded UPDATE before anything goes out: a row is sent only by the process
+whose token ended up in ``claimed_by``. A claim left behind by a process that
+died expires after ``OUTBOX_CLAIM_LEASE``; that counts as an attempt, so a
+message that keeps killing its sender still ends up FAILED.
+"""
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.orm import Session
+
+import models
+from config import EmailConfig
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = max(1, int(os.getenv("OUTBOX_BATCH_SIZE", "50")))
+OUTBOX_MAX_ATTEMPTS = max(1, int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8")))
+OUTBOX_RETENTION = timedelta(days=int(os.getenv("OUTBOX_RETENTION_DAYS", "30")))
+# Espera máxima entre vueltas; un commit con correos nuevos despierta al hilo antes.
+OUTBOX_POLL_SECONDS = 30
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=6)
+# Los servidores cortan las conexiones inactivas: se cierra antes de que pase.
+SMTP_IDLE_SECONDS = 60
+# Tiempo que un lote reclamado queda reservado; cubre el lote entero aun con
+# cada envío agotando SMTP_TIMEOUT.
+OUTBOX_CLAIM_LEASE = timedelta(minutes=15)
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+_wakeup = threading.Event()
+_QUEUED_KEY = "email_outbox_queued"
+
+
+def enqueue_email(db: Session, subject: str, body: str, recipient: str = None) -> bool:
+    """Queue a message (to the admin by default); it goes out after the caller commits.
+
+    Returns False without queueing anything if email is not configured.
+    """
+    if not EmailConfig.is_configured():
+        logger.warning(
+            "Email no configurado (EMAIL_ADDRESS / ADMIN_EMAIL / SMTP_SERVER). "
+            "Se omite el correo: %s", subject
+        )
+        return False
+    now = datetime.utcnow()
+    db.add(models.OutboxEmail(
+        recipient=recipient or EmailConfig.ADMIN_EMAIL,
+        subject=subject,
+        body=body,
+        status=PENDING,
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    ))
+    db.info[_QUEUED_KEY] = True
+    return True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_sender(session):
+    if session.info.pop(_QUEUED_KEY, False):
+        _wakeup.set()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_queued(session):
+    session.info.pop(_QUEUED_KEY, None)
+
+
+class SmtpUnavailable(Exception):
+    """The server could not be reached or refused the session (not a single message)."""
+
+
+def _connection_lost(exc: OSError) -> bool:
+    # SMTPException hereda de OSError: solo cuentan la desconexión y los errores de socket.
+    return isinstance(exc, smtplib.SMTPServerDisconnected) or not isinstance(exc, smtplib.SMTPException)
+
+
+class SmtpConnection:
+    """One SMTP session reused across messages; reopened if the server drops it."""
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+
+    def _open(self):
+        factory = smtplib.SMTP_SSL if EmailConfig.SMTP_SSL else smtplib.SMTP
+        try:
+            server = factory(
+                EmailConfig.SMTP_SERVER, EmailConfig.SMTP_PORT, timeout=EmailConfig.SMTP_TIMEOUT
+            )
+        except (smtplib.SMTPException, OSError) as exc:
+            raise SmtpUnavailable(str(exc)) from exc
+        try:
+            if EmailConfig.SMTP_STARTTLS:
+                server.starttls()
+            if EmailConfig.EMAIL_PASSWORD:
+                server.login(EmailConfig.EMAIL_ADDRESS, EmailConfig.EMAIL_PASSWORD)
+        except (smtplib.SMTPException, OSError) as exc:
+            server.close()
+            raise SmtpUnavailable(str(exc)) from exc
+        return server
+
+    def send(self, message):
+        """Send one message; per-message refusals raise ``smtplib.SMTPException``."""
+        reopened = self._server is None
+        if reopened:
+            self._server = self._open()
+        try:
+            self._server.send_message(message)
+        except OSError as exc:
+            if not _connection_lost(exc):
+                raise
+            self.close()
+            if reopened:
+                raise SmtpUnavailable(str(exc)) from exc
+            # La conexión guardada se había cortado: una vez más con una nueva.
+            self._server = self._open()
+            try:
+                self._server.send_message(message)
+            except OSError as retry_exc:
+                if not _connection_lost(retry_exc):
+                    raise
+                self.close()
+                raise SmtpUnavailable(str(retry_exc)) from retry_exc
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            self.close()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+
+def _build_message(mail: models.OutboxEmail) -> MIMEText:
+    message = MIMEText(mail.body, "plain", "utf-8")
+    message["From"] = EmailConfig.EMAIL_ADDRESS
+    message["To"] = mail.recipient
+    message["Subject"] = mail.subject
+    return message
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return min(RETRY_BASE * (2 ** (attempts - 1)), RETRY_MAX)
+
+
+def _record_failure(mail: models.OutboxEmail, exc: Exception):
+    mail.attempts += 1
+    mail.last_error = str(exc)[:500]
+    if mail.attempts >= OUTBOX_MAX_ATTEMPTS:
+        mail.status = FAILED
+        logger.error("Correo %s descartado tras %s intentos: %s", mail.id, mail.attempts, exc)
+    else:
+        mail.status = PENDING
+        mail.next_attempt_at = datetime.utcnow() + retry_delay(mail.attempts)
+        logger.warning("Correo %s no enviado (intento %s): %s", mail.id, mail.attempts, exc)
+
+
+def _claim_token() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _expire_claims(db: Session, now: datetime):
+    """Count an attempt for every claim whose lease ran out and make it due again."""
+    expired = (
+        models.OutboxEmail.status == SENDING,
+        models.OutboxEmail.next_attempt_at <= now,
+    )
+    values = dict(
+        attempts=models.OutboxEmail.attempts + 1,
+        claimed_by=None,
+        last_error="Reserva vencida: el envío se cortó sin registrar el resultado",
+    )
+    failed = db.execute(
+        update(models.OutboxEmail)
+        .where(*expired, models.OutboxEmail.attempts + 1 >= OUTBOX_MAX_ATTEMPTS)
+        .values(status=FAILED, **values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if failed:
+        logger.error("%s correos descartados tras vencer su último intento", failed)
+    db.execute(
+        update(models.OutboxEmail)
+        .where(*expired)
+        .values(status=PENDING, next_attempt_at=now, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def claim_due(db: Session) -> list:
+    """Reserve a batch of due messages for this caller and return the rows it won.
+
+    Expired claims are first handed back as pending with one more attempt.
+    The UPDATE repeats the due condition, so when two senders pick the same
+    ids only the first one to write gets them; the other reads back only
+    what carries its own token.
+    """
+    now = datetime.utcnow()
+    _expire_claims(db, now)
+    due = (
+        models.OutboxEmail.status == PENDING,
+        models.OutboxEmail.next_attempt_at <= now,
+    )
+    ids = db.execute(
+        select(models.OutboxEmail.id)
+        .where(*due)
+        .order_by(models.OutboxEmail.next_attempt_at, models.OutboxEmail.id)
+        .limit(OUTBOX_BATCH_SIZE)
+    ).scalars().all()
+    if not ids:
+        return []
+    token = _claim_token()
+    result = db.execute(
+        update(models.OutboxEmail)
+        .where(models.OutboxEmail.id.in_(ids), *due)
+        .values(status=SENDING, claimed_by=token, next_attempt_at=now + OUTBOX_CLAIM_LEASE)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount == 0:
+        return []
+    return (
+        db.query(models.OutboxEmail)
+        .filter(models.OutboxEmail.claimed_by == token, models.OutboxEmail.status == SENDING)
+        .order_by(models.OutboxEmail.id)
+        .all()
+    )
+
+
+def _release(db: Session, mails):
+    """Hand back claimed rows that were not attempted, without counting an attempt."""
+    if mails:
+        db.execute(
+            update(models.OutboxEmail)
+            .where(
+                models.OutboxEmail.id.in_([mail.id for mail in mails]),
+                models.OutboxEmail.claimed_by == mails[0].claimed_by,
+                models.OutboxEmail.status == SENDING,
+            )
+            .values(status=PENDING, claimed_by=None, next_attempt_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+
+def send_due(db: Session, connection: SmtpConnection) -> bool:
+    """Claim and send one batch of due messages. True if there may be more due right away."""
+    claimed = claim_due(db)
+    for index, mail in enumerate(claimed):
+        try:
+            connection.send(_build_message(mail))
+        except SmtpUnavailable as exc:
+            # Con el servidor caído el resto del lote fallaría igual: se libera sin gastar intentos.
+            _record_failure(mail, exc)
+            db.commit()
+            _release(db, claimed[index + 1:])
+            return False
+        except smtplib.SMTPException as exc:
+            _record_failure(mail, exc)
+        else:
+            mail.attempts += 1
+            mail.status = SENT
+            mail.sent_at = datetime.utcnow()
+        # Un commit por correo: si el proceso se corta no se reenvía lo ya enviado.
+        db.commit()
+    return len(claimed) == OUTBOX_BATCH_SIZE
+
+
+def purge_sent(db: Session) -> int:
+    result = db.execute(
+        delete(models.OutboxEmail).where(
+            models.OutboxEmail.status == SENT,
+            models.OutboxEmail.sent_at < datetime.utcnow() - OUTBOX_RETENTION,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def run_sender():
+    logger.info("Iniciando envío de correos en cola")
+    connection = SmtpConnection()
+    while True:
+        _wakeup.clear()
+        more = False
+        db = SessionLocal()
+        try:
+            more = send_due(db, connection)
+            if not more:
+                purge_sent(db)
+        except Exception:
+            db.rollback()
+            logger.exception("Error enviando correos en cola")
+        finally:
+            db.close()
+        if more:
+            continue
+        connection.close_if_idle()
+        _wakeup.wait(OUTBOX_POLL_SECONDS)
+
+
+def start_outbox_sender() -> threading.Thread:
+    thread = threading.Thread(target=run_sender, name="email-outbox", daemon=True)
+    thread.start()
+    return thread
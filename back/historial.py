@@ -1,19 +1,25 @@
+import os
 from datetime import datetime
 from fastapi import Depends, HTTPException, status, APIRouter
 from sqlalchemy.orm import Session
 from typing import Annotated, Optional
 from dtos.historialDTO import HistoryResponseDTO
 import models
-from database import get_db
+import open_loans
+from database import SessionLocal, get_db
 from auth import get_current_user, get_user_name_by_id
+from item_export import EXPORT_BATCH_SIZE, iter_csv, write_xlsx
+from item_search import item_text_filter
+from item_service import ItemServiceError, apply_stock_change, apply_stock_changes
 import dtos.retiroDTO as retiroDTO
 import dtos.turnBackDTO as devolucionDTO
 import dtos.trasladoDTO as trasladoDTO
 from dtos.historialDTO import HistoryResponseWithDetailsDTO
-from sqlalchemy import case, func, or_
+from sqlalchemy import or_, select
 from fastapi import Query
 from math import ceil
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -43,6 +49,73 @@ def now():
 DEFAULT_PAGE_SIZE = 50
 MAX_PAGE_SIZE = 100
 
+CONSUMABLE_CATEGORY = "Materiales consumibles"
+
+
+def _month_range(month: Optional[int], year: int):
+    if month:
+        start = datetime(year, month, 1)
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    else:
+        start = datetime(year, 1, 1)
+        end = datetime(year + 1, 1, 1)
+    return start, end
+
+
+def _local_naive(value):
+    """History.date guarda la hora de Buenos Aires sin zona: un offset explícito se convierte."""
+    if value.tzinfo is not None:
+        value = value.astimezone(TIMEZONE)
+    return value.replace(tzinfo=None)
+
+
+def history_date_filters(month=None, year=None, from_date=None, to_date=None):
+    """Rangos semiabiertos [desde, hasta) sobre History.date, aptos para el índice."""
+    filters = []
+    if year:
+        start, end = _month_range(month, year)
+        filters += [models.History.date >= start, models.History.date < end]
+    if from_date:
+        filters.append(models.History.date >= _local_naive(from_date))
+    if to_date:
+        filters.append(models.History.date < _local_naive(to_date))
+    return filters
+
+
+def _history_filters(
+    item_name=None, item_id=None, user_name=None, person_who_took=None, place=None,
+    action=None, item_category=None, shed_id=None, month=None, year=None,
+    from_date=None, to_date=None,
+):
+    """Filtros del historial visible; suponen el join con items."""
+    filters = [
+        (models.History.hideFromHistorial.is_(False))
+        | (models.History.hideFromHistorial.is_(None))
+    ]
+    if item_name:
+        filters.append(item_text_filter(item_name, "name"))
+    if item_id is not None:
+        filters.append(models.History.itemId == item_id)
+    if user_name:
+        filters.append(models.History.userName.ilike(f"%{user_name}%"))
+    if place:
+        filters.append(models.History.place.ilike(f"%{place}%"))
+    if action:
+        filters.append(models.History.action == action)
+    if person_who_took:
+        filters.append(
+            or_(
+                models.History.personWhoTook.ilike(f"%{person_who_took}%"),
+                models.History.userName.ilike(f"%{person_who_took}%")
+            )
+        )
+    if item_category:
+        filters.append(models.Item.category.ilike(f"%{item_category}%"))
+    if shed_id:
+        filters.append(models.Item.shed_id == shed_id)
+    filters += history_date_filters(month, year, from_date, to_date)
+    return filters
+
 
 @router.get("/", response_model=dict)
 def read_history(
@@ -55,70 +128,34 @@ def read_history(
     action: Optional[str] = None,
     item_category: Optional[str] = None,
     shedId: Optional[int] = None,
-    month: Optional[int] = None,
-    year: Optional[int] = None,
+    month: Optional[int] = Query(None, ge=1, le=12),
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
     page: int = Query(1, ge=1),
     page_size: int = Query(DEFAULT_PAGE_SIZE, le=MAX_PAGE_SIZE)
 ):
     try:
-        original_name = case(
-            (models.Item.name.like("%__DELETED_%"), 
-             func.substr(models.Item.name, 1, func.instr(models.Item.name, "__DELETED_") - 1)),
-            else_=models.Item.name
-        ).label("itemName")
-
         query = (
             db.query(
                 models.History,
-                original_name,
+                models.Item.original_name.label("itemName"),
                 models.Item.category.label("category"),
                 models.Item.shed_id.label("shed_id"),
                 models.Shed.name.label("shedName")
             )
             .join(models.Item, models.History.itemId == models.Item.id)
             .join(models.Shed, models.Item.shed_id == models.Shed.id)
-            .filter(
-                (models.History.hideFromHistorial.is_(False))
-                | (models.History.hideFromHistorial.is_(None))
-            )
+            .filter(*_history_filters(
+                item_name, item_id, user_name, person_who_took, place, action,
+                item_category, shedId, month, year, from_date, to_date,
+            ))
         )
 
-        if item_name:
-            query = query.filter(
-                or_(
-                    models.Item.name.ilike(f"%{item_name}%"),
-                    original_name.ilike(f"%{item_name}%")
-                )
-            )
-        if item_id is not None:
-            query = query.filter(models.History.itemId == item_id)
-        if user_name:
-            query = query.filter(models.History.userName.ilike(f"%{user_name}%"))
-        if place:
-            query = query.filter(models.History.place.ilike(f"%{place}%"))
-        if action:
-            query = query.filter(models.History.action == action)
-        if person_who_took:
-            query = query.filter(
-                or_(
-                    models.History.personWhoTook.ilike(f"%{person_who_took}%"),
-                    models.History.userName.ilike(f"%{person_who_took}%")
-                )
-            )
-        if item_category:
-            query = query.filter(models.Item.category.ilike(f"%{item_category}%"))
-        if shedId:
-            query = query.filter(models.Item.shed_id == shedId)
-        if month and year:
-            query = query.filter(
-                func.strftime('%m', models.History.date) == f"{month:02d}",
-                func.strftime('%Y', models.History.date) == str(year)
-            )
-
         total_records = query.count()
         total_pages = ceil(total_records / page_size)
 
-        records = query.order_by(models.History.date.desc()) \
+        records = query.order_by(models.History.date.desc(), models.History.id.desc()) \
                       .offset((page - 1) * page_size) \
                       .limit(page_size) \
                       .all()
@@ -162,6 +199,123 @@ def read_history(
         )
 
 
+EXPORT_HEADERS = [
+    "fecha",
+    "accion",
+    "producto",
+    "categoria",
+    "deposito",
+    "cantidad",
+    "sin_devolver",
+    "usuario",
+    "persona",
+    "lugar",
+    "devuelto",
+    "fecha_devolucion",
+]
+EXPORT_WIDTHS = [18, 12, 32, 36, 22, 10, 12, 22, 22, 32, 10, 18]
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@router.get("/export")
+def export_history(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    format: str = Query("csv", pattern="^(xlsx|csv)$"),
+    item_name: Optional[str] = None,
+    item_id: Optional[int] = None,
+    user_name: Optional[str] = None,
+    person_who_took: Optional[str] = None,
+    place: Optional[str] = None,
+    action: Optional[str] = None,
+    item_category: Optional[str] = None,
+    shedId: Optional[int] = None,
+    month: Optional[int] = Query(None, ge=1, le=12),
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+):
+    """Historial completo con los filtros de ``GET /historical/``, sin conteo ni paginado."""
+    stmt = (
+        select(
+            models.History.date,
+            models.History.action,
+            models.Item.original_name,
+            models.Item.category,
+            models.Shed.name,
+            models.History.amountRetired,
+            models.History.amountNotReturned,
+            models.History.userName,
+            models.History.personWhoTook,
+            models.History.place,
+            models.History.turnback,
+            models.History.turnbackDate,
+        )
+        .join(models.Item, models.History.itemId == models.Item.id)
+        .join(models.Shed, models.Item.shed_id == models.Shed.id)
+        .where(*_history_filters(
+            item_name, item_id, user_name, person_who_took, place, action,
+            item_category, shedId, month, year, from_date, to_date,
+        ))
+        .order_by(models.History.date.desc(), models.History.id.desc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    filename = f"historial_{now():%Y-%m-%d}.{format}"
+
+    # La sesión vive lo que dure el archivo, no lo que dure la dependencia.
+    db = SessionLocal()
+    if format == "csv":
+        return StreamingResponse(
+            _stream_history_csv(db, stmt),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+    try:
+        path = write_xlsx(
+            _history_export_rows(db, stmt),
+            headers=EXPORT_HEADERS,
+            title="Historial",
+            widths=EXPORT_WIDTHS,
+        )
+    finally:
+        db.close()
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=filename,
+        background=BackgroundTask(os.remove, path),
+    )
+
+
+def _history_export_rows(db: Session, stmt, date_format=None):
+    """Plain value tuples in ``EXPORT_HEADERS`` order; dates as text if ``date_format``."""
+    for (date, action, item_name, category, shed_name, amount, not_returned,
+         user_name, person, place, turnback, turnback_date) in db.execute(stmt):
+        if date_format:
+            date = date.strftime(date_format) if date else ""
+            turnback_date = turnback_date.strftime(date_format) if turnback_date else ""
+        yield (
+            date,
+            action.value if action else "",
+            item_name,
+            category,
+            shed_name,
+            amount,
+            not_returned,
+            user_name,
+            person or user_name,
+            place,
+            "sí" if turnback else "no",
+            turnback_date,
+        )
+
+
+def _stream_history_csv(db: Session, stmt):
+    try:
+        yield from iter_csv(_history_export_rows(db, stmt, CSV_DATE_FORMAT), headers=EXPORT_HEADERS)
+    finally:
+        db.close()
+
+
 @router.get("/pending", response_model=dict)
 def read_pending_history(
     db: db_dependency,
@@ -173,7 +327,7 @@ def read_pending_history(
     try:
         query = db.query(
             models.History,
-            models.Item.name.label('itemName')
+            models.Item.original_name.label('itemName')
         ).join(
             models.Item,
             models.History.itemId == models.Item.id
@@ -260,31 +414,19 @@ def get_pending_places(
             detail="Item not found",
         )
 
-    pending_rows = (
-        db.query(models.History)
-        .filter(
-            models.History.itemId == item_id,
-            models.History.action == models.ActionEnum.retiro,
-            models.History.turnback == False,
-            models.History.amountNotReturned > 0,
-        )
-        .order_by(models.History.place.asc(), models.History.date.asc())
-        .all()
-    )
-
     by_place = {}
-    for history in pending_rows:
-        place = (history.place or "").strip()
+    for loan in open_loans.open_balances(db, item_id):
+        place = (loan.place or "").strip()
         if not place:
             continue
         entry = by_place.setdefault(
             place,
-            {"place": place, "pending_amount": 0, "persons": [], "date": history.date},
+            {"place": place, "pending_amount": 0, "persons": [], "date": loan.since},
         )
-        entry["pending_amount"] += int(history.amountNotReturned or 0)
-        if history.date and (entry["date"] is None or history.date < entry["date"]):
-            entry["date"] = history.date
-        person = (history.personWhoTook or history.userName or "").strip()
+        entry["pending_amount"] += int(loan.amount or 0)
+        if loan.since and (entry["date"] is None or loan.since < entry["date"]):
+            entry["date"] = loan.since
+        person = (loan.person or "").strip()
         if person and person not in entry["persons"]:
             entry["persons"].append(person)
 
@@ -318,25 +460,32 @@ def get_historial_places(
     return [{"place": place} for (place,) in rows if place]
 
 
+def _take_stock(db: Session, item_id: int, actual: int, total: int):
+    try:
+        apply_stock_change(db, item_id, -actual, -total)
+    except ItemServiceError:
+        raise HTTPException(400, "No hay suficiente stock")
+
+
 @router.post("/retirar")
 def retirar_item(dto: retiroDTO.RetiroDTO, db: db_dependency, 
                 current_user: Annotated[dict, Depends(get_current_user)]):
     user_id = current_user["user_id"]
     user_name = get_user_name_by_id(db, user_id)
 
+    if dto.amount <= 0:
+        raise HTTPException(400, "La cantidad debe ser mayor a 0")
+
     item = db.query(models.Item).filter(models.Item.id == dto.itemId).first()
     if not item:
         raise HTTPException(404, "Item not found")
     
-    if item.actualAmount < dto.amount:
-        raise HTTPException(400, "No hay suficiente stock")
-    
 
     quien_tomo = user_name  
     if dto.personWhoTook and dto.personWhoTook.strip():  
         quien_tomo = dto.personWhoTook.strip()
     
-    if item.category == "Materiales consumibles":
+    if item.category == CONSUMABLE_CATEGORY:
 
         history = models.History(
             itemId=dto.itemId,
@@ -351,15 +500,15 @@ def retirar_item(dto: retiroDTO.RetiroDTO, db: db_dependency,
             turnback=True,
             lastNotification=None
         )
-        item.actualAmount -= dto.amount
-        item.totalAmount -= dto.amount
+        _take_stock(db, item.id, dto.amount, dto.amount)
         
         db.add(history)
         db.commit()
         db.refresh(history)
         return history
     
-    item.actualAmount -= dto.amount
+    _take_stock(db, item.id, dto.amount, 0)
+    retiro_date = now()
 
     history = models.History(
     itemId=dto.itemId,
@@ -369,7 +518,7 @@ def retirar_item(dto: retiroDTO.RetiroDTO, db: db_dependency,
     personWhoTook=quien_tomo,  
     amountRetired=dto.amount,
     amountNotReturned=dto.amount,  
-    date=now(),
+    date=retiro_date,
     place=dto.place,
     turnback=False,
     lastNotification=None
@@ -377,10 +526,100 @@ def retirar_item(dto: retiroDTO.RetiroDTO, db: db_dependency,
     
 
     db.add(history)
+    open_loans.add_loan(db, dto.itemId, dto.place, quien_tomo, dto.amount, retiro_date)
     db.commit()
     db.refresh(history)
     return history
 
+@router.post("/retirar/lote")
+def retirar_items_lote(
+    dto: retiroDTO.RetiroLoteDTO,
+    db: db_dependency,
+    current_user: Annotated[dict, Depends(get_current_user)],
+):
+    """Despacho de varios ítems a una misma obra: todo o nada, un solo commit."""
+    place = (dto.place or "").strip()
+    if not place:
+        raise HTTPException(400, "El lugar es obligatorio")
+    if not dto.items:
+        raise HTTPException(400, "El despacho no tiene ítems")
+    invalid = [index for index, line in enumerate(dto.items, start=1) if line.amount <= 0]
+    if invalid:
+        raise HTTPException(
+            400,
+            f"La cantidad debe ser mayor a 0 (líneas {', '.join(map(str, invalid))})",
+        )
+
+    user_id = current_user["user_id"]
+    user_name = get_user_name_by_id(db, user_id)
+    quien_tomo = (dto.personWhoTook or "").strip() or user_name
+
+    requested = {}
+    for line in dto.items:
+        requested[line.itemId] = requested.get(line.itemId, 0) + line.amount
+
+    items = {
+        item.id: item
+        for item in db.query(models.Item).filter(models.Item.id.in_(list(requested))).all()
+    }
+    missing = [item_id for item_id in requested if item_id not in items]
+    if missing:
+        raise HTTPException(404, f"Items not found: {', '.join(map(str, missing))}")
+
+    short = [
+        items[item_id].name
+        for item_id, amount in requested.items()
+        if items[item_id].actualAmount < amount
+    ]
+    if short:
+        raise HTTPException(400, f"No hay suficiente stock de: {', '.join(short)}")
+
+    changes = {}
+    for item_id, amount in requested.items():
+        consumable = items[item_id].category == CONSUMABLE_CATEGORY
+        changes[item_id] = (-amount, -amount if consumable else 0)
+    try:
+        apply_stock_changes(db, changes)
+    except ItemServiceError:
+        db.rollback()
+        raise HTTPException(400, "No hay suficiente stock")
+
+    retiro_date = now()
+    histories = []
+    for line in dto.items:
+        consumable = items[line.itemId].category == CONSUMABLE_CATEGORY
+        histories.append(models.History(
+            itemId=line.itemId,
+            userId=user_id,
+            userName=user_name,
+            action=models.ActionEnum.retiro,
+            personWhoTook=quien_tomo,
+            amountRetired=line.amount,
+            amountNotReturned=None if consumable else line.amount,
+            date=retiro_date,
+            place=place,
+            turnback=consumable,
+            lastNotification=None,
+        ))
+    db.add_all(histories)
+
+    for item_id, amount in requested.items():
+        if items[item_id].category != CONSUMABLE_CATEGORY:
+            open_loans.add_loan(db, item_id, place, quien_tomo, amount, retiro_date)
+
+    db.flush()
+    history_ids = [history.id for history in histories]
+    db.commit()
+
+    return {
+        "history_ids": history_ids,
+        "items": [
+            {"itemId": line.itemId, "amount": line.amount, "historyId": history_id}
+            for line, history_id in zip(dto.items, history_ids)
+        ],
+    }
+
+
 @router.post("/devolver")
 def devolver_item(dto: devolucionDTO.DevolucionDTO, db: db_dependency, current_user: Annotated[dict, Depends(get_current_user)]):
     user_id = current_user["user_id"]
@@ -390,43 +629,22 @@ def devolver_item(dto: devolucionDTO.DevolucionDTO, db: db_dependency, current_u
     if not item:
         raise HTTPException(404, "Item not found")
 
-    pendientes_query = db.query(models.History).filter(
-        models.History.itemId == dto.itemId,
-        models.History.action == models.ActionEnum.retiro,
-        models.History.turnback == False
-    )
-    
-    if dto.place:
-        pendientes_query = pendientes_query.filter(
-            models.History.place == dto.place
-        )
-    
-    pendientes = pendientes_query.order_by(models.History.date.asc()).all()
+    if dto.amount <= 0:
+        raise HTTPException(400, "La cantidad debe ser mayor a 0")
 
-    total_pendiente = sum(p.amountNotReturned for p in pendientes)
+    total_pendiente = open_loans.total_pending(db, dto.itemId, dto.place)
     if dto.amount > total_pendiente:
         raise HTTPException(
             status_code=400,
             detail=f"No se pueden devolver {dto.amount} unidades. Solo {total_pendiente} están pendientes en este lugar."
         )
 
-    item.actualAmount += dto.amount
-    restante = dto.amount
-
-    for p in pendientes:
-        if restante <= 0:
-            break
-            
-        if restante >= p.amountNotReturned:
-            restante -= p.amountNotReturned
-            p.amountNotReturned = 0
-        else:
-            p.amountNotReturned -= restante
-            restante = 0
-
-        if p.amountNotReturned == 0:
-            p.turnback = True
-            p.turnbackDate = now()
+    apply_stock_change(db, item.id, dto.amount, 0)
+    if open_loans.return_fifo(db, dto.itemId, dto.place, dto.amount, now()):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Los pendientes no coinciden con el historial. Reconstruí el libro de préstamos.",
+        )
 
     quien_devuelve = dto.personWhoReturned.strip() if dto.personWhoReturned and dto.personWhoReturned.strip() else user_name
 
@@ -452,6 +670,96 @@ def devolver_item(dto: devolucionDTO.DevolucionDTO, db: db_dependency, current_u
     return history
 
 
+@router.post("/devolver/lote")
+def devolver_items_lote(
+    dto: devolucionDTO.DevolucionLoteDTO,
+    db: db_dependency,
+    current_user: Annotated[dict, Depends(get_current_user)],
+):
+    """Devolución de muchas líneas en una pasada y un solo commit.
+
+    Cada línea se informa por separado: una línea inválida no frena al resto.
+    """
+    if not dto.items:
+        raise HTTPException(400, "La devolución no tiene ítems")
+
+    user_id = current_user["user_id"]
+    user_name = get_user_name_by_id(db, user_id)
+    default_person = (dto.personWhoReturned or "").strip() or user_name
+
+    item_ids = {line.itemId for line in dto.items}
+    existing = {
+        item_id for (item_id,) in
+        db.query(models.Item.id).filter(models.Item.id.in_(list(item_ids))).all()
+    }
+    retiros = open_loans.OpenRetiros(db, existing)
+
+    when = now()
+    results = []
+    histories = []
+    stock = {}
+    released = {}
+    for index, line in enumerate(dto.items, start=1):
+        result = {"line": index, "itemId": line.itemId, "place": line.place, "amount": line.amount}
+        results.append(result)
+
+        if line.itemId not in existing:
+            result.update(ok=False, error="Item not found")
+            continue
+        if line.amount <= 0:
+            result.update(ok=False, error="La cantidad debe ser mayor a 0")
+            continue
+
+        allocation = retiros.plan(line.itemId, line.place, line.amount)
+        if allocation is None:
+            pending = retiros.pending(line.itemId, line.place)
+            result.update(
+                ok=False,
+                error=f"No se pueden devolver {line.amount} unidades. Solo {pending} están pendientes en este lugar.",
+            )
+            continue
+
+        try:
+            line_released = retiros.apply(db, line.itemId, allocation, when)
+        except open_loans.LoanConflictError:
+            result.update(ok=False, error="Los pendientes cambiaron mientras se procesaba. Reintentá la línea.")
+            continue
+
+        item_released = released.setdefault(line.itemId, {})
+        for key, taken in line_released.items():
+            item_released[key] = item_released.get(key, 0) + taken
+        actual, _ = stock.get(line.itemId, (0, 0))
+        stock[line.itemId] = (actual + line.amount, 0)
+
+        history = models.History(
+            itemId=line.itemId,
+            userId=user_id,
+            userName=user_name,
+            action=models.ActionEnum.devolucion,
+            amountRetired=line.amount,
+            date=when,
+            turnback=True,
+            turnbackDate=when,
+            place=line.place,
+            personWhoTook=(line.personWhoReturned or "").strip() or default_person,
+            lastNotification=None,
+        )
+        histories.append((result, history))
+        result["ok"] = True
+
+    apply_stock_changes(db, stock)
+    for item_id, item_released in released.items():
+        open_loans.release_loans(db, item_id, item_released)
+    db.add_all([history for _, history in histories])
+    db.flush()
+    for result, history in histories:
+        result["historyId"] = history.id
+    db.commit()
+
+    returned = sum(1 for result in results if result["ok"])
+    return {"returned": returned, "failed": len(results) - returned, "results": results}
+
+
 @router.post("/trasladar")
 def trasladar_item(
     dto: trasladoDTO.TrasladoDTO,
@@ -475,26 +783,13 @@ def trasladar_item(
     if not item:
         raise HTTPException(404, "Item not found")
 
-    if item.category == "Materiales consumibles":
+    if item.category == CONSUMABLE_CATEGORY:
         raise HTTPException(
             400,
             "Los materiales consumibles no se pueden trasladar entre obras",
         )
 
-    pendientes = (
-        db.query(models.History)
-        .filter(
-            models.History.itemId == dto.itemId,
-            models.History.action == models.ActionEnum.retiro,
-            models.History.turnback == False,
-            models.History.place == from_place,
-            models.History.amountNotReturned > 0,
-        )
-        .order_by(models.History.date.asc())
-        .all()
-    )
-
-    total_pendiente = sum(p.amountNotReturned or 0 for p in pendientes)
+    total_pendiente = open_loans.total_pending(db, dto.itemId, from_place)
     if dto.amount > total_pendiente:
         raise HTTPException(
             status_code=400,
@@ -504,19 +799,11 @@ def trasladar_item(
             ),
         )
 
-    restante = dto.amount
-    for p in pendientes:
-        if restante <= 0:
-            break
-        if restante >= p.amountNotReturned:
-            restante -= p.amountNotReturned
-            p.amountNotReturned = 0
-        else:
-            p.amountNotReturned -= restante
-            restante = 0
-        if p.amountNotReturned == 0:
-            p.turnback = True
-            p.turnbackDate = now()
+    if open_loans.return_fifo(db, dto.itemId, from_place, dto.amount, now()):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Los pendientes no coinciden con el historial. Reconstruí el libro de préstamos.",
+        )
 
     quien_mueve = (
         dto.personWhoMoved.strip()
@@ -539,6 +826,7 @@ def trasladar_item(
         hideFromHistorial=True,
     )
     db.add(nuevo_retiro)
+    open_loans.add_loan(db, dto.itemId, to_place, quien_mueve, dto.amount, nuevo_retiro.date)
 
     traslado = models.History(
         itemId=dto.itemId,
@@ -0,0 +1,239 @@
+"""``Idempotency-Key`` support for the endpoints that move stock.
+
+A client sends the same key on every retry of one operation. The first
+request runs and its response is stored; replays get the stored response
+back (``Idempotent-Replayed: true``) without touching stock again, and a
+duplicate that arrives while the original is still running waits for it
+instead of executing twice. Keys are scoped to the user and the route and
+expire after ``IDEMPOTENCY_TTL_HOURS``.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from jose import JWTError, jwt
+from sqlalchemy import delete, or_
+from sqlalchemy.exc import IntegrityError
+
+import models
+from auth import ALGORITHM, SECRET_KEY
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+# Un pedido en curso más viejo que esto se considera abandonado (proceso caído).
+PENDING_TIMEOUT = timedelta(minutes=5)
+MAX_KEY_LENGTH = 255
+PURGE_EVERY = 200
+
+IDEMPOTENT_ROUTES = (
+    ("POST", re.compile(r"^/historical/(retirar|devolver)(/lote)?/?$")),
+    ("POST", re.compile(r"^/historical/trasladar/?$")),
+    ("POST", re.compile(r"^/movements(/relocate)?/?$")),
+    ("PUT", re.compile(r"^/items/by-id/\d+/?$")),
+    ("PUT", re.compile(r"^/$")),
+)
+
+# Respuestas que no se guardan: el pedido no llegó a ejecutarse o falló
+# del lado del servidor, así que reintentar con la misma clave es válido.
+_NOT_STORED = {
+    status.HTTP_401_UNAUTHORIZED,
+    status.HTTP_403_FORBIDDEN,
+    status.HTTP_422_UNPROCESSABLE_ENTITY,
+}
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_claims = 0
+
+
+def _is_idempotent_route(method: str, path: str) -> bool:
+    return any(method == m and pattern.match(path) for m, pattern in IDEMPOTENT_ROUTES)
+
+
+def _user_scope(request):
+    auth = request.headers.get("authorization", "")
+    scheme, _, token = auth.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("user_id")
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def _should_store(status_code: int) -> bool:
+    return status_code < 500 and status_code not in _NOT_STORED
+
+
+def purge_expired_keys(db):
+    now = datetime.now()
+    result = db.execute(
+        delete(models.IdempotencyKey).where(or_(
+            models.IdempotencyKey.created_at < now - IDEMPOTENCY_TTL,
+            (models.IdempotencyKey.status_code.is_(None))
+            & (models.IdempotencyKey.created_at < now - PENDING_TIMEOUT),
+        ))
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _claim(key: str, request_hash: str):
+    """``("run", None)``, ``("replay", row)``, ``("mismatch", None)`` or ``("busy", None)``."""
+    global _claims
+    db = SessionLocal()
+    try:
+        _claims += 1
+        if _claims % PURGE_EVERY == 1:
+            purge_expired_keys(db)
+
+        row = db.get(models.IdempotencyKey, key)
+        if row is not None:
+            now = datetime.now()
+            expired = row.created_at < now - (
+                PENDING_TIMEOUT if row.status_code is None else IDEMPOTENCY_TTL
+            )
+            if not expired:
+                if row.request_hash != request_hash:
+                    return "mismatch", None
+                if row.status_code is None:
+                    return "busy", None
+                db.expunge(row)
+                return "replay", row
+            db.delete(row)
+            db.flush()
+
+        db.add(models.IdempotencyKey(
+            key=key,
+            request_hash=request_hash,
+            created_at=datetime.now(),
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otro proceso tomó la clave entre la lectura y el insert.
+            db.rollback()
+            return "busy", None
+        return "run", None
+    finally:
+        db.close()
+
+
+def _store(key: str, status_code: int, content_type, body: bytes):
+    db = SessionLocal()
+    try:
+        row = db.get(models.IdempotencyKey, key)
+        if row is None:
+            return
+        if _should_store(status_code):
+            row.status_code = status_code
+            row.content_type = content_type
+            row.body = body
+        else:
+            db.delete(row)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _release(key: str):
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.IdempotencyKey).where(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.status_code.is_(None),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _replay(row) -> Response:
+    return Response(
+        content=row.body or b"",
+        status_code=row.status_code,
+        media_type=row.content_type,
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+
+async def idempotency_middleware(request, call_next):
+    raw_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if raw_key is None or not _is_idempotent_route(request.method, request.url.path):
+        return await call_next(request)
+
+    raw_key = raw_key.strip()
+    if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": f"{IDEMPOTENCY_HEADER} inválida"},
+        )
+
+    user_id = _user_scope(request)
+    if user_id is None:
+        # Sin usuario no hay a quién atar la clave; la ruta responde el 401.
+        return await call_next(request)
+
+    key = _digest(user_id, request.method, request.url.path, raw_key)
+    request_hash = _digest(request.url.query, (await request.body()).hex())
+
+    # Un duplicado concurrente en este proceso espera al original.
+    while True:
+        with _inflight_lock:
+            running = _inflight.get(key)
+            if running is None:
+                done = _inflight[key] = threading.Event()
+                break
+        await run_in_threadpool(running.wait)
+
+    try:
+        outcome, row = await run_in_threadpool(_claim, key, request_hash)
+        if outcome == "replay":
+            return _replay(row)
+        if outcome == "mismatch":
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                content={"detail": f"La {IDEMPOTENCY_HEADER} ya se usó con otro pedido"},
+            )
+        if outcome == "busy":
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": "Hay un pedido con esta clave en curso"},
+                headers={"Retry-After": "1"},
+            )
+
+        try:
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        except BaseException:
+            await run_in_threadpool(_release, key)
+            raise
+
+        await run_in_threadpool(
+            _store, key, response.status_code, response.headers.get("content-type"), body
+        )
+        return Response(
+            content=body,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            media_type=response.media_type,
+        )
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        done.set()
@@ -0,0 +1,233 @@
+"""Background runner for bulk item imports.
+
+``POST /items/import`` spools the upload to disk and queues a job; a small
+thread pool runs the import and keeps state, progress and the per-row
+result in ``import_jobs``, where ``GET /items/import/{job_id}`` reads it.
+Finished jobs are kept for ``IMPORT_JOB_RETENTION_HOURS``.
+
+Each job records the process that runs it (``owner``), and a heartbeat thread
+in that process refreshes ``heartbeat_at`` while the job is queued or running.
+Only a job whose heartbeat went stale is taken as interrupted, so a restart
+of one worker never fails what a sibling process is still importing.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from item_import import import_items_from_excel
+from item_service import ItemServiceError
+
+logger = logging.getLogger(__name__)
+
+IMPORT_WORKERS = max(1, int(os.getenv("IMPORT_WORKERS", "2")))
+# Trabajos esperando o corriendo a la vez; más allá se rechaza el pedido.
+MAX_QUEUED_JOBS = max(1, int(os.getenv("IMPORT_MAX_QUEUED", "20")))
+IMPORT_JOB_RETENTION = timedelta(hours=int(os.getenv("IMPORT_JOB_RETENTION_HOURS", "72")))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+JOB_HEARTBEAT_SECONDS = 30
+# Sin latido durante este plazo el proceso dueño se dio por muerto.
+JOB_STALE_AFTER = timedelta(seconds=JOB_HEARTBEAT_SECONDS * 4)
+INTERRUPTED_DETAIL = "La carga se interrumpió porque se reinició el servidor"
+
+# Identifica a este proceso; el uuid distingue un pid reutilizado tras reiniciar.
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+
+
+def job_response(job: models.ImportJob) -> dict:
+    finished = job.status == DONE
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "detail": job.detail,
+        "progress": {"processed": job.processed_rows, "total": job.total_rows},
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result": {
+            "created": job.created,
+            "updated": job.updated,
+            "errors": json.loads(job.errors or "[]"),
+            "suggestions": json.loads(job.suggestions or "[]"),
+        } if finished else None,
+    }
+
+
+def get_job(db: Session, job_id: str, current_user: dict):
+    """The job if it exists and the user may see it (its owner or an admin)."""
+    job = db.get(models.ImportJob, job_id)
+    if job is None:
+        return None
+    if job.user_id != current_user["user_id"] and current_user.get("role") != "admin":
+        return None
+    return job
+
+
+def purge_expired_jobs(db: Session) -> int:
+    result = db.execute(
+        delete(models.ImportJob).where(
+            models.ImportJob.finished_at < datetime.utcnow() - IMPORT_JOB_RETENTION
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def fail_interrupted_jobs():
+    """Mark failed the active jobs whose owner stopped sending heartbeats."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        result = db.execute(
+            update(models.ImportJob)
+            .where(
+                models.ImportJob.status.in_(ACTIVE_STATUSES),
+                or_(
+                    models.ImportJob.heartbeat_at.is_(None),
+                    models.ImportJob.heartbeat_at < now - JOB_STALE_AFTER,
+                ),
+            )
+            .values(status=FAILED, detail=INTERRUPTED_DETAIL, finished_at=now)
+        )
+        db.commit()
+        if result.rowcount:
+            logger.warning("%s cargas masivas interrumpidas marcadas como fallidas", result.rowcount)
+        purge_expired_jobs(db)
+    finally:
+        db.close()
+
+
+def _beat():
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(models.ImportJob)
+            .where(
+                models.ImportJob.owner == OWNER,
+                models.ImportJob.status.in_(ACTIVE_STATUSES),
+            )
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_heartbeat():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            _beat()
+            fail_interrupted_jobs()
+        except Exception:
+            logger.exception("Error actualizando el estado de las cargas masivas")
+
+
+def start_job_heartbeat() -> threading.Thread:
+    thread = threading.Thread(target=run_heartbeat, name="import-heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+def submit_import(db: Session, path: str, filename, current_user: dict) -> models.ImportJob:
+    """Queue the import of the spooled file at ``path``; the job deletes it when done."""
+    purge_expired_jobs(db)
+    active = (
+        db.query(models.ImportJob)
+        .filter(models.ImportJob.status.in_(ACTIVE_STATUSES))
+        .count()
+    )
+    if active >= MAX_QUEUED_JOBS:
+        raise ItemServiceError("Hay demasiadas cargas en curso. Probá de nuevo en unos minutos.", 429)
+
+    job = models.ImportJob(
+        id=uuid.uuid4().hex,
+        user_id=current_user["user_id"],
+        filename=filename,
+        status=PENDING,
+        owner=OWNER,
+        created_at=datetime.utcnow(),
+        heartbeat_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    _executor.submit(_run_job, job.id, path, dict(current_user))
+    return job
+
+
+def _update_job(job_id: str, **values) -> bool:
+    """Apply ``values`` while the job is still active and ours; a final state is never overwritten."""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(models.ImportJob)
+            .where(
+                models.ImportJob.id == job_id,
+                models.ImportJob.owner == OWNER,
+                models.ImportJob.status.in_(ACTIVE_STATUSES),
+            )
+            .values(heartbeat_at=datetime.utcnow(), **values)
+        )
+        db.commit()
+    finally:
+        db.close()
+    if result.rowcount == 0:
+        logger.warning("La carga %s ya no está activa; no se actualiza (%s)", job_id, ", ".join(values))
+        return False
+    return True
+
+
+def _run_job(job_id: str, path: str, current_user: dict):
+    if not _update_job(job_id, status=RUNNING, started_at=datetime.utcnow()):
+        os.remove(path)
+        return
+    db = SessionLocal()
+    try:
+        def progress(processed, total):
+            _update_job(job_id, processed_rows=processed, total_rows=total)
+
+        result = import_items_from_excel(db, path, current_user, progress)
+        _update_job(
+            job_id,
+            status=DONE,
+            created=result["created"],
+            updated=result["updated"],
+            errors=json.dumps(result["errors"], ensure_ascii=False),
+            suggestions=json.dumps(result["suggestions"], ensure_ascii=False),
+            finished_at=datetime.utcnow(),
+        )
+    except (ItemServiceError, ValueError) as exc:
+        db.rollback()
+        message = exc.message if isinstance(exc, ItemServiceError) else str(exc)
+        _update_job(job_id, status=FAILED, detail=message, finished_at=datetime.utcnow())
+    except Exception:
+        db.rollback()
+        logger.exception("Error en la carga masiva %s", job_id)
+        _update_job(
+            job_id,
+            status=FAILED,
+            detail="Error inesperado al procesar el archivo",
+            finished_at=datetime.utcnow(),
+        )
+    finally:
+        db.close()
+        os.remove(path)
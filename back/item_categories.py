@@ -1,4 +1,5 @@
 import unicodedata
+from functools import lru_cache
 
 ITEM_CATEGORIES = [
     {"value": "Materiales consumibles", "label": "Materiales consumibles"},
@@ -20,6 +21,7 @@ ITEM_CATEGORIES = [
 ]
 
 
+@lru_cache(maxsize=4096)
 def normalize_lookup(value: str) -> str:
     if value is None:
         return ""
@@ -30,12 +32,14 @@ def normalize_lookup(value: str) -> str:
     return " ".join(text.split())
 
 
+_CATEGORY_LOOKUP = {}
+for _category in ITEM_CATEGORIES:
+    _CATEGORY_LOOKUP[normalize_lookup(_category["value"])] = _category["value"]
+    _CATEGORY_LOOKUP[normalize_lookup(_category["label"])] = _category["value"]
+
+
 def canonical_category(raw: str):
     key = normalize_lookup(raw)
     if not key:
         return None
-    mapping = {}
-    for category in ITEM_CATEGORIES:
-        mapping[normalize_lookup(category["value"])] = category["value"]
-        mapping[normalize_lookup(category["label"])] = category["value"]
-    return mapping.get(key)
+    return _CATEGORY_LOOKUP.get(key)
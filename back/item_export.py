@@ -0,0 +1,101 @@
+"""Stock export in the column layout of the bulk import template.
+
+Rows are read with ``yield_per`` and written as they arrive, so memory stays
+flat whatever the size of the catalog: CSV goes straight to the response and
+.xlsx is built in openpyxl write-only mode in a temporary file. Either file
+can be loaded back with ``POST /items/import``. The writers take other
+headers too: the history export uses them.
+"""
+import csv
+import os
+import tempfile
+from io import StringIO
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+from item_import import (
+    TEMPLATE_HEADER_FILL,
+    TEMPLATE_HEADER_FONT,
+    TEMPLATE_HEADERS,
+    TEMPLATE_WIDTHS,
+)
+
+EXPORT_BATCH_SIZE = 1000
+# Punto y coma: es lo que espera Excel en configuración regional en español.
+CSV_EXPORT_DELIMITER = ";"
+
+
+def export_statement(filters, order_by, include_empty: bool = False):
+    """Active rows as template columns; without stock only if ``include_empty``.
+
+    A row with quantity 0 cannot be imported, so by default it is left out.
+    """
+    stock = func.coalesce(models.Item.totalAmount, 0)
+    stmt = (
+        select(
+            models.Item.name,
+            models.Item.description,
+            stock,
+            models.Item.category,
+            models.Shed.name,
+            models.Zone.name,
+        )
+        .outerjoin(models.Shed, models.Item.shed_id == models.Shed.id)
+        .outerjoin(models.Zone, models.Item.zone_id == models.Zone.id)
+        .where(*filters)
+    )
+    if not include_empty:
+        stmt = stmt.where(stock > 0)
+    return stmt.order_by(*order_by).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+def export_rows(db: Session, stmt):
+    """Values in ``TEMPLATE_HEADERS`` order; ``comprado_por`` is not stored, so it goes empty."""
+    for name, description, quantity, category, shed, zone in db.execute(stmt):
+        yield (name, description or "", quantity, category, shed or "", zone or "", "")
+
+
+def iter_csv(rows, headers=TEMPLATE_HEADERS):
+    """CSV text in blocks of ``EXPORT_BATCH_SIZE`` rows, with a BOM so Excel reads it as UTF-8."""
+    buffer = StringIO()
+    writer = csv.writer(buffer, delimiter=CSV_EXPORT_DELIMITER)
+    buffer.write("\ufeff")
+    writer.writerow(headers)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(rows, headers=TEMPLATE_HEADERS, title="Productos", widths=TEMPLATE_WIDTHS) -> str:
+    """Write the rows to a temporary .xlsx the caller deletes; returns its path."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for index, width in enumerate(widths, start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+    header = []
+    for name in headers:
+        cell = WriteOnlyCell(sheet, name)
+        cell.fill = TEMPLATE_HEADER_FILL
+        cell.font = TEMPLATE_HEADER_FONT
+        header.append(cell)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+
+    output = tempfile.NamedTemporaryFile(prefix="export-", suffix=".xlsx", delete=False)
+    output.close()
+    try:
+        workbook.save(output.name)
+    except BaseException:
+        os.unlink(output.name)
+        raise
+    return output.name
@@ -1,23 +1,24 @@
+import codecs
+import csv
+import os
+import tempfile
 from io import BytesIO
 from datetime import datetime
 
 import pytz
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.datavalidation import DataValidation
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
 import models
 from auth import get_user_name_by_id
 from item_categories import ITEM_CATEGORIES, canonical_category, normalize_lookup
-from item_service import (
-    ItemServiceError,
-    adjust_item_stock,
-    create_item,
-    find_item_by_name_and_zone,
-    normalize_item_name,
-)
+from item_suggest import TrigramIndex, name_index, normalize_name
+from item_service import ItemServiceError, apply_stock_changes, normalize_item_name
 
 TIMEZONE = pytz.timezone("America/Argentina/Buenos_Aires")
 
@@ -33,6 +34,9 @@ TEMPLATE_HEADERS = [
     "zona",
     "comprado_por",
 ]
+TEMPLATE_WIDTHS = [22, 32, 12, 42, 28, 24, 36]
+TEMPLATE_HEADER_FILL = PatternFill("solid", fgColor="228BE6")
+TEMPLATE_HEADER_FONT = Font(bold=True, color="FFFFFF")
 
 HEADER_ALIASES = {
     "nombre": "nombre",
@@ -54,6 +58,17 @@ HEADER_ALIASES = {
     "proveedor": "comprado_por",
 }
 
+# Tope del archivo subido; se copia a disco de a bloques, nunca entero en memoria.
+MAX_UPLOAD_BYTES = int(os.getenv("IMPORT_MAX_UPLOAD_MB", "20")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Filas que se escriben por transacción, y valores por cláusula IN al precargar.
+IMPORT_CHUNK_SIZE = 500
+IN_CHUNK_SIZE = 500
+
+SUGGESTION_MIN_SCORE = 0.45
+MAX_SUGGESTIONS = 3
+
 EXAMPLE_ROW = {
     "nombre": "Martillo",
     "descripcion": "Martillo de uña",
@@ -80,29 +95,22 @@ def _is_empty_row(row_data: dict) -> bool:
     )
 
 
-def record_carga(db: Session, item, quantity: int, current_user: dict, person_who_brought: str, place: str):
-    user_id = current_user["user_id"]
-    try:
-        user_name = get_user_name_by_id(db, user_id)
-    except Exception:
-        user_name = current_user.get("username") or "Usuario"
-    responsable = (person_who_brought or "").strip() or user_name
-    history = models.History(
-        itemId=item.id,
-        userId=user_id,
-        userName=user_name,
-        action=models.ActionEnum.carga,
-        personWhoTook=responsable,
-        amountRetired=quantity,
-        amountNotReturned=None,
-        date=datetime.now(TIMEZONE),
-        place=place,
-        turnback=True,
-        hideFromHistorial=False,
+def _similar_names(name: str, indexes=(name_index,)):
+    """Existing names that look like a typo of ``name`` (never the same name)."""
+    normalized = normalize_name(name)
+    names = []
+    matches = sorted(
+        (match for index in indexes
+         for match in index.search(name, limit=10, min_score=SUGGESTION_MIN_SCORE)),
+        key=lambda match: -match[2],
     )
-    db.add(history)
-    db.commit()
-    return history
+    for _, candidate, _ in matches:
+        if normalize_name(candidate) == normalized or candidate in names:
+            continue
+        names.append(candidate)
+        if len(names) == MAX_SUGGESTIONS:
+            break
+    return names
 
 
 def parse_quantity(raw):
@@ -145,29 +153,11 @@ def _map_headers(header_row):
     return mapping
 
 
-def _find_shed(db: Session, name: str):
-    sheds = db.query(models.Shed).all()
-    matches = [s for s in sheds if normalize_lookup(s.name) == normalize_lookup(name)]
-    if not matches:
-        return None
-    return matches[0]
-
-
-def _find_zone(db: Session, shed_id: int, name: str):
-    zones = db.query(models.Zone).filter(models.Zone.shed_id == shed_id).all()
-    matches = [z for z in zones if normalize_lookup(z.name) == normalize_lookup(name)]
-    if not matches:
-        return None
-    return matches[0]
-
-
 def build_import_template() -> bytes:
     wb = Workbook()
     products = wb.active
     products.title = "Productos"
 
-    header_fill = PatternFill("solid", fgColor="228BE6")
-    header_font = Font(bold=True, color="FFFFFF")
     thin = Border(
         left=Side(style="thin", color="DEE2E6"),
         right=Side(style="thin", color="DEE2E6"),
@@ -177,8 +167,8 @@ def build_import_template() -> bytes:
 
     for col, header in enumerate(TEMPLATE_HEADERS, start=1):
         cell = products.cell(1, col, header)
-        cell.fill = header_fill
-        cell.font = header_font
+        cell.fill = TEMPLATE_HEADER_FILL
+        cell.font = TEMPLATE_HEADER_FONT
         cell.alignment = Alignment(horizontal="center")
         cell.border = thin
 
@@ -186,8 +176,7 @@ def build_import_template() -> bytes:
         cell = products.cell(2, col, EXAMPLE_ROW[header])
         cell.border = thin
 
-    widths = [22, 32, 12, 42, 28, 24, 36]
-    for index, width in enumerate(widths, start=1):
+    for index, width in enumerate(TEMPLATE_WIDTHS, start=1):
         products.column_dimensions[get_column_letter(index)].width = width
 
     categories_sheet = wb.create_sheet("Categorias")
@@ -227,7 +216,7 @@ def build_import_template() -> bytes:
         "9. El nombre no distingue mayúsculas: MARTILLO y martillo son el mismo producto.",
         "10. Las filas con error no impiden que se carguen las demás. El resultado indica el número de fila.",
         "11. Cada carga queda en el Historial: el usuario logueado realiza la carga y comprado_por figura como responsable.",
-        "12. Guardá el archivo como .xlsx (Excel). No uses CSV ni .xls.",
+        "12. Guardá el archivo como .xlsx (Excel) o CSV (separado por coma, punto y coma o tabulación). No uses .xls.",
     ]
     title_font = Font(bold=True, size=14, color="228BE6")
     for index, line in enumerate(lines, start=1):
@@ -242,23 +231,223 @@ def build_import_template() -> bytes:
     return buffer.getvalue()
 
 
-def import_items_from_excel(db: Session, file_bytes: bytes, current_user: dict) -> dict:
+async def spool_upload(upload, suffix: str = "", max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Copy an upload to a temporary file, a chunk at a time. The caller deletes it."""
+    limit_message = f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB"
+    if upload.size is not None and upload.size > max_bytes:
+        raise ItemServiceError(limit_message, 413)
+
+    spooled = tempfile.NamedTemporaryFile(prefix="import-", suffix=suffix, delete=False)
+    size = 0
     try:
-        workbook = load_workbook(BytesIO(file_bytes), data_only=True)
+        with spooled:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ItemServiceError(limit_message, 413)
+                spooled.write(chunk)
+        if size == 0:
+            raise ItemServiceError("El archivo está vacío", 400)
+    except BaseException:
+        os.unlink(spooled.name)
+        raise
+    return spooled.name
+
+
+# Extensiones que se leen como texto delimitado en vez de Excel.
+CSV_EXTENSIONS = (".csv", ".tsv", ".txt")
+CSV_DELIMITERS = (";", ",", "\t", "|")
+# UTF-8 primero; si no decodifica, las exportaciones del sistema contable (Windows/Latin-1).
+CSV_ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+
+
+def is_csv_file(filename) -> bool:
+    return (filename or "").lower().endswith(CSV_EXTENSIONS)
+
+
+def _detect_encoding(path: str) -> str:
+    for encoding in CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, "rb") as raw:
+                while chunk := raw.read(UPLOAD_CHUNK_SIZE):
+                    decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return CSV_ENCODINGS[-1]
+
+
+def _detect_delimiter(header_line: str) -> str:
+    """The separator that splits the header line into the most columns."""
+    return max(CSV_DELIMITERS, key=header_line.count)
+
+
+def _csv_rows(path: str):
+    """Rows of a CSV/TSV file as value lists, streamed with the stdlib reader."""
+    with open(path, newline="", encoding=_detect_encoding(path)) as text:
+        delimiter = _detect_delimiter(text.readline())
+        text.seek(0)
+        try:
+            yield from csv.reader(text, delimiter=delimiter)
+        except csv.Error:
+            raise ItemServiceError("El archivo no es un CSV válido", 400)
+
+
+def _source_rows(source):
+    """Rows of an uploaded file: CSV/TSV by its extension, .xlsx otherwise."""
+    if isinstance(source, str) and is_csv_file(source):
+        return _csv_rows(source)
+    return _sheet_rows(source)
+
+
+def _sheet_rows(source):
+    """Rows of the first sheet as value tuples, streamed (read-only mode)."""
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True)
     except Exception:
         raise ItemServiceError("El archivo no es un Excel válido (.xlsx)", 400)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        # En modo read-only el libro mantiene el archivo abierto.
+        workbook.close()
+
+
+VALIDATION_HEADER = "resultado"
+_ERROR_FILL = PatternFill("solid", fgColor="FFE3E3")
+_OK_FILL = PatternFill("solid", fgColor="EBFBEE")
+
+
+def _row_notes(db: Session, parsed, errors) -> dict:
+    """Validation result per Excel row: ``{row: (ok, message)}``. Writes nothing."""
+    plan = ImportPlan(db, parsed)
+    notes = {error["row"]: (False, error["message"]) for error in errors + plan.errors}
+    for op in plan.operations:
+        if op["create"]:
+            message = "OK: se crea el producto"
+        elif op["quantity"] > 0:
+            message = "OK: se suma al stock existente"
+        else:
+            message = "OK: se resta del stock existente"
+        if op["similar"]:
+            message += f". ¿Quisiste decir {', '.join(op['similar'])}?"
+        notes[op["row"]] = (True, message)
+    return notes
+
+
+def validate_excel(db: Session, source: str):
+    """Check every row of an .xlsx or CSV file without importing it.
+
+    Returns ``(path, summary)``: a copy of the sheet with the result of each
+    row in a first ``resultado`` column (written in write-only mode to a
+    temporary file the caller deletes) and the row and error counts.
+    """
+    rows = _source_rows(source)
+    try:
+        header = next(rows, None)
+        if header is None:
+            raise ItemServiceError("El archivo está vacío", 400)
+        parsed, errors = _read_rows(rows, _map_headers(header))
+    finally:
+        rows.close()
+    notes = _row_notes(db, parsed, errors)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Productos")
+    sheet.column_dimensions["A"].width = 60
+    title = WriteOnlyCell(sheet, VALIDATION_HEADER)
+    title.font = Font(bold=True)
+    rows = _source_rows(source)
+    try:
+        sheet.append([title, *next(rows)])
+        for excel_row, raw_row in enumerate(rows, start=2):
+            note = notes.get(excel_row)
+            cell = WriteOnlyCell(sheet, note[1] if note else None)
+            if note:
+                cell.fill = _OK_FILL if note[0] else _ERROR_FILL
+            sheet.append([cell, *raw_row])
+    finally:
+        rows.close()
+
+    output = tempfile.NamedTemporaryFile(prefix="import-check-", suffix=".xlsx", delete=False)
+    output.close()
+    try:
+        workbook.save(output.name)
+    except BaseException:
+        os.unlink(output.name)
+        raise
+    failed = sum(1 for ok, _ in notes.values() if not ok)
+    return output.name, {"rows": len(notes), "errors": failed}
 
-    sheet = workbook.active
-    rows = list(sheet.iter_rows(values_only=True))
-    if not rows:
-        raise ItemServiceError("El archivo está vacío", 400)
 
-    header_map = _map_headers(rows[0])
-    created = 0
-    updated = 0
-    errors = []
+def check_excel_header(source):
+    """Fail fast (before queueing the import) on a file that is not a usable sheet."""
+    rows = _source_rows(source)
+    try:
+        header = next(rows, None)
+        if header is None:
+            raise ItemServiceError("El archivo está vacío", 400)
+        _map_headers(header)
+    finally:
+        rows.close()
+
+
+def import_items_from_excel(db: Session, source, current_user: dict, progress=None) -> dict:
+    """Import the rows of an .xlsx file (path or binary file object) or a CSV/TSV path.
 
-    for excel_row, raw_row in enumerate(rows[1:], start=2):
+    ``progress(processed, total)``, if given, is called once the rows are
+    validated and after every chunk written.
+    """
+    rows = _source_rows(source)
+    try:
+        return _import_rows(db, rows, current_user, progress)
+    finally:
+        rows.close()
+
+
+def _parse_row(row_data: dict) -> dict:
+    name = str(row_data.get("nombre") or "").strip()
+    if not name:
+        raise ValueError("El nombre es obligatorio")
+
+    category_raw = str(row_data.get("categoria") or "").strip()
+    category = canonical_category(category_raw)
+    if not category:
+        raise ValueError("La categoría no es válida")
+
+    deposito = str(row_data.get("deposito") or "").strip()
+    if not deposito:
+        raise ValueError("El depósito es obligatorio")
+
+    zona_name = str(row_data.get("zona") or "").strip()
+    if not zona_name:
+        raise ValueError("La zona es obligatoria")
+
+    quantity = parse_quantity(row_data.get("cantidad"))
+    if quantity == 0:
+        raise ValueError("La cantidad no puede ser 0")
+
+    return {
+        "name": normalize_item_name(name),
+        "category": category,
+        "deposito": deposito,
+        "zona": zona_name,
+        "quantity": quantity,
+        "description": str(row_data.get("descripcion") or "").strip(),
+        "comprado_por": str(row_data.get("comprado_por") or "").strip(),
+    }
+
+
+def _read_rows(rows, header_map):
+    """``(parsed, errors)``: validated rows as ``(excel_row, dict)`` and row errors."""
+    parsed = []
+    errors = []
+    for excel_row, raw_row in enumerate(rows, start=2):
         row_data = {}
         for column in ALL_COLUMNS:
             col_index = header_map.get(column)
@@ -275,72 +464,306 @@ def import_items_from_excel(db: Session, file_bytes: bytes, current_user: dict)
             continue
 
         try:
-            name = str(row_data.get("nombre") or "").strip()
-            if not name:
-                raise ValueError("El nombre es obligatorio")
-
-            category_raw = str(row_data.get("categoria") or "").strip()
-            category = canonical_category(category_raw)
-            if not category:
-                raise ValueError("La categoría no es válida")
-
-            deposito = str(row_data.get("deposito") or "").strip()
-            if not deposito:
-                raise ValueError("El depósito es obligatorio")
-
-            zona_name = str(row_data.get("zona") or "").strip()
-            if not zona_name:
-                raise ValueError("La zona es obligatoria")
-
-            quantity = parse_quantity(row_data.get("cantidad"))
-            if quantity == 0:
-                raise ValueError("La cantidad no puede ser 0")
-
-            shed = _find_shed(db, deposito)
+            parsed.append((excel_row, _parse_row(row_data)))
+        except ValueError as exc:
+            errors.append({"row": excel_row, "message": str(exc)})
+    return parsed, errors
+
+
+def _in_chunks(values, size: int = IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _item_key(name: str):
+    return (name or "").strip().lower()
+
+
+class ImportPlan:
+    """Every row of an import checked against the database in memory.
+
+    Sheds, zones, the items of the zones the file mentions and the lineages
+    of the products it creates are loaded once; each row then sees the
+    stock left by the rows before it, as if they had already been applied.
+    ``operations`` holds the accepted rows in file order.
+    """
+
+    def __init__(self, db: Session, parsed):
+        self.operations = []
+        self.errors = []
+        # Nombres creados por filas anteriores del archivo, para las sugerencias.
+        self._new_names = TrigramIndex()
+        self._sheds = {}
+        for shed in db.query(models.Shed).order_by(models.Shed.id):
+            self._sheds.setdefault(normalize_lookup(shed.name), shed)
+        self._zones = {}
+        for zone in db.query(models.Zone).order_by(models.Zone.id):
+            self._zones.setdefault((zone.shed_id, normalize_lookup(zone.name)), zone)
+
+        located = []
+        for excel_row, row in parsed:
+            shed = self._sheds.get(normalize_lookup(row["deposito"]))
             if not shed:
-                raise ValueError(f"Depósito '{deposito}' no encontrado")
-
-            zone = _find_zone(db, shed.id, zona_name)
+                self._error(excel_row, f"Depósito '{row['deposito']}' no encontrado")
+                continue
+            zone = self._zones.get((shed.id, normalize_lookup(row["zona"])))
             if not zone:
+                self._error(excel_row, f"Zona '{row['zona']}' no existe en depósito '{shed.name}'")
+                continue
+            located.append((excel_row, row, shed, zone))
+
+        self._items = self._load_items(db, {zone.id for _, _, _, zone in located})
+        for excel_row, row, shed, zone in located:
+            try:
+                self._plan_row(excel_row, row, shed, zone)
+            except ValueError as exc:
+                self._error(excel_row, str(exc))
+        self._load_lineages(db)
+
+    def _error(self, excel_row: int, message: str):
+        self.errors.append({"row": excel_row, "message": message})
+
+    @staticmethod
+    def _load_items(db: Session, zone_ids):
+        items = {}
+        for chunk in _in_chunks(zone_ids):
+            rows = (
+                db.query(
+                    models.Item.id, models.Item.name, models.Item.category, models.Item.status,
+                    models.Item.actualAmount, models.Item.totalAmount, models.Item.zone_id,
+                )
+                .filter(models.Item.zone_id.in_(chunk), models.Item.is_deleted.is_(False))
+                .order_by(models.Item.id)
+            )
+            for row in rows:
+                entry = dict(row._mapping)
+                entry["totalAmount"] = entry["totalAmount"] or 0
+                items.setdefault((row.zone_id, _item_key(row.name)), entry)
+        return items
+
+    def _plan_row(self, excel_row: int, row: dict, shed, zone):
+        quantity = row["quantity"]
+        place = f"{shed.name} / {zone.name}"
+        key = (zone.id, _item_key(row["name"]))
+        entry = self._items.get(key)
+        operation = {
+            "row": excel_row,
+            "quantity": quantity,
+            "place": place,
+            "comprado_por": row["comprado_por"],
+            "create": False,
+            "similar": [],
+        }
+
+        if entry and entry["status"] == 1:
+            if normalize_lookup(entry["category"]) != normalize_lookup(row["category"]):
                 raise ValueError(
-                    f"Zona '{zona_name}' no existe en depósito '{shed.name}'"
+                    "Ya existe un producto con ese nombre en la zona pero con otra categoría"
                 )
+            if entry["actualAmount"] + quantity < 0 or entry["totalAmount"] + quantity < 0:
+                raise ValueError("No hay suficiente stock para realizar esta operación")
+        else:
+            if quantity <= 0:
+                raise ValueError("Para crear un producto la cantidad debe ser mayor a 0")
+            if entry:
+                raise ValueError("Un elemento con el mismo nombre ya existe en esa zona.")
+            entry = self._items[key] = {
+                "id": None,
+                "name": row["name"],
+                "category": row["category"],
+                "description": row["description"],
+                "status": 1,
+                "actualAmount": 0,
+                "totalAmount": 0,
+                "zone_id": zone.id,
+                "shed_id": shed.id,
+                # Linaje de otra fila del producto que ya está en la base.
+                "known_lineage": None,
+                "lineage_id": None,
+            }
+            operation["create"] = True
+            operation["similar"] = _similar_names(row["name"], (name_index, self._new_names))
+            self._new_names.add(len(self.operations), row["name"])
+
+        entry["actualAmount"] += quantity
+        entry["totalAmount"] += quantity
+        operation["entry"] = entry
+        self.operations.append(operation)
+
+    def _load_lineages(self, db: Session):
+        created = [op["entry"] for op in self.operations if op["create"]]
+        lineages = {}
+        for chunk in _in_chunks({entry["name"] for entry in created}):
+            rows = (
+                db.query(models.Item.original_name, models.Item.category, models.Item.lineage_id)
+                .filter(models.Item.original_name.in_(chunk), models.Item.lineage_id.isnot(None))
+                .order_by(models.Item.id)
+            )
+            for row in rows:
+                lineages.setdefault((row.original_name, row.category), row.lineage_id)
+        for entry in created:
+            entry["known_lineage"] = lineages.get((entry["name"], entry["category"]))
+
+
+def _insert_items(db: Session, operations, lineages: dict):
+    """Insert the items ``operations`` create, in at most two bulk statements.
+
+    A product that is new to the database takes the id of its first row as
+    its lineage; the rest of its rows are inserted after, with that id.
+    """
+    pending = [op for op in operations if op["create"]]
+    while pending:
+        batch, later, first_rows = [], [], set()
+        for op in pending:
+            entry = op["entry"]
+            product = (entry["name"], entry["category"])
+            lineage = entry["known_lineage"] or lineages.get(product)
+            if lineage is None and product in first_rows:
+                later.append(op)
+                continue
+            first_rows.add(product)
+            entry["lineage_id"] = lineage
+            batch.append(op)
+
+        # En la conexión: el insert masivo del ORM con RETURNING va fila por fila.
+        inserted = db.connection().execute(
+            insert(models.Item).returning(models.Item.id, models.Item.zone_id, models.Item.name),
+            [
+                {
+                    "name": op["entry"]["name"],
+                    "original_name": op["entry"]["name"],
+                    "lineage_id": op["entry"]["lineage_id"],
+                    "description": op["entry"]["description"],
+                    "category": op["entry"]["category"],
+                    "shed_id": op["entry"]["shed_id"],
+                    "zone_id": op["entry"]["zone_id"],
+                    "totalAmount": op["quantity"],
+                    "actualAmount": op["quantity"],
+                    "is_available": True,
+                    "status": 1,
+                    "is_deleted": False,
+                }
+                for op in batch
+            ],
+        ).all()
+        ids = {(row.zone_id, row.name): row.id for row in inserted}
+        new_products = []
+        for op in batch:
+            entry = op["entry"]
+            entry["id"] = ids[(entry["zone_id"], entry["name"])]
+            if entry["lineage_id"] is None:
+                entry["lineage_id"] = entry["id"]
+                new_products.append(entry["id"])
+            lineages.setdefault((entry["name"], entry["category"]), entry["lineage_id"])
+        # En SQLite ya lo hizo el trigger; en otras bases es la única asignación.
+        for chunk in _in_chunks(new_products):
+            db.connection().execute(
+                update(models.Item)
+                .where(models.Item.id.in_(chunk), models.Item.lineage_id.is_(None))
+                .values(lineage_id=models.Item.id)
+            )
+        pending = later
+
+
+def _apply_chunk(db: Session, operations, user_id: int, user_name: str, lineages: dict):
+    """Write a chunk of planned rows in one transaction. Raises if any row cannot be applied."""
+    _insert_items(db, operations, lineages)
+    if any(op["entry"]["id"] is None for op in operations):
+        # La fila que creaba el producto falló.
+        raise ItemServiceError("El producto de esta fila no se pudo crear", 400)
+    changes = {}
+    for op in operations:
+        if op["create"]:
+            continue
+        actual, total = changes.get(op["entry"]["id"], (0, 0))
+        changes[op["entry"]["id"]] = (actual + op["quantity"], total + op["quantity"])
+    apply_stock_changes(db, changes)
+
+    now = datetime.now(TIMEZONE)
+    db.execute(insert(models.History), [
+        {
+            "itemId": op["entry"]["id"],
+            "userId": user_id,
+            "userName": user_name,
+            "action": models.ActionEnum.carga,
+            "personWhoTook": op["comprado_por"] or user_name,
+            "amountRetired": op["quantity"],
+            "amountNotReturned": None,
+            "date": now,
+            "place": op["place"],
+            "turnback": True,
+            "hideFromHistorial": False,
+        }
+        for op in operations
+    ])
+    db.commit()
 
-            description = str(row_data.get("descripcion") or "").strip()
-            comprado_por = str(row_data.get("comprado_por") or "").strip()
-            existing = find_item_by_name_and_zone(db, name, zone.id)
-            place = f"{shed.name} / {zone.name}"
-
-            if existing and existing.status == 1:
-                if normalize_lookup(existing.category) != normalize_lookup(category):
-                    raise ValueError(
-                        "Ya existe un producto con ese nombre en la zona pero con otra categoría"
-                    )
-                item = adjust_item_stock(db, existing, quantity)
-                record_carga(db, item, quantity, current_user, comprado_por, place)
-                updated += 1
-            else:
-                if quantity <= 0:
-                    raise ValueError(
-                        "Para crear un producto la cantidad debe ser mayor a 0"
-                    )
-                item = create_item(
-                    db,
-                    name=normalize_item_name(name),
-                    description=description,
-                    category=category,
-                    quantity=quantity,
-                    zone_id=zone.id,
-                    shed_id=shed.id,
-                )
-                record_carga(db, item, quantity, current_user, comprado_por, place)
-                created += 1
-        except (ValueError, ItemServiceError) as exc:
-            db.rollback()
-            message = exc.message if isinstance(exc, ItemServiceError) else str(exc)
-            errors.append({"row": excel_row, "message": message})
+
+def _import_rows(db: Session, rows, current_user: dict, progress=None) -> dict:
+    header = next(rows, None)
+    if header is None:
+        raise ItemServiceError("El archivo está vacío", 400)
+
+    header_map = _map_headers(header)
+    parsed, errors = _read_rows(rows, header_map)
+    plan = ImportPlan(db, parsed)
+    errors.extend(plan.errors)
+
+    user_id = current_user["user_id"]
+    try:
+        user_name = get_user_name_by_id(db, user_id)
+    except Exception:
+        user_name = current_user.get("username") or "Usuario"
+
+    created = 0
+    updated = 0
+    suggestions = []
+    lineages = {}
+    operations = plan.operations
+    if progress:
+        progress(0, len(operations))
+    for start in range(0, len(operations), IMPORT_CHUNK_SIZE):
+        chunk = operations[start:start + IMPORT_CHUNK_SIZE]
+        saved_lineages = dict(lineages)
+        try:
+            _apply_chunk(db, chunk, user_id, user_name, lineages)
+            applied = chunk
         except Exception:
+            # Algo cambió desde la validación (p. ej. stock movido por otro
+            # usuario): se rehace el bloque fila por fila para ubicar el error.
             db.rollback()
-            errors.append({"row": excel_row, "message": "Error inesperado al procesar la fila"})
+            lineages = saved_lineages
+            applied = []
+            for op in chunk:
+                if op["create"]:
+                    op["entry"]["id"] = None
+            for op in chunk:
+                saved_lineages = dict(lineages)
+                try:
+                    _apply_chunk(db, [op], user_id, user_name, lineages)
+                    applied.append(op)
+                except (ValueError, ItemServiceError) as exc:
+                    db.rollback()
+                    lineages = saved_lineages
+                    message = exc.message if isinstance(exc, ItemServiceError) else str(exc)
+                    errors.append({"row": op["row"], "message": message})
+                except Exception:
+                    db.rollback()
+                    lineages = saved_lineages
+                    errors.append({"row": op["row"], "message": "Error inesperado al procesar la fila"})
+
+        for op in applied:
+            entry = op["entry"]
+            if op["create"]:
+                created += 1
+                name_index.add(entry["id"], entry["name"], entry["zone_id"], entry["shed_id"])
+                if op["similar"]:
+                    suggestions.append({"row": op["row"], "name": entry["name"], "did_you_mean": op["similar"]})
+            else:
+                updated += 1
+        if progress:
+            progress(start + len(chunk), len(operations))
 
-    return {"created": created, "updated": updated, "errors": errors}
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "updated": updated, "errors": errors, "suggestions": suggestions}
@@ -0,0 +1,152 @@
+"""Full-text item search backed by an SQLite FTS5 index.
+
+The index stores the raw item name, description and category; its
+``unicode61`` tokenizer folds case and strips accents (``remove_diacritics 2``),
+which is what ``normalize_lookup`` does to the query, so "yeseria" matches
+"Yesería". Triggers on ``items`` keep it in sync for every insert, update and
+delete. They use only built-in SQL, so writes from any SQLite connection
+(the sqlite3 CLI, a restore script) work. Terms match word prefixes:
+"amol" finds "Amoladora", but "ladora" does not. On other databases the
+helpers fall back to ``ilike`` substring filters.
+"""
+import logging
+import re
+
+from sqlalchemy import literal_column, select, text
+
+import models
+from database import SQLALCHEMY_DATABASE_URL, engine
+from item_categories import normalize_lookup
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "items_fts"
+FTS_COLUMNS = ("name", "description", "category")
+# bm25 weights in FTS_COLUMNS order: a hit in the name counts the most.
+FTS_WEIGHTS = (10.0, 1.0, 2.0)
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_enabled() -> bool:
+    return SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+
+def _outdated_schema(conn) -> bool:
+    """True for an index built by the earlier triggers that called the Python fold()."""
+    definitions = dict(conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE name IN (:table, 'items_fts_ai')"
+    ), {"table": FTS_TABLE}).all())
+    table = definitions.get(FTS_TABLE)
+    trigger = definitions.get("items_fts_ai") or ""
+    return table is not None and (FTS_TOKENIZER not in table or "fold(" in trigger)
+
+
+def ensure_item_search_schema():
+    if not fts_enabled():
+        return
+
+    with engine.begin() as conn:
+        rebuild = _outdated_schema(conn)
+        if rebuild:
+            for trigger in ("items_fts_ai", "items_fts_au", "items_fts_ad"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+        conn.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+            USING fts5(name, description, category, tokenize = '{FTS_TOKENIZER}')
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+                INSERT INTO {FTS_TABLE} (rowid, name, description, category)
+                VALUES (new.id, new.name, new.description, new.category);
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS items_fts_au
+            AFTER UPDATE OF name, description, category ON items BEGIN
+                UPDATE {FTS_TABLE}
+                SET name = new.name,
+                    description = new.description,
+                    category = new.category
+                WHERE rowid = new.id;
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+                DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            END
+        """))
+
+        indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+        total = conn.execute(text("SELECT count(*) FROM items")).scalar()
+        if rebuild or indexed != total:
+            rebuild_item_search_index(conn)
+
+
+def rebuild_item_search_index(conn):
+    logger.info("Reconstruyendo índice de búsqueda de ítems")
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(f"""
+        INSERT INTO {FTS_TABLE} (rowid, name, description, category)
+        SELECT id, name, description, category FROM items
+    """))
+
+
+def build_match_query(raw: str, column: str = None):
+    """Turn free user text into an FTS5 MATCH expression of prefix terms.
+
+    Returns None when the text has nothing searchable.
+    """
+    tokens = _TOKEN_RE.findall(normalize_lookup(raw))
+    if not tokens:
+        return None
+    terms = " ".join(f'"{token}"*' for token in tokens)
+    if column:
+        return f"{column} : ({terms})"
+    return terms
+
+
+def _fts_table():
+    return literal_column(FTS_TABLE)
+
+
+def matching_item_ids(raw: str, column: str = None):
+    """Subquery of item ids whose indexed text matches ``raw``."""
+    match = build_match_query(raw, column)
+    if match is None:
+        return None
+    return (
+        select(literal_column("rowid"))
+        .select_from(text(FTS_TABLE))
+        .where(_fts_table().op("MATCH")(match))
+    )
+
+
+def item_text_filter(raw: str, column: str):
+    """Filter clause for ``Item.<column>`` containing ``raw``."""
+    if not fts_enabled():
+        return getattr(models.Item, column).ilike(f"%{raw}%")
+    ids = matching_item_ids(raw, column)
+    if ids is None:
+        return getattr(models.Item, column).ilike(f"%{raw}%")
+    return models.Item.id.in_(ids)
+
+
+def ranked_item_ids(raw: str, column: str = None):
+    """Subquery of ``(item_id, rank)`` ordered best-first (lower rank is better)."""
+    match = build_match_query(raw, column)
+    if match is None:
+        return None
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    return (
+        select(
+            literal_column("rowid").label("item_id"),
+            literal_column(f"bm25({FTS_TABLE}, {weights})").label("rank"),
+        )
+        .select_from(text(FTS_TABLE))
+        .where(_fts_table().op("MATCH")(match))
+        .subquery()
+    )
+
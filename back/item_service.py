@@ -1,7 +1,5 @@
 import logging
-from datetime import datetime
-
-from sqlalchemy import func
+from sqlalchemy import case, func, update
 from sqlalchemy.orm import Session
 
 import models
@@ -27,11 +25,27 @@ def find_item_by_name_and_zone(db: Session, name: str, zone_id: int):
         .filter(
             func.lower(models.Item.name) == normalized.lower(),
             models.Item.zone_id == zone_id,
+            models.Item.is_deleted.is_(False),
         )
         .first()
     )
 
 
+def find_product_lineage(db: Session, name: str, category: str):
+    """Lineage id of an existing item of the same product (name and category), if any."""
+    return (
+        db.query(models.Item.lineage_id)
+        .filter(
+            models.Item.original_name == name,
+            models.Item.category == category,
+            models.Item.lineage_id.isnot(None),
+        )
+        .order_by(models.Item.id.asc())
+        .limit(1)
+        .scalar()
+    )
+
+
 def create_item(
     db: Session,
     *,
@@ -58,12 +72,9 @@ def create_item(
     existing = find_item_by_name_and_zone(db, name_well_written, zone_id)
 
     if existing:
-        if existing.status == 1:
-            raise ItemServiceError(
-                "Un elemento con el mismo nombre ya existe en esa zona.", 400
-            )
-        existing.name = f"{existing.name}__OLD_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-        db.commit()
+        raise ItemServiceError(
+            "Un elemento con el mismo nombre ya existe en esa zona.", 400
+        )
 
     deleted_with_same_name = (
         db.query(models.DeletedItem)
@@ -77,8 +88,11 @@ def create_item(
         )
 
     try:
+        lineage_id = find_product_lineage(db, name_well_written, category)
         item_to_add = models.Item(
             name=name_well_written,
+            original_name=name_well_written,
+            lineage_id=lineage_id,
             description=description or "",
             category=category,
             shed_id=resolved_shed_id,
@@ -89,6 +103,10 @@ def create_item(
             status=1,
         )
         db.add(item_to_add)
+        if lineage_id is None:
+            # Producto nuevo: su linaje es su propio id.
+            db.flush()
+            item_to_add.lineage_id = item_to_add.id
         db.commit()
         db.refresh(item_to_add)
         return item_to_add
@@ -97,17 +115,53 @@ def create_item(
         raise ItemServiceError(f"Error creating item: {str(e)}", 400)
 
 
-def adjust_item_stock(db: Session, item: models.Item, quantity_change: int):
-    new_total = (item.totalAmount or 0) + quantity_change
-    new_actual = (item.actualAmount or 0) + quantity_change
+def apply_stock_change(db: Session, item_id: int, actual_change: int, total_change: int = None):
+    """Move stock with a single guarded UPDATE.
+
+    The "enough stock" check lives in the WHERE clause, so two concurrent
+    requests (or workers) cannot both pass it and oversell the item.
+    Does not commit.
+    """
+    if total_change is None:
+        total_change = actual_change
+    apply_stock_changes(db, {item_id: (actual_change, total_change)})
+
 
-    if new_total < 0 or new_actual < 0:
+def apply_stock_changes(db: Session, changes: dict):
+    """Guarded stock update for several items in one statement.
+
+    ``changes`` maps item id -> (actual_change, total_change). Either every
+    item has enough stock and all rows move, or ItemServiceError is raised
+    (the caller rolls back).
+    """
+    if not changes:
+        return
+    actual_delta = case(
+        {item_id: actual for item_id, (actual, _) in changes.items()},
+        value=models.Item.id,
+        else_=0,
+    )
+    total_delta = case(
+        {item_id: total for item_id, (_, total) in changes.items()},
+        value=models.Item.id,
+        else_=0,
+    )
+    new_actual = models.Item.actualAmount + actual_delta
+    new_total = func.coalesce(models.Item.totalAmount, 0) + total_delta
+    result = db.execute(
+        update(models.Item)
+        .where(models.Item.id.in_(list(changes)), new_actual >= 0, new_total >= 0)
+        .values(actualAmount=new_actual, totalAmount=new_total)
+        .execution_options(synchronize_session="fetch")
+    )
+    if result.rowcount != len(changes):
         raise ItemServiceError(
             "No hay suficiente stock para realizar esta operación", 400
         )
 
-    item.totalAmount = new_total
-    item.actualAmount = new_actual
+
+def adjust_item_stock(db: Session, item: models.Item, quantity_change: int):
+    apply_stock_change(db, item.id, quantity_change)
     db.commit()
     db.refresh(item)
     return item
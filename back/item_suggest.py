@@ -0,0 +1,264 @@
+"""Typo-tolerant item name lookup over an in-memory trigram index.
+
+Names are folded with ``normalize_lookup`` and split into word trigrams the
+way pg_trgm does ("amoladora" -> "  a", " am", "amo", ...). Similarity is the
+share of trigrams two names have in common, so "amoladra" still scores high
+against "amoladora".
+
+The index is filled in id batches by a background thread at startup and kept
+current by session events on every commit in this process that touches an
+item. Writes those events never see (other worker processes, Core
+``update()``) are caught by the same thread: every
+``NAME_INDEX_REFRESH_SECONDS`` it adds rows past the highest id it has seen,
+and every ``RECONCILE_EVERY`` refreshes it walks all rows to pick up renames,
+status and zone changes and deletions.
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+import models
+from database import SessionLocal
+from item_categories import normalize_lookup
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_SCORE = 0.3
+LOAD_BATCH_SIZE = 1000
+NAME_INDEX_REFRESH_SECONDS = max(1, int(os.getenv("NAME_INDEX_REFRESH_SECONDS", "60")))
+# Recorrer toda la tabla cuesta lo mismo que la carga inicial: se hace una vez cada tantas vueltas.
+RECONCILE_EVERY = 10
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(_WORD_RE.findall(normalize_lookup(name)))
+
+
+def trigrams(name: str) -> frozenset:
+    grams = set()
+    for word in normalize_name(name).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(set)
+        self._entries = {}
+        self.ready = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, item_id: int, name: str, zone_id=None, shed_id=None):
+        grams = trigrams(name)
+        with self._lock:
+            self._discard(item_id)
+            if not grams:
+                return
+            self._entries[item_id] = (name, grams, zone_id, shed_id)
+            for gram in grams:
+                self._postings[gram].add(item_id)
+
+    def entry(self, item_id: int):
+        """``(name, zone_id, shed_id)`` as indexed, or None."""
+        with self._lock:
+            entry = self._entries.get(item_id)
+        return None if entry is None else (entry[0], entry[2], entry[3])
+
+    def ids(self) -> set:
+        with self._lock:
+            return set(self._entries)
+
+    def remove(self, item_id: int):
+        with self._lock:
+            self._discard(item_id)
+
+    def _discard(self, item_id: int):
+        entry = self._entries.pop(item_id, None)
+        if not entry:
+            return
+        for gram in entry[1]:
+            ids = self._postings.get(gram)
+            if ids is None:
+                continue
+            ids.discard(item_id)
+            if not ids:
+                del self._postings[gram]
+
+    def search(self, query: str, limit: int = 10, min_score: float = DEFAULT_MIN_SCORE,
+               zone_id=None, shed_id=None):
+        """Top ``limit`` ``(item_id, name, score)`` tuples, best first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            # Con score >= min_score un ítem comparte al menos min_common
+            # trigramas con la consulta, así que está en alguno de los
+            # len - min_common + 1 más raros: solo se recorren esos.
+            min_common = max(1, math.ceil(min_score * len(query_grams) - 1e-9))
+            rarest = sorted(query_grams, key=lambda gram: len(self._postings.get(gram, ())))
+            candidates = set()
+            for gram in rarest[:len(rarest) - min_common + 1]:
+                candidates.update(self._postings.get(gram, ()))
+
+            scored = []
+            for item_id in candidates:
+                name, grams, item_zone_id, item_shed_id = self._entries[item_id]
+                if zone_id is not None and item_zone_id != zone_id:
+                    continue
+                if shed_id is not None and item_shed_id != shed_id:
+                    continue
+                common = len(query_grams & grams)
+                score = common / (len(query_grams) + len(grams) - common)
+                if score >= min_score:
+                    scored.append((score, item_id, name))
+
+        best = heapq.nlargest(limit, scored, key=lambda entry: (entry[0], -entry[1]))
+        return [(item_id, name, round(score, 3)) for score, item_id, name in best]
+
+
+name_index = TrigramIndex()
+
+
+def _item_batches(db, after_id: int, batch_size: int, active_only: bool):
+    """Yield lists of ``(id, name, zone_id, shed_id, status)`` rows with id > ``after_id``."""
+    last_id = after_id
+    while True:
+        query = db.query(
+            models.Item.id, models.Item.name, models.Item.zone_id, models.Item.shed_id, models.Item.status
+        ).filter(models.Item.id > last_id)
+        if active_only:
+            query = query.filter(models.Item.status == 1)
+        rows = query.order_by(models.Item.id.asc()).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _sync_row(item_id, name, zone_id, shed_id, status) -> bool:
+    """Bring one row's entry up to date; True if the index changed."""
+    current = name_index.entry(item_id)
+    if status != 1:
+        if current is None:
+            return False
+        name_index.remove(item_id)
+        return True
+    if current == (name, zone_id, shed_id):
+        return False
+    name_index.add(item_id, name, zone_id, shed_id)
+    return True
+
+
+def refresh_name_index(after_id: int, reconcile: bool = False,
+                       batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """Apply rows written outside this process; returns the highest id seen.
+
+    Without ``reconcile`` only rows past ``after_id`` are read. With it every
+    row is compared, and indexed ids that no longer exist are dropped.
+    """
+    db = SessionLocal()
+    try:
+        known = name_index.ids() if reconcile else None
+        start = 0 if reconcile else after_id
+        last_id = after_id
+        changed = 0
+        for rows in _item_batches(db, start, batch_size, active_only=not reconcile):
+            for row in rows:
+                changed += _sync_row(*row)
+                if known is not None:
+                    known.discard(row[0])
+            last_id = max(last_id, rows[-1][0])
+        for item_id in known or ():
+            name_index.remove(item_id)
+            changed += 1
+        if changed:
+            logger.info(f"Índice de nombres: {changed} cambios de otros procesos")
+        return last_id
+    finally:
+        db.close()
+
+
+def load_name_index(batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """Fill the index walking active items by id, one batch per query; returns the last id."""
+    db = SessionLocal()
+    try:
+        last_id = 0
+        for rows in _item_batches(db, 0, batch_size, active_only=True):
+            for item_id, name, zone_id, shed_id, _ in rows:
+                name_index.add(item_id, name, zone_id, shed_id)
+            last_id = rows[-1][0]
+        name_index.ready = True
+        logger.info(f"Índice de nombres cargado: {len(name_index)} ítems")
+        return last_id
+    finally:
+        db.close()
+
+
+def run_name_index():
+    try:
+        last_id = load_name_index()
+    except Exception as e:
+        logger.error(f"Error cargando índice de nombres: {e}", exc_info=True)
+        return
+    rounds = 0
+    while True:
+        time.sleep(NAME_INDEX_REFRESH_SECONDS)
+        rounds += 1
+        try:
+            last_id = refresh_name_index(last_id, reconcile=rounds % RECONCILE_EVERY == 0)
+        except Exception as e:
+            logger.error(f"Error actualizando índice de nombres: {e}", exc_info=True)
+
+
+def start_name_index_loader() -> threading.Thread:
+    thread = threading.Thread(target=run_name_index, daemon=True)
+    thread.start()
+    return thread
+
+
+_PENDING_KEY = "name_index_pending"
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_item_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in session.deleted:
+        if isinstance(obj, models.Item):
+            pending[obj.id] = None
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Item):
+            if obj.status == 1:
+                pending[obj.id] = (obj.name, obj.zone_id, obj.shed_id)
+            else:
+                pending[obj.id] = None
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_item_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for item_id, entry in pending.items():
+        if entry is None:
+            name_index.remove(item_id)
+        else:
+            name_index.add(item_id, *entry)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_item_changes(session):
+    session.info.pop(_PENDING_KEY, None)
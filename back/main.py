@@ -1,32 +1,60 @@
 from fastapi import FastAPI, HTTPException, Query, status, Depends, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from io import BytesIO
 import models
 import observations
 import shed
 import movements
+import asyncio
+import json
 import logging
 import threading
 import os
 import admin
-from sqlalchemy.orm import Session, joinedload, contains_eager
+from sqlalchemy.orm import Session, contains_eager
 from typing import Annotated, Optional
 from datetime import datetime
 from math import ceil
-from database import get_db, engine, ensure_zone_schema
+from sqlalchemy import func, select
+from database import SessionLocal, get_db, engine, ensure_zone_schema
 import pytz 
 from dtos.itemResponseDTO import ItemResponseDTO
+from dtos.observationCreateDTO import ObservationResponseDTO
 from dtos.deleteItemDTO import DeleteItemDTO, ResponseFakeDeleteDTO
 import dtos.itemToCreateDTO as itemDTO
 from historial import router
 from auth import get_current_user, router as auth_router
 from notifications import NotificationService, enviar_mail_fallo_borrado
+from email_outbox import start_outbox_sender
 import zones
 from seed_admin import seed_admin_from_env
-from item_service import ItemServiceError, create_item
-from item_import import build_import_template, import_items_from_excel
+from item_service import ItemServiceError, apply_stock_change, create_item
+from item_export import export_rows, export_statement, iter_csv, write_xlsx
+from item_import import (
+    build_import_template,
+    check_excel_header,
+    is_csv_file,
+    spool_upload,
+    validate_excel,
+)
+from import_jobs import (
+    ACTIVE_STATUSES,
+    fail_interrupted_jobs,
+    get_job,
+    job_response,
+    start_job_heartbeat,
+    submit_import,
+)
+from item_search import ensure_item_search_schema, fts_enabled, item_text_filter, ranked_item_ids
+from idempotency import idempotency_middleware
+from item_suggest import name_index, start_name_index_loader
+from observation_threads import detach_threads, thread_observations
+from open_loans import ensure_open_loans
+from pagination import NEXT, PREV, decode_cursor, encode_cursor, keyset_filter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -44,6 +72,7 @@ _allow_origins = (
     else [origin.strip() for origin in _raw_origins.split(",") if origin.strip()]
 )
 
+app.middleware("http")(idempotency_middleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=_allow_origins,
@@ -64,6 +93,9 @@ app.include_router(zones.router)
 
 models.Base.metadata.create_all(bind=engine)
 ensure_zone_schema()
+ensure_item_search_schema()
+ensure_open_loans()
+fail_interrupted_jobs()
 seed_admin_from_env()
 
 item_dependency = Annotated[Session, Depends(get_db)]
@@ -76,6 +108,12 @@ def startup_event():
             daemon=True
         )
         app.notification_thread.start()
+    if not hasattr(app, 'outbox_thread'):
+        app.outbox_thread = start_outbox_sender()
+    if not hasattr(app, 'import_heartbeat_thread'):
+        app.import_heartbeat_thread = start_job_heartbeat()
+    if not hasattr(app, 'name_index_thread'):
+        app.name_index_thread = start_name_index_loader()
 
 TIMEZONE = pytz.timezone('America/Argentina/Buenos_Aires')
 
@@ -96,46 +134,36 @@ def read_items(
     shed_id: Optional[int] = None,
     zone_id: Optional[int] = None,
     page: int = Query(1, ge=1),
-    page_size: int = Query(DEFAULT_PAGE_SIZE, le=MAX_PAGE_SIZE)
+    page_size: int = Query(DEFAULT_PAGE_SIZE, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
 ):
+    # cursor presente (vacío = primera página) activa la paginación por keyset;
+    # sin cursor se mantiene el contrato page/page_size.
     try:
+        filters = _item_filters(name, category, shed_id, zone_id)
+
         query = (
             db.query(models.Item)
             .outerjoin(models.Shed, models.Item.shed_id == models.Shed.id)
             .outerjoin(models.Zone, models.Item.zone_id == models.Zone.id)
-            .options(contains_eager(models.Item.zone))
-            .filter(models.Item.status == 1)
+            .options(contains_eager(models.Item.shed), contains_eager(models.Item.zone))
+            .filter(*filters)
         )
 
-        if name:
-            query = query.filter(models.Item.name.ilike(f"%{name}%"))
-        if category:
-            query = query.filter(models.Item.category.ilike(f"%{category}%"))
-        if shed_id:
-            query = query.filter(models.Item.shed_id == shed_id)
-        if zone_id:
-            query = query.filter(models.Item.zone_id == zone_id)
+        if cursor is not None:
+            return _read_items_by_cursor(db, query, filters, cursor, page_size, include_total)
 
-        total_records = query.count()
+        total_records = _count_items(db, filters)
         total_pages = ceil(total_records / page_size)
 
-        items = query.order_by(
-                        models.Shed.name.asc().nullslast(),
-                        models.Zone.name.asc().nullslast(),
-                        models.Item.name.asc(),
-                     ) \
+        items = query.order_by(*_item_sort_columns()) \
                      .offset((page - 1) * page_size) \
                      .limit(page_size) \
                      .all()
 
-        data = []
-        for item in items:
-            dto = ItemResponseDTO.model_validate(item)
-            dto.zone_name = item.zone.name if item.zone else None
-            data.append(dto)
-
         return {
-            "data": data,
+            "data": [_item_response(item) for item in items],
             "pagination": {
                 "total_records": total_records,
                 "total_pages": total_pages,
@@ -146,21 +174,232 @@ def read_items(
             }
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error al obtener items: {str(e)}"
         )
 
+
+def _item_filters(name, category, shed_id, zone_id):
+    filters = [models.Item.status == 1]
+    if name:
+        filters.append(item_text_filter(name, "name"))
+    if category:
+        filters.append(item_text_filter(category, "category"))
+    if shed_id:
+        filters.append(models.Item.shed_id == shed_id)
+    if zone_id:
+        filters.append(models.Item.zone_id == zone_id)
+    return filters
+
+
+ITEM_SORT_KEYS = (models.Shed.name, models.Zone.name, models.Item.name, models.Item.id)
+
+
+def _item_sort_columns(reverse: bool = False):
+    if reverse:
+        return (
+            models.Shed.name.desc().nullsfirst(),
+            models.Zone.name.desc().nullsfirst(),
+            models.Item.name.desc(),
+            models.Item.id.desc(),
+        )
+    return (
+        models.Shed.name.asc().nullslast(),
+        models.Zone.name.asc().nullslast(),
+        models.Item.name.asc(),
+        models.Item.id.asc(),
+    )
+
+
+def _item_sort_values(item):
+    return (
+        item.shed.name if item.shed else None,
+        item.zone.name if item.zone else None,
+        item.name,
+        item.id,
+    )
+
+
+def _item_response(item) -> ItemResponseDTO:
+    dto = ItemResponseDTO.model_validate(item)
+    dto.zone_name = item.zone.name if item.zone else None
+    return dto
+
+
+def _count_items(db: Session, filters) -> int:
+    # Todos los filtros son sobre items: el conteo no necesita los joins.
+    return db.query(func.count(models.Item.id)).filter(*filters).scalar() or 0
+
+
+def _read_items_by_cursor(db: Session, query, filters, cursor: str, page_size: int, include_total: bool):
+    direction = NEXT
+    if cursor:
+        keys, direction = decode_cursor(cursor, len(ITEM_SORT_KEYS))
+        query = query.filter(keyset_filter(ITEM_SORT_KEYS, keys, direction))
+
+    rows = query.order_by(*_item_sort_columns(reverse=direction == PREV)) \
+                .limit(page_size + 1) \
+                .all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == PREV:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    pagination = {
+        "page_size": page_size,
+        "has_next": has_next and bool(rows),
+        "has_previous": has_previous and bool(rows),
+        "next_cursor": encode_cursor(_item_sort_values(rows[-1]), NEXT) if rows and has_next else None,
+        "prev_cursor": encode_cursor(_item_sort_values(rows[0]), PREV) if rows and has_previous else None,
+    }
+    if include_total:
+        pagination["total_records"] = _count_items(db, filters)
+
+    return {
+        "data": [_item_response(item) for item in rows],
+        "pagination": pagination,
+    }
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_CHUNK_SIZE = 50
+
+
 @app.get("/search")
-def searchItems(name: str, db: item_dependency):
-    items = db.query(models.Item).filter(models.Item.name.ilike(f"%{name}%")).all()
-    if not items:
+def searchItems(
+    name: str,
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+):
+    name_keys = (models.Item.name, models.Item.id)
+    if fts_enabled():
+        ranked = ranked_item_ids(name)
+        if ranked is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No items found with that name"
+            )
+        # bm25 cambia con cada alta o edición del catálogo, así que no sirve de
+        # clave de cursor: la primera página sale por relevancia y las siguientes
+        # traen el resto por (nombre, id), sin repetir los ids de la primera.
+        sort_keys = name_keys if cursor else (ranked.c.rank, models.Item.id)
+    else:
+        ranked = None
+        sort_keys = name_keys
+
+    stmt = (
+        select(
+            models.Item.id,
+            models.Item.name,
+            models.Zone.name.label("zone"),
+            models.Shed.name.label("shed"),
+            models.Item.actualAmount,
+            sort_keys[0].label("sort_key"),
+        )
+        .outerjoin(models.Zone, models.Item.zone_id == models.Zone.id)
+        .outerjoin(models.Shed, models.Item.shed_id == models.Shed.id)
+        .where(models.Item.status == 1)
+    )
+    if ranked is not None:
+        stmt = stmt.join(ranked, ranked.c.item_id == models.Item.id)
+    else:
+        stmt = stmt.where(models.Item.name.ilike(f"%{name}%"))
+
+    excluded = None
+    if ranked is not None:
+        if cursor:
+            keys, _ = decode_cursor(cursor, 3)
+            excluded = _search_excluded_ids(keys[2])
+            if keys[1] is not None:
+                stmt = stmt.where(keyset_filter(name_keys, keys[:2]))
+            if excluded:
+                stmt = stmt.where(models.Item.id.notin_(excluded))
+
+        def cursor_keys(last, page_ids):
+            if excluded is None:
+                return (None, None, page_ids)
+            return (last.name, last.id, excluded)
+    else:
+        if cursor:
+            keys, _ = decode_cursor(cursor, len(sort_keys))
+            stmt = stmt.where(keyset_filter(sort_keys, keys))
+
+        def cursor_keys(last, page_ids):
+            return (last.sort_key, last.id)
+
+    stmt = (
+        stmt.order_by(*sort_keys)
+        .limit(limit + 1)
+        .execution_options(yield_per=SEARCH_CHUNK_SIZE)
+    )
+
+    # La sesión vive lo que dure el stream, no lo que dure la dependencia.
+    db = SessionLocal()
+    try:
+        rows = iter(db.execute(stmt))
+        first = next(rows, None)
+    except Exception:
+        db.close()
+        raise
+    if first is None and not cursor:
+        db.close()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No items found with that name"
         )
-    return items
+
+    return StreamingResponse(
+        _stream_search_rows(db, rows, first, limit, cursor_keys),
+        media_type="application/json",
+    )
+
+
+def _search_excluded_ids(value) -> list:
+    """Ids of the ranked first page carried in the cursor."""
+    if (
+        not isinstance(value, list)
+        or len(value) > SEARCH_MAX_LIMIT
+        or not all(isinstance(item_id, int) for item_id in value)
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    return value
+
+
+def _stream_search_rows(db: Session, rows, first, limit: int, cursor_keys):
+    try:
+        yield '{"data":['
+        next_cursor = None
+        count = 0
+        last = None
+        page_ids = []
+        row = first
+        while row is not None:
+            if count == limit:
+                next_cursor = encode_cursor(cursor_keys(last, page_ids))
+                break
+            payload = {
+                "id": row.id,
+                "name": row.name,
+                "zone": row.zone,
+                "shed": row.shed,
+                "actualAmount": row.actualAmount,
+            }
+            yield ("," if count else "") + json.dumps(payload, ensure_ascii=False)
+            last = row
+            page_ids.append(row.id)
+            count += 1
+            row = next(rows, None)
+        yield '],"next_cursor":' + json.dumps(next_cursor) + "}"
+    finally:
+        db.close()
 
 
 def getItemById(item_id: int, db: item_dependency):
@@ -189,6 +428,44 @@ def createItem(item: itemDTO.ItemCreateDTO, db: item_dependency):
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
 
+@app.get("/items/suggest")
+def suggest_items(
+    db: item_dependency,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    min_score: float = Query(0.3, ge=0, le=1),
+    shed_id: Optional[int] = None,
+    zone_id: Optional[int] = None,
+):
+    matches = name_index.search(q, limit=limit, min_score=min_score, zone_id=zone_id, shed_id=shed_id)
+    if not matches:
+        return []
+
+    ids = [item_id for item_id, _, _ in matches]
+    locations = {
+        item_id: (zone_name, shed_name)
+        for item_id, zone_name, shed_name in (
+            db.query(models.Item.id, models.Zone.name, models.Shed.name)
+            .outerjoin(models.Zone, models.Item.zone_id == models.Zone.id)
+            .outerjoin(models.Shed, models.Item.shed_id == models.Shed.id)
+            .filter(models.Item.id.in_(ids))
+            .all()
+        )
+    }
+
+    return [
+        {
+            "id": item_id,
+            "name": name,
+            "zone_name": locations.get(item_id, (None, None))[0],
+            "shed_name": locations.get(item_id, (None, None))[1],
+            "score": score,
+        }
+        for item_id, name, score in matches
+        if item_id in locations
+    ]
+
+
 @app.get("/items/import/template")
 def download_items_import_template():
     content = build_import_template()
@@ -201,32 +478,170 @@ def download_items_import_template():
     )
 
 
+@app.get("/items/export")
+def export_items(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    name: Optional[str] = None,
+    category: Optional[str] = None,
+    shed_id: Optional[int] = None,
+    zone_id: Optional[int] = None,
+    include_empty: bool = Query(False, description="Incluir productos sin stock (no se pueden volver a cargar)"),
+):
+    """Stock completo con las columnas de la plantilla de carga masiva."""
+    stmt = export_statement(
+        _item_filters(name, category, shed_id, zone_id),
+        _item_sort_columns(),
+        include_empty,
+    )
+    filename = f"stock_{now():%Y-%m-%d}.{format}"
+
+    # La sesión vive lo que dure el archivo, no lo que dure la dependencia.
+    db = SessionLocal()
+    if format == "csv":
+        return StreamingResponse(
+            _stream_export_csv(db, stmt),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+    try:
+        path = write_xlsx(export_rows(db, stmt))
+    finally:
+        db.close()
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=filename,
+        background=BackgroundTask(os.remove, path),
+    )
+
+
+def _stream_export_csv(db: Session, stmt):
+    try:
+        yield from iter_csv(export_rows(db, stmt))
+    finally:
+        db.close()
+
+
 @app.post("/items/import")
 async def import_items_excel(
     db: item_dependency,
     current_user: Annotated[dict, Depends(get_current_user)],
     file: UploadFile = File(...),
+    validate_only: bool = Query(False, description="Solo validar: devuelve el Excel anotado"),
 ):
     filename = (file.filename or "").lower()
-    if not filename.endswith(".xlsx"):
+    if is_csv_file(filename):
+        suffix = ".csv"
+    elif filename.endswith(".xlsx"):
+        suffix = ".xlsx"
+    else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El archivo debe ser un Excel (.xlsx)",
+            detail="El archivo debe ser un Excel (.xlsx) o un CSV",
         )
 
-    file_bytes = await file.read()
-    if not file_bytes:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El archivo está vacío",
-        )
+    try:
+        path = await spool_upload(file, suffix=suffix)
+    except ItemServiceError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    if validate_only:
+        return await _validation_response(db, path, file.filename)
 
     try:
-        return import_items_from_excel(db, file_bytes, current_user)
+        await run_in_threadpool(check_excel_header, path)
+        job = submit_import(db, path, file.filename, current_user)
+    except (ItemServiceError, ValueError) as e:
+        os.remove(path)
+        if isinstance(e, ItemServiceError):
+            raise HTTPException(status_code=e.status_code, detail=e.message)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(job_response(job)),
+        headers={"Location": f"/items/import/{job.id}"},
+    )
+
+
+async def _validation_response(db: Session, path: str, filename):
+    try:
+        report, summary = await run_in_threadpool(validate_excel, db, path)
     except ItemServiceError as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        os.remove(path)
+
+    stem = os.path.splitext(os.path.basename(filename or ""))[0] or "carga"
+    return FileResponse(
+        report,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"validacion_{stem}.xlsx",
+        headers={
+            "X-Import-Rows": str(summary["rows"]),
+            "X-Import-Errors": str(summary["errors"]),
+        },
+        background=BackgroundTask(os.remove, report),
+    )
+
+
+@app.get("/items/import/{job_id}")
+def get_import_job(
+    job_id: str,
+    db: item_dependency,
+    current_user: Annotated[dict, Depends(get_current_user)],
+):
+    job = get_job(db, job_id, current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Carga no encontrada")
+    return job_response(job)
+
+
+IMPORT_EVENTS_INTERVAL = 0.5
+
+
+@app.get("/items/import/{job_id}/events")
+async def stream_import_job(
+    job_id: str,
+    current_user: Annotated[dict, Depends(get_current_user)],
+):
+    """Progreso de la carga como Server-Sent Events, hasta que termina."""
+
+    def read_job():
+        # Sesión propia: la del Depends se cierra antes de que corra el stream.
+        db = SessionLocal()
+        try:
+            job = get_job(db, job_id, current_user)
+            return None if job is None else jsonable_encoder(job_response(job))
+        finally:
+            db.close()
+
+    first = await run_in_threadpool(read_job)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Carga no encontrada")
+
+    async def events():
+        state, last = first, None
+        while True:
+            if state != last:
+                event = "progress" if state["status"] in ACTIVE_STATUSES else state["status"]
+                yield f"event: {event}\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+                last = state
+            if state["status"] not in ACTIVE_STATUSES:
+                return
+            await asyncio.sleep(IMPORT_EVENTS_INTERVAL)
+            state = await run_in_threadpool(read_job)
+            if state is None:
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.put("/items/by-id/{item_id}")
 def update_item_by_id(
@@ -265,17 +680,11 @@ def update_item_by_id(
             detail="Acción no válida"
         )
 
-    new_total = item.totalAmount + quantity_change
-    new_actual = item.actualAmount + quantity_change
-
-    if new_total < 0 or new_actual < 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No hay suficiente stock para realizar esta operación"
-        )
+    try:
+        apply_stock_change(db, item.id, quantity_change)
+    except ItemServiceError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
 
-    item.totalAmount = new_total
-    item.actualAmount = new_actual
     db.commit()
     db.refresh(item)
 
@@ -283,7 +692,11 @@ def update_item_by_id(
 
 @app.put("/")
 def updateItem(name: str, quantity: int, db: item_dependency):
-    item = db.query(models.Item).filter(models.Item.name == name).first()
+    item = (
+        db.query(models.Item)
+        .filter(models.Item.name == name, models.Item.is_deleted.is_(False))
+        .first()
+    )
     if not item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -294,47 +707,98 @@ def updateItem(name: str, quantity: int, db: item_dependency):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Quantity cannot be negative"
         )
-    item.totalAmount += quantity
-    item.actualAmount += quantity
+    apply_stock_change(db, item.id, quantity)
     db.commit()
     db.refresh(item)
     return item
 
 
+DETAIL_INCLUDES = ("observations", "movements")
+
+
 @app.get("/items/{item_id}")
 def get_item_details(
     item_id: int,
     db: item_dependency,
-    current_user: Annotated[dict, Depends(get_current_user)]
+    current_user: Annotated[dict, Depends(get_current_user)],
+    include: Optional[str] = Query(None, description="observations,movements"),
+    recent_page: int = Query(1, ge=1),
+    recent_page_size: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
 ):
+    includes = {part.strip() for part in (include or "").split(",") if part.strip()}
+    unknown = includes.difference(DETAIL_INCLUDES)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"include inválido: {', '.join(sorted(unknown))}"
+        )
 
     try:
+        observations_count = (
+            select(func.count(models.Observation.id))
+            .where(models.Observation.thread_id == models.Item.observation_thread_id)
+            .correlate(models.Item)
+            .scalar_subquery()
+        )
+        movements_count = (
+            select(func.count(models.Movement.id))
+            .where(models.Movement.item_id == models.Item.id)
+            .correlate(models.Item)
+            .scalar_subquery()
+        )
+        last_movement = (
+            select(func.max(models.Movement.date))
+            .where(models.Movement.item_id == models.Item.id)
+            .correlate(models.Item)
+            .scalar_subquery()
+        )
 
-        item = db.query(models.Item)\
-            .options(
-                joinedload(models.Item.observations),
-                joinedload(models.Item.movements)
-            )\
-            .filter(models.Item.id == item_id)\
+        row = (
+            db.query(
+                models.Item,
+                models.Zone.name,
+                observations_count,
+                movements_count,
+                last_movement,
+            )
+            .outerjoin(models.Zone, models.Item.zone_id == models.Zone.id)
+            .filter(models.Item.id == item_id)
             .first()
+        )
 
-        if not item:
+        if not row:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Item con ID {item_id} no encontrado"
             )
 
+        item, zone_name, n_observations, n_movements, last_movement_date = row
         is_deleted = item.status == 0
 
         deletion_history = None
         if is_deleted:
             deletion_history = db.query(models.DeletedItem)\
-                .filter(models.DeletedItem.original_id == item_id)\
+                .filter(models.DeletedItem.item_id == item_id)\
                 .order_by(models.DeletedItem.deleted_at.desc())\
                 .first()
 
+        # Todas las columnas del ítem, como antes, más el nombre de la zona.
+        item_data = {column.key: getattr(item, column.key) for column in models.Item.__mapper__.column_attrs}
+        item_data["zone_name"] = zone_name
+
+        # Totales del producto en todas las zonas: un lookup por lineage_id.
+        product_actual, product_total, product_zones = (
+            db.query(
+                func.coalesce(func.sum(models.Item.actualAmount), 0),
+                func.coalesce(func.sum(models.Item.totalAmount), 0),
+                func.count(models.Item.id),
+            )
+            .filter(models.Item.lineage_id == item.lineage_id, models.Item.status == 1)
+            .one()
+        )
+
         response_data = {
-            "item": jsonable_encoder(item),
+            "item": jsonable_encoder(item_data),
             "metadata": {
                 "is_deleted": is_deleted,
                 "deletion_info": {
@@ -347,16 +811,58 @@ def get_item_details(
                 }
             },
             "relations": {
-                "observations_count": len(item.observations),
-                "movements_count": len(item.movements),
-                "last_movement": max([mov.date for mov in item.movements]) if item.movements else None
-            }
+                "observations_count": n_observations,
+                "movements_count": n_movements,
+                "last_movement": last_movement_date
+            },
+            "product": {
+                "lineage_id": item.lineage_id,
+                "actual_amount": product_actual,
+                "total_amount": product_total,
+                "zones_count": product_zones,
+            },
         }
 
-        return response_data
-
+        offset = (recent_page - 1) * recent_page_size
+        if "observations" in includes:
+            observations = (
+                thread_observations(db, item)
+                .order_by(models.Observation.date.desc(), models.Observation.id.desc())
+                .offset(offset)
+                .limit(recent_page_size)
+                .all()
+            )
+            response_data["relations"]["observations"] = [
+                ObservationResponseDTO.model_validate(o).model_copy(update={"item_id": item_id})
+                for o in observations
+            ]
+        if "movements" in includes:
+            movements_page = (
+                db.query(models.Movement)
+                .filter(models.Movement.item_id == item_id)
+                .order_by(models.Movement.date.desc(), models.Movement.id.desc())
+                .offset(offset)
+                .limit(recent_page_size)
+                .all()
+            )
+            response_data["relations"]["movements"] = [
+                {
+                    "id": m.id,
+                    "quantity": m.quantity,
+                    "date": m.date,
+                    "from_shed_id": m.from_shed_id,
+                    "to_shed_id": m.to_shed_id,
+                    "from_zone_id": m.from_zone_id,
+                    "to_zone_id": m.to_zone_id,
+                    "username": m.username,
+                }
+                for m in movements_page
+            ]
 
+        return response_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo detalles del item {item_id}: {str(e)}")
         raise HTTPException(
@@ -383,7 +889,8 @@ def delete_product(
             date=item_delete.date,
             username=current_user["username"]
         )
-        enviar_mail_fallo_borrado(fake_dto, item_name)
+        enviar_mail_fallo_borrado(db, fake_dto, item_name)
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="No tenés permisos para borrar este ítem."
@@ -411,14 +918,13 @@ def delete_product(
     )
     db.add(deleted_item)
 
-    # Eliminar todas las observaciones asociadas al item
-    db.query(models.Observation).filter(
-        models.Observation.item_id == item.id
-    ).delete()
+    # Soltar el hilo de observaciones (se borra si ninguna otra fila lo usa)
+    detach_threads(db, [item.id])
 
-    # Marcar el item como borrado y cambiar su nombre
+    # Marcar el item como borrado; el nombre queda intacto
     item.status = 0
-    item.name = f"{item.name}__DELETED_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+    item.is_deleted = True
+    item.deleted_at = deleted_item.deleted_at
 
     db.commit()
 
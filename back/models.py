@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Enum, ForeignKey, UniqueConstraint
+from sqlalchemy import Boolean, Column, FetchedValue, Integer, LargeBinary, String, Text, DateTime, Enum, ForeignKey, Index, UniqueConstraint
 from database import Base
 import enum
 from sqlalchemy.orm import relationship
@@ -15,14 +15,24 @@ class RoleEnum(enum.Enum):
      admin = "admin"
      user = "user"
 
+def _default_original_name(context):
+    return context.get_current_parameters().get("name")
+
+
 class Item(Base):
     __tablename__ = "items"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String, index=True)
-    category = Column(String, index=True)
-    description = Column(String, index=True)
-    totalAmount = Column(Integer, index=True)
+    # Nombre con el que se creó el ítem; no cambia al borrarlo ni al recrearlo.
+    original_name = Column(String, index=True, default=_default_original_name)
+    # Producto al que pertenece la fila: el mismo en todas las zonas. Un producto
+    # nuevo toma el id propio: lo asignan create_item y la carga masiva; en SQLite
+    # el trigger items_lineage_ai lo completa también si otra escritura lo omite.
+    lineage_id = Column(Integer, server_default=FetchedValue())
+    category = Column(String)
+    description = Column(String)
+    totalAmount = Column(Integer)
     actualAmount = Column(Integer, nullable=False)
     is_available = Column(Boolean, default=True)
     shed_id = Column(Integer, ForeignKey("sheds.id"))
@@ -30,16 +40,29 @@ class Item(Base):
     zone_id = Column(Integer, ForeignKey("zones.id"), nullable=True)
     zone = relationship("Zone", back_populates="items")
     status = Column(Integer, default=1)  
+    is_deleted = Column(Boolean, nullable=False, default=False)
+    deleted_at = Column(DateTime, nullable=True)
 
     
+    # Hilo de observaciones; lo comparten las filas a las que se movió stock.
+    observation_thread_id = Column(Integer, ForeignKey("observation_threads.id"), nullable=True)
+
     observations = relationship("Observation", back_populates="item")
     movements = relationship("Movement", back_populates="item")
 
+class ObservationThread(Base):
+    __tablename__ = "observation_threads"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
 class Observation(Base):
     __tablename__ = "observations"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Ítem en el que se escribió la observación.
     item_id = Column(Integer, ForeignKey("items.id"))
+    thread_id = Column(Integer, ForeignKey("observation_threads.id"))
     description = Column(String, nullable=False)
     date = Column(DateTime, nullable=False, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -56,21 +79,21 @@ class User(Base):
         name = Column(String, index=True)
         surname = Column(String, index=True)
         email = Column(String, unique=True, index=True)
-        password = Column(String, index=True)
+        password = Column(String)
         role = Column(Enum(RoleEnum), index=True)
         status = Column(Integer, default=1)
 
 class History(Base):
     __tablename__ = "historal"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     itemId = Column(Integer, ForeignKey("items.id"))
     userId = Column(Integer, ForeignKey("users.id"))
-    userName = Column(String, index=True)
+    userName = Column(String)
     personWhoTook = Column(String, nullable=True)  
-    action = Column(Enum(ActionEnum), index=True)
+    action = Column(Enum(ActionEnum))
     amountRetired = Column(Integer, nullable=True)
-    amountNotReturned = Column(Integer, index=True)
+    amountNotReturned = Column(Integer)
     date = Column(DateTime, nullable=False)
     place = Column(String, index=True)
     turnback = Column(Boolean, default=False)
@@ -79,10 +102,110 @@ class History(Base):
     hideFromHistorial = Column(Boolean, default=False)
     item = relationship("Item") 
 
+
+# Índices según los accesos reales (ver query_plans.py); database.sync_indexes
+# los crea o los borra en bases existentes para que coincidan con estos.
+# Los parciales filtran con literales para que SQLite los elija.
+Index("ix_historal_date_id", History.date, History.id)
+Index("ix_historal_item_date", History.itemId, History.date)
+Index(
+    "ix_historal_open", History.itemId, History.place, History.date,
+    sqlite_where=History.turnback == False,
+)
+Index("ix_historal_pending_date", History.date, sqlite_where=History.turnback == False)
+Index("ix_items_zone_name", Item.zone_id, Item.name)
+Index("ix_items_shed_name", Item.shed_id, Item.name)
+Index("ix_items_lineage_zone", Item.lineage_id, Item.zone_id)
+Index("ix_items_observation_thread", Item.observation_thread_id)
+Index("ix_observations_thread_date", Observation.thread_id, Observation.date)
+
+class OpenLoan(Base):
+    """Saldo pendiente de devolución por ítem, lugar y persona.
+
+    Se mantiene en la misma transacción que cada retiro, devolución y
+    traslado; ``open_loans.py`` puede reconstruirlo desde el historial.
+    """
+    __tablename__ = "open_loans"
+    __table_args__ = (
+        UniqueConstraint("item_id", "place", "person", name="uq_open_loan_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False, index=True)
+    place = Column(String, nullable=False, default="")
+    person = Column(String, nullable=False, default="")
+    amount = Column(Integer, nullable=False, default=0)
+    since = Column(DateTime, nullable=True, index=True)
+
+
+class ImportJob(Base):
+    """Carga masiva de productos que corre en segundo plano.
+
+    ``status``: pending, running, done o failed. ``errors`` y ``suggestions``
+    guardan el resultado por fila como JSON. ``owner`` es el proceso que la
+    corre y ``heartbeat_at`` su último latido.
+    """
+    __tablename__ = "import_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=True)
+    status = Column(String(16), nullable=False, default="pending")
+    detail = Column(String, nullable=True)
+    total_rows = Column(Integer, nullable=True)
+    processed_rows = Column(Integer, nullable=False, default=0)
+    created = Column(Integer, nullable=True)
+    updated = Column(Integer, nullable=True)
+    errors = Column(Text, nullable=True)
+    suggestions = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True, index=True)
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+class OutboxEmail(Base):
+    """Correo en cola; lo envía el hilo de ``email_outbox``, nunca el pedido HTTP.
+
+    ``status``: pending, sending (reclamado por ``claimed_by`` hasta
+    ``next_attempt_at``), sent o failed (agotó los reintentos).
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True, index=True)
+    claimed_by = Column(String, nullable=True)
+
+Index("ix_email_outbox_status_due", OutboxEmail.status, OutboxEmail.next_attempt_at)
+
+class IdempotencyKey(Base):
+    """Respuesta guardada de un pedido con ``Idempotency-Key``.
+
+    ``key`` es el hash de usuario, método, ruta y clave del cliente;
+    ``status_code`` queda en NULL mientras el pedido original está en curso.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
 class Movement(Base):
     __tablename__ = "movements"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     item_name = Column(String)
     from_shed_id = Column(Integer, ForeignKey("sheds.id"))
@@ -93,6 +216,7 @@ class Movement(Base):
     username = Column(String)
     date = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))  
+    lineage_id = Column(Integer, nullable=True)
     
     item = relationship("Item", back_populates="movements")
     user = relationship("User")
@@ -102,6 +226,12 @@ class Movement(Base):
     to_zone = relationship("Zone", foreign_keys=[to_zone_id])
 
 
+Index("ix_movements_item_date", Movement.item_id, Movement.date)
+Index("ix_movements_date_id", Movement.date, Movement.id)
+Index("ix_movements_user_date", Movement.user_id, Movement.date)
+Index("ix_movements_lineage_date", Movement.lineage_id, Movement.date)
+
+
 class Shed(Base):
     __tablename__ = "sheds"
     id = Column(Integer, primary_key=True, index=True)
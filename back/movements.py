@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import exists
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import insert, or_, select, update
 from sqlalchemy.orm import Session, joinedload
-from typing import List
-from models import Item, Movement, Observation, Zone, Shed
-from auth import get_current_user
-from dtos.movementsDTO import MovementCreateDTO, MovementResponseDTO
+from typing import List, Optional
+from models import Item, Movement, Zone, Shed
+from auth import get_current_user, get_user_name_by_id
+from item_service import ItemServiceError, apply_stock_change, apply_stock_changes
+from dtos.movementsDTO import MovementCreateDTO, MovementResponseDTO, RelocationDTO
 from database import get_db
+from pagination import NEXT, PREV, decode_cursor, encode_cursor, keyset_filter
+from place_names import place_names
 from contextlib import contextmanager
 import logging
 
@@ -50,6 +54,12 @@ def _movement_response(m: Movement, item_id_destino=None) -> MovementResponseDTO
 
 def validate_movement(db: Session, movement_data: MovementCreateDTO):
     """Valida que el movimiento sea posible"""
+    if movement_data.quantity <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La cantidad debe ser mayor a 0",
+        )
+
     source_item = db.query(Item).filter(
         Item.id == movement_data.item_id,
         Item.shed_id == movement_data.from_shed_id
@@ -105,31 +115,30 @@ def validate_movement(db: Session, movement_data: MovementCreateDTO):
 
 def execute_movement(db: Session, movement_data: MovementCreateDTO, user_id: int, source_item: Item, from_zone_id):
     try:
-        if source_item.actualAmount < movement_data.quantity:
+        try:
+            apply_stock_change(db, source_item.id, -movement_data.quantity)
+        except ItemServiceError:
             raise HTTPException(status_code=400, detail="Stock insuficiente")
 
-        source_item.actualAmount -= movement_data.quantity
-        source_item.totalAmount -= movement_data.quantity
-
-        has_observations = db.query(Observation).filter(
-            Observation.item_id == source_item.id
-        ).count() > 0
-
+        # Las observaciones viajan como hilo compartido: el destino tiene que
+        # ser una fila del mismo producto con el mismo hilo (o ambas sin hilo).
+        thread_id = source_item.observation_thread_id
         target_item = db.query(Item).filter(
-            Item.name == source_item.name,
-            Item.category == source_item.category,
+            Item.lineage_id == source_item.lineage_id,
             Item.zone_id == movement_data.to_zone_id,
             Item.status == 1,
-            exists().where(Observation.item_id == Item.id) if has_observations 
-            else ~exists().where(Observation.item_id == Item.id)
+            Item.observation_thread_id == thread_id if thread_id is not None
+            else Item.observation_thread_id.is_(None)
         ).first()
 
         if target_item:
-            target_item.actualAmount += movement_data.quantity
-            target_item.totalAmount += movement_data.quantity
+            apply_stock_change(db, target_item.id, movement_data.quantity)
         else:
             target_item = Item(
                 name=source_item.name,
+                original_name=source_item.original_name,
+                lineage_id=source_item.lineage_id,
+                observation_thread_id=thread_id,
                 description=source_item.description,
                 category=source_item.category,
                 shed_id=movement_data.to_shed_id,
@@ -142,28 +151,9 @@ def execute_movement(db: Session, movement_data: MovementCreateDTO, user_id: int
             db.add(target_item)
             db.flush()
 
-            if has_observations:
-                observations = db.query(Observation).filter(
-                    Observation.item_id == source_item.id
-                ).all()
-                for obs in observations:
-                    new_obs = Observation(
-                        item_id=target_item.id,
-                        description=obs.description,
-                        user_id=obs.user_id,
-                        user_name=obs.user_name,
-                        observed_by=obs.observed_by,
-                        date=obs.date
-                    )
-                    db.add(new_obs)
-
-        
-        if source_item.actualAmount == 0 and has_observations:
-            db.query(Observation).filter(
-                Observation.item_id == source_item.id
-            ).delete()
+        if source_item.actualAmount == 0 and thread_id is not None:
+            source_item.observation_thread_id = None
 
-        
         movement = Movement(
             item_id=source_item.id,
             item_name=source_item.name,
@@ -173,7 +163,8 @@ def execute_movement(db: Session, movement_data: MovementCreateDTO, user_id: int
             to_zone_id=movement_data.to_zone_id,
             quantity=movement_data.quantity,
             user_id=user_id,
-            username=movement_data.username
+            username=movement_data.username,
+            lineage_id=source_item.lineage_id,
         )
         db.add(movement)
         db.commit()
@@ -244,40 +235,311 @@ def create_movement(
 
 
 
-@router.get("/", response_model=List[MovementResponseDTO])
-def get_movements(db: Session = Depends(get_db)):
-    query = db.query(Movement).options(
-        joinedload(Movement.from_shed),
-        joinedload(Movement.to_shed),
-        joinedload(Movement.from_zone),
-        joinedload(Movement.to_zone),
+@router.post("/relocate")
+def relocate_items(
+    relocation: RelocationDTO,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Mueve todo el stock de varios ítems (o de una zona entera) a otra zona.
+
+    Misma regla que ``POST /movements/`` por ítem: se suma a la fila del
+    mismo producto en la zona destino (con el mismo hilo de observaciones que el
+    origen) o se crea una. Todo en una transacción, con un update de stock
+    y un insert de movimientos para el lote completo.
+    """
+    if relocation.from_zone_id == relocation.to_zone_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El origen y el destino son iguales",
+        )
+
+    zones = {
+        zone.id: zone
+        for zone in db.query(Zone).filter(
+            Zone.id.in_([relocation.from_zone_id, relocation.to_zone_id])
+        )
+    }
+    if relocation.from_zone_id not in zones:
+        raise HTTPException(status_code=404, detail="Zona origen no encontrada")
+    if relocation.to_zone_id not in zones:
+        raise HTTPException(status_code=404, detail="Zona destino no encontrada")
+    to_zone = zones[relocation.to_zone_id]
+
+    # Filas planas: no se expiran con el flush ni el update de stock.
+    query = db.query(
+        Item.id, Item.name, Item.original_name, Item.description, Item.category,
+        Item.shed_id, Item.lineage_id, Item.observation_thread_id, Item.actualAmount,
+    ).filter(Item.zone_id == relocation.from_zone_id, Item.status == 1)
+    if relocation.item_ids is not None:
+        requested = set(relocation.item_ids)
+        if not requested:
+            raise HTTPException(status_code=400, detail="No se seleccionaron ítems")
+        query = query.filter(Item.id.in_(list(requested)))
+    sources = query.order_by(Item.id.asc()).all()
+    if relocation.item_ids is not None:
+        missing = requested.difference(item.id for item in sources)
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Ítems que no están en la zona origen: {sorted(missing)}",
+            )
+
+    skipped = [item.id for item in sources if (item.actualAmount or 0) <= 0]
+    sources = [item for item in sources if (item.actualAmount or 0) > 0]
+    if not sources:
+        return {"moved_items": 0, "moved_units": 0, "merged": 0, "created": 0,
+                "skipped": skipped, "movements": []}
+
+    user_id = current_user["user_id"]
+    username = (relocation.username or "").strip() or get_user_name_by_id(db, user_id)
+    quantities = {item.id: item.actualAmount for item in sources}
+
+    try:
+        lineages = {item.lineage_id for item in sources}
+        candidates = (
+            db.query(Item.id, Item.lineage_id, Item.observation_thread_id)
+            .filter(
+                Item.zone_id == to_zone.id,
+                Item.status == 1,
+                Item.lineage_id.in_(list(lineages)),
+            )
+            .order_by(Item.id.asc())
+            .all()
+        )
+        targets = {}
+        for candidate in candidates:
+            key = (candidate.lineage_id, candidate.observation_thread_id)
+            targets.setdefault(key, candidate.id)
+
+        created = {}
+        target_of = {}
+        for item in sources:
+            key = (item.lineage_id, item.observation_thread_id)
+            if key in targets:
+                target_of[item.id] = targets[key]
+                continue
+            if key not in created:
+                # Sin fila destino: se crea vacía y el stock entra con el update de abajo.
+                created[key] = Item(
+                    name=item.name,
+                    original_name=item.original_name,
+                    lineage_id=item.lineage_id,
+                    observation_thread_id=item.observation_thread_id,
+                    description=item.description,
+                    category=item.category,
+                    shed_id=to_zone.shed_id,
+                    zone_id=to_zone.id,
+                    totalAmount=0,
+                    actualAmount=0,
+                    is_available=True,
+                    status=1,
+                )
+        db.add_all(list(created.values()))
+        db.flush()
+        for item in sources:
+            key = (item.lineage_id, item.observation_thread_id)
+            if key in created:
+                target_of[item.id] = created[key].id
+
+        changes = {}
+        for item in sources:
+            quantity = quantities[item.id]
+            for item_id, delta in ((item.id, -quantity), (target_of[item.id], quantity)):
+                actual, total = changes.get(item_id, (0, 0))
+                changes[item_id] = (actual + delta, total + delta)
+        try:
+            apply_stock_changes(db, changes)
+        except ItemServiceError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El stock de algún ítem cambió durante la reubicación. Reintentá.",
+            )
+
+        # El hilo de observaciones pasó al destino; el origen queda en cero
+        # y se desprende de él (como en un movimiento individual).
+        observed = [item.id for item in sources if item.observation_thread_id is not None]
+        if observed:
+            db.execute(
+                update(Item)
+                .where(Item.id.in_(observed))
+                .values(observation_thread_id=None)
+                .execution_options(synchronize_session=False)
+            )
+
+        moved = [
+            {"item_id": item.id, "target_item_id": target_of[item.id], "quantity": quantities[item.id]}
+            for item in sources
+        ]
+        now = datetime.utcnow()
+        db.execute(insert(Movement), [
+            {
+                "item_id": item.id,
+                "item_name": item.name,
+                "from_shed_id": item.shed_id,
+                "to_shed_id": to_zone.shed_id,
+                "from_zone_id": relocation.from_zone_id,
+                "to_zone_id": to_zone.id,
+                "quantity": quantities[item.id],
+                "username": username,
+                "user_id": user_id,
+                "date": now,
+                "lineage_id": item.lineage_id,
+            }
+            for item in sources
+        ])
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error en reubicación: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al reubicar: {str(e)}"
+        )
+
+    return {
+        "moved_items": len(moved),
+        "moved_units": sum(entry["quantity"] for entry in moved),
+        "merged": len(moved) - len(created),
+        "created": len(created),
+        "skipped": skipped,
+        "movements": moved,
+    }
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Más nuevo primero; (date, id) lo sirve ix_movements_date_id.
+MOVEMENT_SORT_KEYS = (Movement.date, Movement.id)
+
+_MOVEMENT_COLUMNS = (
+    Movement.id,
+    Movement.item_id,
+    Movement.item_name,
+    Movement.quantity,
+    Movement.date,
+    Movement.from_shed_id,
+    Movement.to_shed_id,
+    Movement.from_zone_id,
+    Movement.to_zone_id,
+    Movement.user_id,
+    Movement.username,
+)
+
+
+def _movement_row_response(db: Session, row) -> MovementResponseDTO:
+    return MovementResponseDTO(
+        id=row.id,
+        item_id_origen=row.item_id,
+        item_name=row.item_name,
+        quantity=row.quantity,
+        date=row.date.isoformat() if row.date else "",
+        from_shed_id=row.from_shed_id,
+        from_shed_name=place_names.shed(db, row.from_shed_id),
+        to_shed_id=row.to_shed_id,
+        to_shed_name=place_names.shed(db, row.to_shed_id),
+        from_zone_id=row.from_zone_id,
+        to_zone_id=row.to_zone_id,
+        from_zone_name=place_names.zone(db, row.from_zone_id),
+        to_zone_name=place_names.zone(db, row.to_zone_id),
+        user_id=row.user_id,
+        username=row.username,
     )
 
-    movements = query.order_by(Movement.date.desc()).all()
-    return [_movement_response(m) for m in movements]
+
+def _utc_naive(value):
+    """Movement.date se guarda en UTC sin zona: un offset explícito se convierte."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.replace(tzinfo=None)
+
+
+@router.get("/", response_model=dict)
+def get_movements(
+    db: Session = Depends(get_db),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    shed_id: Optional[int] = None,
+    zone_id: Optional[int] = None,
+    item_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Movimientos más nuevos primero, de a una página por cursor.
+
+    ``from`` es inclusivo y ``to`` exclusivo. ``shed_id`` y ``zone_id``
+    matchean tanto el origen como el destino.
+    """
+    stmt = select(*_MOVEMENT_COLUMNS)
+    if from_date:
+        stmt = stmt.where(Movement.date >= _utc_naive(from_date))
+    if to_date:
+        stmt = stmt.where(Movement.date < _utc_naive(to_date))
+    if shed_id is not None:
+        stmt = stmt.where(or_(Movement.from_shed_id == shed_id, Movement.to_shed_id == shed_id))
+    if zone_id is not None:
+        stmt = stmt.where(or_(Movement.from_zone_id == zone_id, Movement.to_zone_id == zone_id))
+    if item_id is not None:
+        stmt = stmt.where(Movement.item_id == item_id)
+    if user_id is not None:
+        stmt = stmt.where(Movement.user_id == user_id)
+    if username:
+        stmt = stmt.where(Movement.username.ilike(f"%{username}%"))
+
+    direction = NEXT
+    if cursor:
+        keys, direction = decode_cursor(cursor, len(MOVEMENT_SORT_KEYS))
+        if keys[0] is not None:
+            keys[0] = datetime.fromisoformat(keys[0])
+        stmt = stmt.where(keyset_filter(MOVEMENT_SORT_KEYS, keys, direction, descending=True))
+
+    if direction == PREV:
+        order = [column.asc() for column in MOVEMENT_SORT_KEYS]
+    else:
+        order = [column.desc() for column in MOVEMENT_SORT_KEYS]
+    rows = db.execute(stmt.order_by(*order).limit(page_size + 1)).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == PREV:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    def sort_values(row):
+        return (row.date.isoformat() if row.date else None, row.id)
+
+    return {
+        "data": [_movement_row_response(db, row) for row in rows],
+        "pagination": {
+            "page_size": page_size,
+            "has_next": has_next and bool(rows),
+            "has_previous": has_previous and bool(rows),
+            "next_cursor": encode_cursor(sort_values(rows[-1]), NEXT) if rows and has_next else None,
+            "prev_cursor": encode_cursor(sort_values(rows[0]), PREV) if rows and has_previous else None,
+        },
+    }
 
 
 
 @router.get("/by-item/{item_id}", response_model=List[MovementResponseDTO])
 def get_movements_by_item_id(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(Item).filter(Item.id == item_id).first()
-    if not item:
+    """Movimientos del producto en todas sus zonas, no solo de esta fila."""
+    lineage_id = db.query(Item.lineage_id).filter(Item.id == item_id).scalar()
+    if lineage_id is None:
         raise HTTPException(status_code=404, detail="Item no encontrado")
-    
-    items = db.query(Item).filter(Item.name == item.name, Item.category == item.category).all()
-    item_ids = [i.id for i in items]
-
-    movements = (
-        db.query(Movement)
-        .options(
-            joinedload(Movement.from_shed),
-            joinedload(Movement.to_shed),
-            joinedload(Movement.from_zone),
-            joinedload(Movement.to_zone),
-        )
-        .filter(Movement.item_id.in_(item_ids))
-        .order_by(Movement.date.desc())
-        .all()
-    )
 
-    return [_movement_response(m) for m in movements]
+    rows = db.execute(
+        select(*_MOVEMENT_COLUMNS)
+        .where(Movement.lineage_id == lineage_id)
+        .order_by(Movement.date.desc(), Movement.id.desc())
+    ).all()
+
+    return [_movement_row_response(db, row) for row in rows]
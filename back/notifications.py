@@ -2,13 +2,11 @@ from datetime import datetime, timedelta
 import time
 import logging
 import models
-import smtplib
+from sqlalchemy import or_
 from typing import List
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from dtos.deleteItemDTO import ResponseFakeDeleteDTO
 from database import get_db
-from config import EmailConfig
+from email_outbox import enqueue_email
 import pytz
 
 TIMEZONE = pytz.timezone('America/Argentina/Buenos_Aires')
@@ -30,29 +28,35 @@ class NotificationService:
             threshold_days = 60  
             threshold_datetime = now_utc - timedelta(days=threshold_days)
 
-            # Trae todos los items pendientes (turnback == False)
-            pending_items = db.query(
+            # El libro de préstamos dice rápido si hay algo vencido
+            overdue = db.query(models.OpenLoan.id).filter(
+                models.OpenLoan.since < threshold_datetime
+            ).first()
+            if not overdue:
+                logger.info("No hay ítems pendientes para notificar en esta corrida.")
+                return
+
+            # Retiros pendientes más viejos que el umbral y no notificados recientemente
+            items_to_notify = db.query(
                 models.History,
                 models.Item.name.label('itemName'),
                 models.Item.category.label('itemCategory')
             ).join(
                 models.Item, models.History.itemId == models.Item.id
             ).filter(
-                models.History.turnback == False
+                models.History.turnback == False,
+                models.History.date < threshold_datetime,
+                or_(
+                    models.History.lastNotification.is_(None),
+                    models.History.lastNotification < threshold_datetime,
+                ),
             ).all()
 
-            items_to_notify = []
-
-            for history, item_name, category in pending_items:
-                # Verificamos si el item está pendiente desde hace más tiempo que el umbral
-                if history.date < threshold_datetime:
-                    # Verificamos si ya notificamos este item recientemente
-                    if not history.lastNotification or history.lastNotification < threshold_datetime:
-                        items_to_notify.append((history, item_name, category))
-
             if items_to_notify:
                 logger.info(f"Se encontraron {len(items_to_notify)} ítems pendientes para notificar.")
-                NotificationService.send_notification_email(items_to_notify)
+                if not NotificationService.send_notification_email(db, items_to_notify):
+                    # Sin correo configurado no se avisó a nadie: se reintenta en la próxima corrida.
+                    return
 
                 # Guardar última fecha de notificación
                 for history, _, _ in items_to_notify:
@@ -84,32 +88,13 @@ class NotificationService:
         return body
 
     @staticmethod
-    def send_notification_email(items: List[tuple]):
-        if not EmailConfig.is_configured():
-            logger.warning(
-                "Email no configurado (EMAIL_ADDRESS / EMAIL_PASSWORD / ADMIN_EMAIL). "
-                "Se omite el envío de notificación."
-            )
-            return
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = EmailConfig.EMAIL_ADDRESS
-            msg['To'] = EmailConfig.ADMIN_EMAIL
-            msg['Subject'] = f"Notificación de ítems pendientes ({len(items)})"
-
-            body = NotificationService._build_email_body(items)
-            msg.attach(MIMEText(body, 'plain'))
-
-            with smtplib.SMTP(EmailConfig.SMTP_SERVER, EmailConfig.SMTP_PORT) as server:
-                server.starttls()
-                server.login(EmailConfig.EMAIL_ADDRESS, EmailConfig.EMAIL_PASSWORD)
-                server.send_message(msg)
-                logger.info("Correo de notificación enviado correctamente.")
-
-        except smtplib.SMTPException as e:
-            logger.error(f"Error SMTP al enviar notificación: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"Error inesperado al enviar notificación: {e}", exc_info=True)
+    def send_notification_email(db, items: List[tuple]) -> bool:
+        """Queue the notice; it leaves with the commit that records ``lastNotification``.
+
+        Returns False if email is not configured and nothing was queued.
+        """
+        body = NotificationService._build_email_body(items)
+        return enqueue_email(db, f"Notificación de ítems pendientes ({len(items)})", body)
 
     @staticmethod
     def run_scheduler():
@@ -124,10 +109,9 @@ class NotificationService:
                 logger.error(f"Error en scheduler de notificaciones: {e}", exc_info=True)
                 time.sleep(60)  
 
-def enviar_mail_fallo_borrado(dto: ResponseFakeDeleteDTO, itemName: str):
+def enviar_mail_fallo_borrado(db, dto: ResponseFakeDeleteDTO, itemName: str):
+    """Queue the alert to the admin; the caller commits."""
     date_time = now()
-    remitente = EmailConfig.EMAIL_ADDRESS
-    receptor = EmailConfig.ADMIN_EMAIL
     asunto = "Intento de borrado NO AUTORIZADO"
     cuerpo = f"""
     El usuario {dto.username} intentó borrar {itemName} sin permisos.
@@ -135,19 +119,4 @@ def enviar_mail_fallo_borrado(dto: ResponseFakeDeleteDTO, itemName: str):
     Motivo: {dto.description}
     Fecha: {date_time}
     """
-
-    mensaje = MIMEMultipart()
-    mensaje["From"] = remitente
-    mensaje["To"] = receptor
-    mensaje["Subject"] = asunto
-    mensaje.attach(MIMEText(cuerpo, "plain"))
-
-    try:
-        servidor = smtplib.SMTP("smtp.gmail.com", 587)
-        servidor.starttls()
-        servidor.login(remitente, EmailConfig.EMAIL_PASSWORD)
-        servidor.sendmail(remitente, receptor, mensaje.as_string())
-        servidor.quit()
-        print("Correo enviado exitosamente.")
-    except Exception as e:
-        print(f"Error al enviar correo: {e}")
+    enqueue_email(db, asunto, cuerpo)
@@ -0,0 +1,94 @@
+"""Observation threads shared between rows of the same product.
+
+Each item row with observations points at a thread
+(``items.observation_thread_id``). Moving stock to another zone hands the
+same thread to the target row instead of copying its observations; a row
+that adds a note to a thread it shares gets its own copy first
+(copy-on-write), so the other rows keep what they had.
+"""
+from sqlalchemy import delete, exists, false, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+_COPIED_COLUMNS = ("item_id", "description", "date", "user_id", "user_name", "observed_by")
+
+
+def thread_observations(db: Session, item: models.Item):
+    """Query over the item's observations (empty if it has no thread)."""
+    query = db.query(models.Observation)
+    if item.observation_thread_id is None:
+        # Comparar con None daría "thread_id IS NULL": las observaciones huérfanas.
+        return query.filter(false())
+    return query.filter(models.Observation.thread_id == item.observation_thread_id)
+
+
+def _is_shared(db: Session, thread_id: int, item_id: int) -> bool:
+    return db.query(
+        exists().where(
+            models.Item.observation_thread_id == thread_id,
+            models.Item.id != item_id,
+        )
+    ).scalar()
+
+
+def writable_thread(db: Session, item: models.Item) -> int:
+    """Id of a thread only ``item`` uses, copying a shared one if needed. Does not commit."""
+    current = item.observation_thread_id
+    if current is not None and not _is_shared(db, current, item.id):
+        return current
+
+    thread = models.ObservationThread()
+    db.add(thread)
+    db.flush()
+    if current is not None:
+        columns = [getattr(models.Observation, name) for name in _COPIED_COLUMNS]
+        db.execute(
+            insert(models.Observation).from_select(
+                ["thread_id", *_COPIED_COLUMNS],
+                select(thread.id, *columns)
+                .where(models.Observation.thread_id == current)
+                .order_by(models.Observation.id),
+            )
+        )
+    item.observation_thread_id = thread.id
+    return thread.id
+
+
+def detach_threads(db: Session, item_ids):
+    """Unlink items from their threads; threads nobody uses anymore are deleted.
+
+    Does not commit.
+    """
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    thread_ids = set(
+        db.execute(
+            select(models.Item.observation_thread_id).where(
+                models.Item.id.in_(item_ids),
+                models.Item.observation_thread_id.isnot(None),
+            )
+        ).scalars()
+    )
+    if not thread_ids:
+        return
+    db.execute(
+        update(models.Item)
+        .where(models.Item.id.in_(item_ids))
+        .values(observation_thread_id=None)
+        .execution_options(synchronize_session="fetch")
+    )
+    orphaned = list(
+        db.execute(
+            select(models.ObservationThread.id).where(
+                models.ObservationThread.id.in_(list(thread_ids)),
+                ~exists().where(
+                    models.Item.observation_thread_id == models.ObservationThread.id
+                ),
+            )
+        ).scalars()
+    )
+    if orphaned:
+        db.execute(delete(models.Observation).where(models.Observation.thread_id.in_(orphaned)))
+        db.execute(delete(models.ObservationThread).where(models.ObservationThread.id.in_(orphaned)))
@@ -6,6 +6,7 @@ import models
 from database import get_db
 from auth import get_current_user
 import dtos.observationCreateDTO as dtos
+from observation_threads import thread_observations, writable_thread
 import pytz
 
 router = APIRouter(
@@ -28,16 +29,19 @@ def get_all_observations(db: db_dependency):
 
 @router.get("/item/{item_id}", response_model=list[dtos.ObservationResponseDTO])
 def get_observations_by_item(item_id: int, db: db_dependency):
-    observations = db.query(models.Observation).filter(
-        models.Observation.item_id == item_id
-    ).all()
-    
+    item = db.query(models.Item).get(item_id)
+    observations = thread_observations(db, item).order_by(models.Observation.id).all() if item else []
+
     if not observations:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No observations found for this item"
         )
-    return observations
+    # El hilo puede venir de otra fila del producto: se informa el ítem pedido.
+    return [
+        dtos.ObservationResponseDTO.model_validate(o).model_copy(update={"item_id": item_id})
+        for o in observations
+    ]
 
 @router.post("/", response_model=dtos.ObservationResponseDTO, status_code=status.HTTP_201_CREATED)
 def create_observation(
@@ -62,6 +66,7 @@ def create_observation(
 
     observation = models.Observation(
         item_id=dto.item_id,
+        thread_id=writable_thread(db, item),
         description=dto.description,
         user_id=current_user["user_id"],
         user_name=f"{user.name} {user.surname}",
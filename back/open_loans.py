@@ -0,0 +1,442 @@
+"""Ledger of open loans: what is still out, where and with whom.
+
+Every retiro, devolución and traslado updates ``open_loans`` in the same
+transaction as its ``historal`` rows, so pending lookups read a handful of
+balance rows instead of the whole loan history.
+
+    python open_loans.py verify   # compara el libro con el historial
+    python open_loans.py rebuild  # lo reconstruye desde el historial
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+
+from sqlalchemy import and_, case, delete, func, insert, literal_column, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal, engine
+from pagination import keyset_filter
+
+logger = logging.getLogger(__name__)
+
+FIFO_BATCH_SIZE = 20
+_LEDGER_COLUMNS = ("item_id", "place", "person", "amount", "since")
+# '' literal, no parámetro: PostgreSQL exige que el GROUP BY repita la expresión del SELECT.
+_EMPTY = literal_column("''")
+
+
+def _open_balances(*conditions):
+    """``(item_id, place, person, amount, since)`` per open key, derived from ``historal``."""
+    history = models.History
+    place = func.coalesce(history.place, _EMPTY)
+    # Misma regla que loan_person(), en SQL, para reconstruir desde el historial.
+    person = func.coalesce(
+        func.nullif(func.trim(history.personWhoTook), _EMPTY), func.trim(history.userName), _EMPTY
+    )
+    return (
+        select(
+            history.itemId.label("item_id"),
+            place.label("place"),
+            person.label("person"),
+            func.sum(history.amountNotReturned).label("amount"),
+            func.min(history.date).label("since"),
+        )
+        .where(
+            history.action == models.ActionEnum.retiro,
+            history.turnback.is_(False),
+            history.amountNotReturned > 0,
+            *conditions,
+        )
+        .group_by(history.itemId, place, person)
+    )
+
+
+def loan_person(person_who_took, user_name) -> str:
+    return (person_who_took or "").strip() or (user_name or "").strip()
+
+
+def _key(item_id: int, place, person: str):
+    return and_(
+        models.OpenLoan.item_id == item_id,
+        models.OpenLoan.place == (place or ""),
+        models.OpenLoan.person == person,
+    )
+
+
+# Dialectos con INSERT ... ON CONFLICT DO UPDATE, y la función que da el menor de dos valores.
+_UPSERTS = {
+    "sqlite": (sqlite.insert, func.min),
+    "postgresql": (postgresql.insert, func.least),
+}
+
+
+def _upsert_statement(dialect_name: str, values: dict):
+    """Single-statement upsert for ``dialect_name``, or None if it has none."""
+    if dialect_name not in _UPSERTS:
+        return None
+    dialect_insert, earliest = _UPSERTS[dialect_name]
+    stmt = dialect_insert(models.OpenLoan).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=["item_id", "place", "person"],
+        set_={
+            "amount": models.OpenLoan.amount + stmt.excluded.amount,
+            "since": earliest(
+                func.coalesce(models.OpenLoan.since, stmt.excluded.since),
+                stmt.excluded.since,
+            ),
+        },
+    )
+
+
+def _add_loan_fallback(db: Session, values: dict):
+    """Update-then-insert for dialects without ``ON CONFLICT``."""
+    since = values["since"]
+    bump = (
+        update(models.OpenLoan)
+        .where(_key(values["item_id"], values["place"], values["person"]))
+        .values(
+            amount=models.OpenLoan.amount + values["amount"],
+            since=case(
+                (or_(models.OpenLoan.since.is_(None), models.OpenLoan.since > since), since),
+                else_=models.OpenLoan.since,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(bump).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(models.OpenLoan).values(**values))
+    except IntegrityError:
+        # Otro pedido creó la misma clave entre el UPDATE y el INSERT.
+        db.execute(bump)
+
+
+def add_loan(db: Session, item_id: int, place, person: str, amount: int, date):
+    values = {
+        "item_id": item_id,
+        "place": place or "",
+        "person": person,
+        "amount": amount,
+        "since": date,
+    }
+    stmt = _upsert_statement(db.get_bind().dialect.name, values)
+    if stmt is None:
+        _add_loan_fallback(db, values)
+    else:
+        db.execute(stmt)
+
+
+def total_pending(db: Session, item_id: int, place=None) -> int:
+    query = db.query(func.coalesce(func.sum(models.OpenLoan.amount), 0)).filter(
+        models.OpenLoan.item_id == item_id
+    )
+    if place:
+        query = query.filter(models.OpenLoan.place == place)
+    return int(query.scalar() or 0)
+
+
+def open_balances(db: Session, item_id: int):
+    return (
+        db.query(models.OpenLoan)
+        .filter(models.OpenLoan.item_id == item_id, models.OpenLoan.amount > 0)
+        .order_by(models.OpenLoan.place.asc(), models.OpenLoan.since.asc())
+        .all()
+    )
+
+
+class LoanConflictError(Exception):
+    """An open retiro changed under us (another request returned it first)."""
+
+
+_OPEN_RETIRO_COLUMNS = (
+    models.History.id,
+    models.History.itemId,
+    models.History.date,
+    models.History.amountNotReturned,
+    models.History.place,
+    models.History.personWhoTook,
+    models.History.userName,
+)
+
+
+def _open_retiros_query(db: Session):
+    return db.query(*_OPEN_RETIRO_COLUMNS).filter(
+        models.History.action == models.ActionEnum.retiro,
+        models.History.turnback == False,
+        models.History.amountNotReturned > 0,
+    )
+
+
+def _close_retiro(db: Session, history_id: int, taken: int, when) -> bool:
+    left = models.History.amountNotReturned - taken
+    # Guardado: si otro pedido ya descontó este retiro, no se pisa.
+    result = db.execute(
+        update(models.History)
+        .where(models.History.id == history_id, models.History.amountNotReturned >= taken)
+        .values(
+            amountNotReturned=left,
+            turnback=left == 0,
+            turnbackDate=case((left == 0, when), else_=models.History.turnbackDate),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _reopen_retiro(db: Session, history_id: int, taken: int):
+    db.execute(
+        update(models.History)
+        .where(models.History.id == history_id)
+        .values(
+            amountNotReturned=models.History.amountNotReturned + taken,
+            turnback=False,
+            turnbackDate=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def return_fifo(db: Session, item_id: int, place, amount: int, when) -> int:
+    """Close ``amount`` units of the oldest open retiros and update the ledger.
+
+    Walks the open ``historal`` rows in date order, a small batch at a time,
+    stopping as soon as the amount is covered. Returns what could not be
+    allocated (0 unless the ledger and the history disagree).
+    """
+    base = _open_retiros_query(db).filter(models.History.itemId == item_id)
+    if place:
+        base = base.filter(models.History.place == place)
+
+    sort_keys = (models.History.date, models.History.id)
+    released = defaultdict(int)
+    restante = amount
+    last = None
+    while restante > 0:
+        query = base
+        if last is not None:
+            query = query.filter(keyset_filter(sort_keys, last))
+        batch = query.order_by(*sort_keys).limit(FIFO_BATCH_SIZE).all()
+        if not batch:
+            break
+        for p in batch:
+            if restante <= 0:
+                break
+            taken = min(restante, p.amountNotReturned)
+            if not _close_retiro(db, p.id, taken, when):
+                continue
+            restante -= taken
+            released[(p.place or "", loan_person(p.personWhoTook, p.userName))] += taken
+        last = (batch[-1].date, batch[-1].id)
+
+    release_loans(db, item_id, released)
+    return restante
+
+
+class OpenRetiros:
+    """Open retiros of several items loaded once, oldest first.
+
+    ``plan`` allocates a return FIFO in memory; ``apply`` writes one plan
+    with guarded updates and returns what it released per (place, person),
+    for ``release_loans``. Remaining amounts only move once a plan is
+    applied, so a rejected line does not affect the following ones.
+    """
+
+    def __init__(self, db: Session, item_ids):
+        self._by_item = defaultdict(list)
+        rows = (
+            _open_retiros_query(db)
+            .filter(models.History.itemId.in_(list(item_ids)))
+            .order_by(models.History.date.asc(), models.History.id.asc())
+            .all()
+        )
+        for row in rows:
+            entry = dict(row._mapping)
+            entry["key"] = (row.place or "", loan_person(row.personWhoTook, row.userName))
+            self._by_item[row.itemId].append(entry)
+
+    def pending(self, item_id: int, place=None) -> int:
+        return sum(
+            entry["amountNotReturned"]
+            for entry in self._by_item.get(item_id, ())
+            if not place or entry["place"] == place
+        )
+
+    def plan(self, item_id: int, place, amount: int):
+        """``[(entry, taken), ...]`` covering ``amount``, or None if not enough is out."""
+        allocation = []
+        restante = amount
+        for entry in self._by_item.get(item_id, ()):
+            if restante <= 0:
+                break
+            if place and entry["place"] != place:
+                continue
+            taken = min(restante, entry["amountNotReturned"])
+            if taken <= 0:
+                continue
+            allocation.append((entry, taken))
+            restante -= taken
+        return allocation if restante <= 0 else None
+
+    def apply(self, db: Session, item_id: int, allocation, when):
+        closed = []
+        for entry, taken in allocation:
+            if not _close_retiro(db, entry["id"], taken, when):
+                for done, done_taken in closed:
+                    _reopen_retiro(db, done["id"], done_taken)
+                raise LoanConflictError()
+            closed.append((entry, taken))
+
+        released = defaultdict(int)
+        for entry, taken in allocation:
+            entry["amountNotReturned"] -= taken
+            released[entry["key"]] += taken
+        return released
+
+
+def release_loans(db: Session, item_id: int, released: dict):
+    if not released:
+        return
+    for (place, person), taken in released.items():
+        result = db.execute(
+            update(models.OpenLoan)
+            .where(_key(item_id, place, person), models.OpenLoan.amount >= taken)
+            .values(amount=models.OpenLoan.amount - taken)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            # El saldo ya no cubría lo devuelto: el libro se había desviado del
+            # historial (que acaba de actualizarse), así que se recalcula.
+            logger.warning(
+                "Saldo de préstamo desfasado (ítem %s, %r, %r); se reconstruye",
+                item_id, place, person,
+            )
+            _rebuild_key(db, item_id, place, person)
+    db.execute(
+        delete(models.OpenLoan).where(
+            models.OpenLoan.item_id == item_id,
+            models.OpenLoan.amount <= 0,
+        )
+    )
+
+    # since = retiro abierto más antiguo que le queda a cada saldo tocado.
+    oldest_open = (
+        select(func.min(models.History.date))
+        .where(
+            models.History.itemId == models.OpenLoan.item_id,
+            func.coalesce(models.History.place, "") == models.OpenLoan.place,
+            func.coalesce(
+                func.nullif(func.trim(models.History.personWhoTook), ""),
+                func.trim(models.History.userName),
+                "",
+            ) == models.OpenLoan.person,
+            models.History.action == models.ActionEnum.retiro,
+            models.History.turnback == False,
+            models.History.amountNotReturned > 0,
+        )
+        .scalar_subquery()
+    )
+    touched = or_(*(
+        and_(models.OpenLoan.place == place, models.OpenLoan.person == person)
+        for place, person in released
+    ))
+    db.execute(
+        update(models.OpenLoan)
+        .where(models.OpenLoan.item_id == item_id, touched)
+        .values(since=oldest_open)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _rebuild_key(db: Session, item_id: int, place, person: str):
+    """Recompute one balance from ``historal``, inside the caller's transaction."""
+    db.execute(delete(models.OpenLoan).where(_key(item_id, place, person)))
+    balances = _open_balances(models.History.itemId == item_id).subquery()
+    db.execute(
+        insert(models.OpenLoan).from_select(
+            _LEDGER_COLUMNS,
+            select(*(balances.c[name] for name in _LEDGER_COLUMNS)).where(
+                balances.c.place == (place or ""), balances.c.person == person
+            ),
+        )
+    )
+
+
+def rebuild_open_loans(db: Session):
+    db.execute(delete(models.OpenLoan))
+    db.execute(insert(models.OpenLoan).from_select(_LEDGER_COLUMNS, _open_balances()))
+    db.commit()
+
+
+def verify_open_loans(db: Session):
+    """Differences between the ledger and the balances derived from history."""
+    expected = {
+        (row.item_id, row.place, row.person): int(row.amount)
+        for row in db.execute(_open_balances())
+    }
+    actual = {
+        (row.item_id, row.place, row.person): int(row.amount)
+        for row in db.query(models.OpenLoan).filter(models.OpenLoan.amount != 0)
+    }
+    problems = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], k[1], k[2])):
+        if expected.get(key, 0) != actual.get(key, 0):
+            item_id, place, person = key
+            problems.append({
+                "item_id": item_id,
+                "place": place,
+                "person": person,
+                "expected": expected.get(key, 0),
+                "ledger": actual.get(key, 0),
+            })
+    return problems
+
+
+def ensure_open_loans():
+    """Fill the ledger the first time it runs against an existing history."""
+    db = SessionLocal()
+    try:
+        has_loans = db.query(models.OpenLoan.id).first() is not None
+        if has_loans:
+            return
+        has_open = db.execute(_open_balances().limit(1)).first() is not None
+        if has_open:
+            logger.info("Construyendo libro de préstamos abiertos desde el historial")
+            rebuild_open_loans(db)
+    finally:
+        db.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Libro de préstamos abiertos")
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    args = parser.parse_args(argv)
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rebuild_open_loans(db)
+            logger.info("Libro reconstruido: %s saldos", db.query(models.OpenLoan).count())
+            return 0
+
+        problems = verify_open_loans(db)
+        for problem in problems:
+            logger.warning(
+                "Ítem %(item_id)s / %(place)r / %(person)r: historial %(expected)s, libro %(ledger)s",
+                problem,
+            )
+        logger.info("%s diferencias", len(problems))
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
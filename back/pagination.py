@@ -0,0 +1,74 @@
+"""Helpers for keyset (cursor) pagination.
+
+Cursors are opaque to clients: a urlsafe base64 JSON payload with the sort key
+values of the boundary row and the direction to walk from it.
+"""
+import base64
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, false, or_
+
+NEXT = "n"
+PREV = "p"
+
+
+def encode_cursor(keys, direction: str = NEXT) -> str:
+    payload = json.dumps({"k": list(keys), "d": direction}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        keys = payload["k"]
+        direction = payload.get("d", NEXT)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido",
+        )
+    if not isinstance(keys, list) or len(keys) != size or direction not in (NEXT, PREV):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido",
+        )
+    return keys, direction
+
+
+def _after(column, value, descending: bool):
+    # Walking forward with NULLS LAST: NULL sorts after every value.
+    if value is None:
+        return false()
+    if descending:
+        return or_(column < value, column.is_(None))
+    return or_(column > value, column.is_(None))
+
+
+def _before(column, value, descending: bool):
+    if value is None:
+        return column.isnot(None)
+    if descending:
+        return column > value
+    return column < value
+
+
+def _equals(column, value):
+    if value is None:
+        return column.is_(None)
+    return column == value
+
+
+def keyset_filter(columns, values, direction: str = NEXT, descending: bool = False):
+    """Row-value comparison ``(columns) > (values)`` honouring NULLS LAST.
+
+    ``direction`` PREV builds the mirrored ``<`` predicate, used to walk back
+    from the first row of a page.
+    """
+    compare = _after if direction == NEXT else _before
+    clauses = []
+    for index, (column, value) in enumerate(zip(columns, values)):
+        prefix = [_equals(c, v) for c, v in zip(columns[:index], values[:index])]
+        clauses.append(and_(*prefix, compare(column, value, descending)))
+    return or_(*clauses)
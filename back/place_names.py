@@ -0,0 +1,79 @@
+"""In-process lookup of shed and zone names.
+
+Listings that only need the name of a shed or zone read it from here instead
+of joining ``sheds`` and ``zones`` per row. Both tables are a handful of rows,
+loaded once and reloaded after any commit in this process that touches a shed
+or a zone. Changes made by other processes are picked up when the copy gets
+older than ``PLACE_NAMES_TTL_SECONDS`` or when an id is missing from it.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+
+import models
+from database import SessionLocal
+
+UNKNOWN_SHED = "Desconocido"
+NO_ZONE = "Sin zona"
+PLACE_NAMES_TTL_SECONDS = 60
+# Un id que sigue sin aparecer (lugar borrado) no recarga más de una vez por este plazo.
+MISS_RELOAD_SECONDS = 1
+
+
+class PlaceNames:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sheds = None
+        self._zones = None
+        self._loaded_at = 0.0
+
+    def _load(self, db, max_age=None):
+        if max_age is None:
+            max_age = PLACE_NAMES_TTL_SECONDS
+        with self._lock:
+            if self._sheds is None or time.monotonic() - self._loaded_at > max_age:
+                self._sheds = dict(db.query(models.Shed.id, models.Shed.name).all())
+                self._zones = dict(db.query(models.Zone.id, models.Zone.name).all())
+                self._loaded_at = time.monotonic()
+            return self._sheds, self._zones
+
+    def shed(self, db, shed_id) -> str:
+        sheds, _ = self._load(db)
+        if shed_id is not None and shed_id not in sheds:
+            sheds, _ = self._load(db, MISS_RELOAD_SECONDS)
+        return sheds.get(shed_id, UNKNOWN_SHED)
+
+    def zone(self, db, zone_id) -> str:
+        _, zones = self._load(db)
+        if zone_id is not None and zone_id not in zones:
+            _, zones = self._load(db, MISS_RELOAD_SECONDS)
+        return zones.get(zone_id, NO_ZONE)
+
+    def invalidate(self):
+        with self._lock:
+            self._sheds = None
+            self._zones = None
+
+
+place_names = PlaceNames()
+
+_CHANGED_KEY = "place_names_changed"
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_place_changes(session, flush_context):
+    touched = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, (models.Shed, models.Zone)) for obj in touched):
+        session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_place_changes(session):
+    if session.info.pop(_CHANGED_KEY, False):
+        place_names.invalidate()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_place_changes(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,301 @@
+"""EXPLAIN QUERY PLAN of the statements each endpoint runs.
+
+Runs every endpoint, and the background jobs in ``BACKGROUND_JOBS``, against a
+throwaway copy of the database (the original is never written) and prints the plan SQLite picks for each SELECT, UPDATE and
+DELETE it executes. Lines that scan a whole table are marked with ``!``.
+
+    python query_plans.py              # copia de la base configurada
+    python query_plans.py --db otra.db
+"""
+import argparse
+import importlib
+import logging
+import operator
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+_EXPLAINED = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+# Cuerpo multipart en lugar de JSON.
+Upload = namedtuple("Upload", "filename content")
+
+_IMPORT_CSV = (
+    "nombre;descripcion;cantidad;categoria;galpon;zona;comprado_por\n"
+    "Plan importado;;3;Herramientas de obra general;Galpón query plans;Zona 1;\n"
+    "Plan de consulta;;1;Herramientas de obra general;Galpón query plans;Zona 1;\n"
+)
+
+# (etiqueta, método, ruta, json o Upload). {item}, {spare}, {history}, {shed},
+# {zone}, {zone2} y {place} se completan con los datos de prueba que se crean en
+# la copia; {job} con el job_id de la última respuesta que lo trae.
+ENDPOINTS = (
+    ("items: alta", "POST", "/",
+     {"name": "Plan nuevo", "description": "", "quantity": 1, "category": "Herramientas de obra general",
+      "shed_id": "{shed}", "zone_id": "{zone}"}),
+    ("items: ajuste por nombre", "PUT", "/?name=Plan de consulta&quantity=100", None),
+    ("items: baja", "DELETE", "/",
+     {"item_id": "{spare}", "description": "query plans", "date": "2025-01-01T00:00:00"}),
+    ("items: listado", "GET", "/?zone_id={zone}", None),
+    ("items: listado por nombre", "GET", "/?name=plan", None),
+    ("items: búsqueda", "GET", "/search?name=plan", None),
+    ("items: sugerencias", "GET", "/items/suggest?q=plnes", None),
+    ("items: detalle", "GET", "/items/{item}?include=observations,movements", None),
+    ("items: ajuste de stock", "PUT", "/items/by-id/{item}", {"quantity": 1, "action": "add"}),
+    ("items: borrados", "GET", "/deleted-items", None),
+    ("items: exportar xlsx", "GET", "/items/export?zone_id={zone}", None),
+    ("items: exportar csv", "GET", "/items/export?format=csv&include_empty=true", None),
+    ("items: carga masiva", "POST", "/items/import", Upload("plan.csv", _IMPORT_CSV)),
+    ("items: eventos de la carga", "GET", "/items/import/{job}/events", None),
+    ("items: estado de la carga", "GET", "/items/import/{job}", None),
+    ("historial: listado", "GET", "/historical/", None),
+    ("historial: por ítem", "GET", "/historical/?item_id={item}", None),
+    ("historial: por mes", "GET", "/historical/?month=1&year=2025", None),
+    ("historial: pendientes", "GET", "/historical/pending", None),
+    ("historial: búsqueda", "GET", "/historical/search?item_id={item}", None),
+    ("historial: lugares pendientes", "GET", "/historical/pending-places/{item}", None),
+    ("historial: lugares", "GET", "/historical/places", None),
+    ("historial: exportar csv", "GET", "/historical/export?item_id={item}", None),
+    ("historial: exportar xlsx", "GET", "/historical/export?format=xlsx&month=1&year=2025", None),
+    ("historial: retiro", "POST", "/historical/retirar",
+     {"itemId": "{item}", "amount": 2, "place": "{place}", "personWhoTook": "Planes"}),
+    ("historial: devolución", "POST", "/historical/devolver",
+     {"itemId": "{item}", "amount": 1, "place": "{place}"}),
+    ("historial: traslado", "POST", "/historical/trasladar",
+     {"itemId": "{item}", "amount": 1, "fromPlace": "{place}", "toPlace": "{place} 2"}),
+    ("historial: retiro en lote", "POST", "/historical/retirar/lote",
+     {"place": "{place}", "personWhoTook": "Planes", "items": [{"itemId": "{item}", "amount": 2}]}),
+    ("historial: devolución en lote", "POST", "/historical/devolver/lote",
+     {"items": [{"itemId": "{item}", "amount": 1, "place": "{place}"}]}),
+    ("historial: remito", "POST", "/historical/remito", ["{history}"]),
+    ("movimientos: listado", "GET", "/movements/", None),
+    ("movimientos: por zona", "GET", "/movements/?zone_id={zone}", None),
+    ("movimientos: por usuario", "GET", "/movements/?user_id=1&from=2024-01-01", None),
+    ("movimientos: por ítem", "GET", "/movements/by-item/{item}", None),
+    ("movimientos: alta", "POST", "/movements/",
+     {"item_id": "{item}", "from_shed_id": "{shed}", "to_shed_id": "{shed}",
+      "from_zone_id": "{zone}", "to_zone_id": "{zone2}", "quantity": 1, "username": "planes"}),
+    ("observaciones: alta", "POST", "/api/observations/", {"item_id": "{item}", "description": "plan"}),
+    ("observaciones: por ítem", "GET", "/api/observations/item/{item}", None),
+    ("galpones", "GET", "/sheds/", None),
+    ("zonas", "GET", "/zones/", None),
+    # Al final: se lleva el ítem de prueba a la otra zona.
+    ("movimientos: reubicar", "POST", "/movements/relocate",
+     {"from_zone_id": "{zone}", "to_zone_id": "{zone2}", "item_ids": ["{item}"], "username": "planes"}),
+)
+
+# (etiqueta, módulo, función, recibe sesión) de tareas en segundo plano que no pasan por HTTP.
+BACKGROUND_JOBS = (
+    ("notificador: retiros vencidos", "notifications", "NotificationService.check_pending_items", False),
+    ("correos: reclamar lote", "email_outbox", "claim_due", True),
+    ("correos: purgar enviados", "email_outbox", "purge_sent", True),
+    ("cargas: latido", "import_jobs", "_beat", False),
+    ("cargas: interrumpidas", "import_jobs", "fail_interrupted_jobs", False),
+    ("cargas: purgar vencidas", "import_jobs", "purge_expired_jobs", True),
+)
+
+
+def _fill(value, sample):
+    if isinstance(value, dict):
+        return {key: _fill(v, sample) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, sample) for v in value]
+    if isinstance(value, str):
+        if value.startswith("{") and value.endswith("}") and value[1:-1] in sample:
+            return sample[value[1:-1]]
+        return value.format(**sample)
+    return value
+
+
+def _create_sample(db, models, auth, open_loans):
+    user = models.User(
+        name="Planes", surname="Consulta", email="query-plans@local",
+        password="-", role=models.RoleEnum.admin, status=1,
+    )
+    shed = models.Shed(name="Galpón query plans")
+    db.add_all([user, shed])
+    db.flush()
+    zone = models.Zone(name="Zona 1", shed_id=shed.id)
+    zone2 = models.Zone(name="Zona 2", shed_id=shed.id)
+    db.add_all([zone, zone2])
+    db.flush()
+    item = models.Item(
+        name="Plan de consulta", category="Herramientas de obra general", description="query plans",
+        totalAmount=100, actualAmount=99, is_available=True,
+        shed_id=shed.id, zone_id=zone.id, status=1,
+    )
+    # Otro ítem con todo el stock en el galpón: es el único que se puede dar de baja.
+    spare = models.Item(
+        name="Plan de baja", category="Herramientas de obra general", description="query plans",
+        totalAmount=1, actualAmount=1, is_available=True,
+        shed_id=shed.id, zone_id=zone.id, status=1,
+    )
+    db.add_all([item, spare])
+    db.flush()
+    # Un retiro vencido, para que el notificador llegue a su consulta sobre historal.
+    # Va a otra obra: las devoluciones de ENDPOINTS no lo cierran.
+    overdue_place = "Obra vencida query plans"
+    taken = datetime.utcnow() - timedelta(days=90)
+    history = models.History(
+        itemId=item.id, userId=user.id, userName=user.name, personWhoTook="Planes",
+        action=models.ActionEnum.retiro, amountRetired=1, amountNotReturned=1,
+        date=taken, place=overdue_place, turnback=False,
+    )
+    db.add(history)
+    open_loans.add_loan(db, item.id, overdue_place, "Planes", 1, taken)
+    # Un correo en cola, para que el reclamo del lote llegue a su UPDATE.
+    db.add(models.OutboxEmail(
+        recipient="query-plans@local", subject="query plans", body="-",
+        status="pending", attempts=0, next_attempt_at=taken, created_at=taken,
+    ))
+    db.commit()
+    token = auth.create_access_token(user.email, user.id, "admin")
+    sample = {
+        "item": item.id, "spare": spare.id, "history": history.id,
+        "shed": shed.id, "zone": zone.id, "zone2": zone2.id, "place": "Obra query plans",
+    }
+    return {"Authorization": f"Bearer {token}"}, sample
+
+
+def _explain(conn, statement, parameters):
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+    # id, parent, notused, detail: se indenta según la profundidad del nodo.
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        full_scan = detail.startswith("SCAN") and "USING" not in detail and "VIRTUAL TABLE" not in detail
+        mark = "!" if full_scan else " "
+        lines.append(f"  {mark} {'  ' * depth[node_id]}{detail}")
+    return lines
+
+
+def _response_job(response):
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return None
+    body = response.json()
+    return body.get("job_id") if isinstance(body, dict) else None
+
+
+def _wait_for_job(conn, job_id, timeout=30):
+    # Conexión cruda: estas consultas no se capturan.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = conn.execute("SELECT status FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+        if status is None or status[0] not in ("pending", "running"):
+            return
+        time.sleep(0.05)
+
+
+def _report():
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import auth
+    import main
+    import models
+    import open_loans
+    from database import SessionLocal, engine
+
+    logging.disable(logging.WARNING)
+    db = SessionLocal()
+    try:
+        headers, sample = _create_sample(db, models, auth, open_loans)
+    finally:
+        db.close()
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(_EXPLAINED):
+            captured.append((statement, parameters))
+
+    def print_plans(label, title):
+        print(f"\n## {label}: {title}")
+        seen = set()
+        scans[label] = 0
+        for statement, parameters in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            print("  " + " ".join(statement.split())[:110])
+            plan = _explain(explain_conn, statement, parameters)
+            scans[label] += sum(1 for line in plan if line.lstrip().startswith("!"))
+            print("\n".join(plan))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    client = TestClient(main.app)
+    explain_conn = engine.raw_connection()
+    scans = {}
+    try:
+        for label, method, path, body in ENDPOINTS:
+            captured.clear()
+            if isinstance(body, Upload):
+                request = {"files": {"file": (body.filename, body.content.encode("utf-8"))}}
+            else:
+                request = {"json": _fill(body, sample)}
+            response = client.request(method, _fill(path, sample), headers=headers, **request)
+            job = _response_job(response)
+            if job:
+                sample["job"] = job
+                # Lo que corre el hilo de la carga cuenta para este endpoint.
+                _wait_for_job(explain_conn, job)
+            print_plans(label, f"{method} {_fill(path, sample)} -> {response.status_code}")
+        for label, module, function, with_session in BACKGROUND_JOBS:
+            captured.clear()
+            job = operator.attrgetter(function)(importlib.import_module(module))
+            if with_session:
+                session = SessionLocal()
+                try:
+                    job(session)
+                finally:
+                    session.close()
+            else:
+                job()
+            print_plans(label, f"{module}.{function}")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        explain_conn.close()
+
+    print("\n## Resumen: recorridos completos de tabla por endpoint")
+    for label, count in scans.items():
+        print(f"  {count:3d}  {label}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Planes de consulta por endpoint")
+    parser.add_argument("--db", help="Base a analizar (por defecto DB_PATH)")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        _report()
+        return 0
+
+    source = args.db
+    if source is None:
+        from database import DB_PATH
+        source = str(DB_PATH)
+    if not os.path.exists(source):
+        parser.error(f"No existe la base {source}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "query_plans.db")
+        # backup() copia también lo que esté en el WAL.
+        with sqlite3.connect(source) as src, sqlite3.connect(copy) as dst:
+            src.backup(dst)
+        env = dict(os.environ, DB_PATH=copy, DATABASE_URL=f"sqlite:///{copy}")
+        return subprocess.call(
+            [sys.executable, os.path.abspath(__file__), "--run", copy],
+            env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
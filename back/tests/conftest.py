@@ -0,0 +1,62 @@
+"""Shared setup: the app runs against a throwaway SQLite database."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Antes de importar la app: database.py lee DB_PATH al importarse.
+_TMP_DIR = tempfile.mkdtemp(prefix="depotflow-tests-")
+os.environ["DB_PATH"] = os.path.join(_TMP_DIR, "shed.db")
+os.environ.pop("DATABASE_URL", None)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import auth  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+def admin_headers():
+    session = SessionLocal()
+    try:
+        user = models.User(
+            name="Ana", surname="Paz", email="admin@tests", password="x",
+            role=models.RoleEnum.admin, status=1,
+        )
+        session.add(user)
+        session.commit()
+        token = auth.create_access_token(user.email, user.id, "admin")
+    finally:
+        session.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def zone(db):
+    """A new shed with two zones; returns the first one (the second is ``id + 1``)."""
+    shed = models.Shed(name=f"Galpón {len(db.query(models.Shed).all()) + 1}")
+    db.add(shed)
+    db.flush()
+    first = models.Zone(name="Zona A", shed_id=shed.id)
+    second = models.Zone(name="Zona B", shed_id=shed.id)
+    db.add_all([first, second])
+    db.commit()
+    return first
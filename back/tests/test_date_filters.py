@@ -0,0 +1,25 @@
+"""Dates with an explicit offset are converted, not just stripped."""
+from datetime import datetime, timedelta, timezone
+
+import historial
+import movements
+
+
+def test_history_filters_convert_offsets_to_buenos_aires():
+    utc = datetime(2026, 3, 1, 15, 0, tzinfo=timezone.utc)
+    madrid = datetime(2026, 3, 1, 16, 0, tzinfo=timezone(timedelta(hours=1)))
+    since, until = historial.history_date_filters(from_date=utc, to_date=madrid)
+
+    assert since.right.value == datetime(2026, 3, 1, 12, 0)
+    assert until.right.value == datetime(2026, 3, 1, 12, 0)
+
+
+def test_history_filters_keep_naive_dates_as_local():
+    (since,) = historial.history_date_filters(from_date=datetime(2026, 3, 1, 12, 0))
+    assert since.right.value == datetime(2026, 3, 1, 12, 0)
+
+
+def test_movement_filters_convert_offsets_to_utc():
+    buenos_aires = datetime(2026, 3, 1, 12, 0, tzinfo=timezone(timedelta(hours=-3)))
+    assert movements._utc_naive(buenos_aires) == datetime(2026, 3, 1, 15, 0)
+    assert movements._utc_naive(datetime(2026, 3, 1, 12, 0)) == datetime(2026, 3, 1, 12, 0)
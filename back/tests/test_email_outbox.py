@@ -0,0 +1,112 @@
+"""Several senders draining one outbox: every message goes out exactly once."""
+import smtplib
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import email_outbox
+import models
+from database import SessionLocal
+
+SENDERS = 6
+MESSAGES = 120
+
+
+class FakeConnection:
+    """Records what it is asked to send; subjects in ``refuse`` get a 550."""
+
+    def __init__(self, sent, refuse=()):
+        self.sent = sent
+        self.refuse = refuse
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        if message["Subject"] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({message["To"]: (550, b"no")})
+        time.sleep(0.001)
+        with self._lock:
+            self.sent.append(message["Subject"])
+
+
+def _queue(db, count, status=email_outbox.PENDING, attempts=0, due=None):
+    db.query(models.OutboxEmail).delete()
+    now = datetime.utcnow()
+    db.add_all(
+        models.OutboxEmail(
+            recipient="admin@tests", subject=f"Correo {n}", body="-", status=status,
+            attempts=attempts, next_attempt_at=due or now, created_at=now,
+        )
+        for n in range(count)
+    )
+    db.commit()
+
+
+def _drain(connection):
+    session = SessionLocal()
+    try:
+        while email_outbox.send_due(session, connection):
+            pass
+    finally:
+        session.close()
+
+
+def test_concurrent_senders_send_each_message_once(db, monkeypatch):
+    monkeypatch.setattr(email_outbox, "OUTBOX_BATCH_SIZE", 10)
+    _queue(db, MESSAGES)
+    sent = []
+    connection = FakeConnection(sent)
+
+    with ThreadPoolExecutor(SENDERS) as pool:
+        list(pool.map(lambda _: _drain(connection), range(SENDERS)))
+
+    assert Counter(sent) == Counter(f"Correo {n}" for n in range(MESSAGES))
+    statuses = Counter(status for (status,) in db.query(models.OutboxEmail.status))
+    assert statuses == {email_outbox.SENT: MESSAGES}
+
+
+def test_claimed_rows_are_not_claimed_again(db):
+    _queue(db, 3)
+    other = SessionLocal()
+    try:
+        first = email_outbox.claim_due(db)
+        assert len(first) == 3
+        assert email_outbox.claim_due(other) == []
+    finally:
+        other.close()
+
+
+def test_refused_message_goes_back_to_pending_with_backoff(db):
+    _queue(db, 2)
+    sent = []
+
+    email_outbox.send_due(db, FakeConnection(sent, refuse={"Correo 0"}))
+
+    assert sent == ["Correo 1"]
+    refused = db.query(models.OutboxEmail).filter_by(subject="Correo 0").one()
+    assert refused.status == email_outbox.PENDING
+    assert refused.attempts == 1
+    assert refused.next_attempt_at > datetime.utcnow()
+
+
+def test_expired_claim_counts_as_an_attempt(db):
+    expired = datetime.utcnow() - timedelta(minutes=1)
+    _queue(db, 1, status=email_outbox.SENDING, attempts=2, due=expired)
+
+    (mail,) = email_outbox.claim_due(db)
+
+    assert mail.attempts == 3
+    assert mail.status == email_outbox.SENDING
+
+
+def test_claim_that_keeps_expiring_ends_up_failed(db):
+    expired = datetime.utcnow() - timedelta(minutes=1)
+    attempts = email_outbox.OUTBOX_MAX_ATTEMPTS - 1
+    _queue(db, 1, status=email_outbox.SENDING, attempts=attempts, due=expired)
+
+    assert email_outbox.claim_due(db) == []
+    mail = db.query(models.OutboxEmail).one()
+    db.refresh(mail)
+    assert mail.status == email_outbox.FAILED
+    assert mail.attempts == email_outbox.OUTBOX_MAX_ATTEMPTS
@@ -0,0 +1,52 @@
+"""Interrupted imports: only jobs whose owner stopped beating are failed."""
+import uuid
+from datetime import datetime
+
+import import_jobs
+import models
+
+
+def _job(db, owner, heartbeat_at, status=import_jobs.RUNNING):
+    user = db.query(models.User).first()
+    job = models.ImportJob(
+        id=uuid.uuid4().hex, user_id=user.id, filename="carga.xlsx", status=status,
+        owner=owner, created_at=datetime.utcnow(), heartbeat_at=heartbeat_at,
+    )
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def _status(db, job_id):
+    db.expire_all()
+    return db.get(models.ImportJob, job_id).status
+
+
+def test_only_stale_jobs_are_failed(db, admin_headers):
+    now = datetime.utcnow()
+    alive = _job(db, "otro:1:a", now)
+    stale = _job(db, "otro:2:b", now - 2 * import_jobs.JOB_STALE_AFTER)
+    legacy = _job(db, None, None, status=import_jobs.PENDING)
+
+    import_jobs.fail_interrupted_jobs()
+
+    assert _status(db, alive) == import_jobs.RUNNING
+    assert _status(db, stale) == import_jobs.FAILED
+    assert _status(db, legacy) == import_jobs.FAILED
+
+
+def test_failed_job_is_not_overwritten_by_its_runner(db, admin_headers):
+    job_id = _job(db, import_jobs.OWNER, datetime.utcnow() - 2 * import_jobs.JOB_STALE_AFTER)
+    import_jobs.fail_interrupted_jobs()
+
+    assert not import_jobs._update_job(job_id, status=import_jobs.DONE, finished_at=datetime.utcnow())
+    assert _status(db, job_id) == import_jobs.FAILED
+
+
+def test_heartbeat_keeps_own_jobs_alive(db, admin_headers):
+    job_id = _job(db, import_jobs.OWNER, datetime.utcnow() - 2 * import_jobs.JOB_STALE_AFTER)
+
+    import_jobs._beat()
+    import_jobs.fail_interrupted_jobs()
+
+    assert _status(db, job_id) == import_jobs.RUNNING
@@ -0,0 +1,29 @@
+"""Indexes follow the declarations in models.py, the only place they are defined."""
+from sqlalchemy import text
+
+from database import engine, sync_indexes
+
+
+def _indexes(conn):
+    return dict(conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    )).all())
+
+
+def test_sync_drops_undeclared_and_rebuilds_changed_indexes():
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX ix_items_category ON items (category)"))
+        conn.execute(text("DROP INDEX ix_historal_pending_date"))
+        conn.execute(text("CREATE INDEX ix_historal_pending_date ON historal (date)"))
+        conn.execute(text("CREATE INDEX manual_items_category ON items (category)"))
+
+        assert sync_indexes(conn)
+        indexes = _indexes(conn)
+
+        assert "ix_items_category" not in indexes
+        assert indexes["ix_historal_pending_date"].endswith("WHERE turnback = 0")
+        # Solo se tocan los índices con el prefijo que maneja models.py.
+        assert "manual_items_category" in indexes
+        conn.execute(text("DROP INDEX manual_items_category"))
+
+        assert not sync_indexes(conn)
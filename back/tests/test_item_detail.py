@@ -0,0 +1,22 @@
+"""The detail keeps every item column, plus the zone name."""
+import models
+
+
+def test_detail_item_has_every_column(client, db, admin_headers, zone):
+    item = models.Item(
+        name="Taladro", category="Herramientas de obra general", description="",
+        totalAmount=3, actualAmount=3, is_available=True,
+        shed_id=zone.shed_id, zone_id=zone.id, status=1,
+    )
+    db.add(item)
+    db.commit()
+
+    response = client.get(f"/items/{item.id}", headers=admin_headers)
+    assert response.status_code == 200
+    body = response.json()["item"]
+
+    assert set(models.Item.__table__.columns.keys()) <= set(body)
+    assert body["original_name"] == "Taladro"
+    assert body["shed_id"] == zone.shed_id
+    assert body["zone_id"] == zone.id
+    assert body["zone_name"] == zone.name
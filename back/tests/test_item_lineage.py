@@ -0,0 +1,53 @@
+"""New products get their lineage from Python, not only from the SQLite trigger."""
+import time
+
+import pytest
+from sqlalchemy import text
+
+import models
+from database import engine, ensure_zone_schema
+
+
+@pytest.fixture
+def without_trigger():
+    # Como en una base sin el trigger items_lineage_ai.
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER items_lineage_ai"))
+    try:
+        yield
+    finally:
+        ensure_zone_schema()
+
+
+def test_create_item_sets_its_own_lineage(client, db, admin_headers, zone, without_trigger):
+    response = client.post("/", json={
+        "name": "Carretilla", "description": "", "quantity": 2,
+        "category": "Herramientas de obra general", "shed_id": zone.shed_id, "zone_id": zone.id,
+    }, headers=admin_headers)
+    assert response.status_code == 200
+
+    item = db.query(models.Item).filter_by(name="Carretilla", zone_id=zone.id).one()
+    assert item.lineage_id == item.id
+
+
+def test_import_sets_lineage_for_new_products(client, db, admin_headers, zone, without_trigger):
+    shed = db.get(models.Shed, zone.shed_id).name
+    rows = "".join(
+        f"Cortadora;;1;Herramientas de obra general;{shed};{zone_name};\n"
+        for zone_name in ("Zona A", "Zona B")
+    )
+    csv = "nombre;descripcion;cantidad;categoria;galpon;zona;comprado_por\n" + rows
+    response = client.post(
+        "/items/import", files={"file": ("carga.csv", csv.encode(), "text/csv")}, headers=admin_headers
+    )
+    job_url = f"/items/import/{response.json()['job_id']}"
+    for _ in range(100):
+        job = client.get(job_url, headers=admin_headers).json()
+        if job["status"] not in ("pending", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done", job
+
+    items = db.query(models.Item).filter_by(name="Cortadora").order_by(models.Item.id).all()
+    assert len(items) == 2
+    assert {item.lineage_id for item in items} == {items[0].id}
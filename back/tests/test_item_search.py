@@ -0,0 +1,53 @@
+"""The search index follows writes from any SQLite connection."""
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+import item_search
+from database import DB_PATH, engine
+
+pytestmark = pytest.mark.skipif(not item_search.fts_enabled(), reason="FTS5 solo en SQLite")
+
+
+def _names(client, headers, **params):
+    response = client.get("/", params=params, headers=headers)
+    assert response.status_code == 200
+    return {row["name"] for row in response.json()["data"]}
+
+
+def test_plain_sqlite_connection_can_write_items(client, admin_headers, zone):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.execute(
+            "INSERT INTO items (name, category, description, totalAmount, actualAmount,"
+            " is_available, is_deleted, shed_id, zone_id, status)"
+            " VALUES ('Compresora Señalización', 'Herramientas de obra general', '',"
+            " 1, 1, 1, 0, ?, ?, 1)",
+            (zone.shed_id, zone.id),
+        )
+        conn.execute("UPDATE items SET name = 'Compresora Señalada' WHERE name = 'Compresora Señalización'")
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert "Compresora Señalada" in _names(client, admin_headers, name="senal")
+    assert not _names(client, admin_headers, name="señalizacion")
+
+
+def test_index_built_with_fold_triggers_is_migrated(client, admin_headers):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER items_fts_ai"))
+        conn.execute(text(
+            "CREATE TRIGGER items_fts_ai AFTER INSERT ON items BEGIN"
+            " INSERT INTO items_fts (rowid, name, description, category)"
+            " VALUES (new.id, fold(new.name), fold(new.description), fold(new.category)); END"
+        ))
+        assert item_search._outdated_schema(conn)
+
+    item_search.ensure_item_search_schema()
+
+    with engine.begin() as conn:
+        assert not item_search._outdated_schema(conn)
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'items_fts_ai'")).scalar()
+    assert "fold(" not in sql
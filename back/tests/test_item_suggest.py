@@ -0,0 +1,45 @@
+"""Writes the session events never see still reach the name index on refresh."""
+from sqlalchemy import insert, update
+
+import models
+from item_suggest import name_index, refresh_name_index
+
+
+def _insert(db, zone, name):
+    item_id = db.execute(
+        insert(models.Item).values(
+            name=name, category="Herramientas de obra general", description="",
+            totalAmount=1, actualAmount=1, is_available=True,
+            shed_id=zone.shed_id, zone_id=zone.id, status=1, is_deleted=False,
+        ).returning(models.Item.id)
+    ).scalar_one()
+    db.commit()
+    return item_id
+
+
+def _found(name, item_id):
+    return item_id in [found for found, _, _ in name_index.search(name, limit=50)]
+
+
+def test_refresh_picks_up_new_rows(db, zone):
+    last_id = refresh_name_index(0, reconcile=True)
+    item_id = _insert(db, zone, "Amoladora angular")
+    assert not _found("amoladora angular", item_id)
+
+    assert refresh_name_index(last_id) == item_id
+    assert _found("amoladra angular", item_id)
+
+
+def test_reconcile_applies_renames_moves_and_removals(db, zone):
+    renamed = _insert(db, zone, "Taladro percutor")
+    removed = _insert(db, zone, "Sierra circular")
+    refresh_name_index(0, reconcile=True)
+
+    db.execute(update(models.Item).where(models.Item.id == renamed)
+               .values(name="Rotomartillo", zone_id=zone.id + 1))
+    db.execute(update(models.Item).where(models.Item.id == removed).values(status=0))
+    db.commit()
+    refresh_name_index(removed, reconcile=True)
+
+    assert name_index.entry(renamed) == ("Rotomartillo", zone.id + 1, zone.shed_id)
+    assert name_index.entry(removed) is None
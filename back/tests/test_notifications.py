@@ -0,0 +1,37 @@
+"""Overdue loans are only marked as notified when a notice was queued."""
+from datetime import datetime, timedelta
+
+import models
+from config import EmailConfig
+from notifications import NotificationService
+
+
+def test_unconfigured_email_does_not_stamp_last_notification(db, zone, monkeypatch):
+    monkeypatch.setattr(EmailConfig, "is_configured", classmethod(lambda cls: False))
+    since = datetime.utcnow() - timedelta(days=90)
+    item = models.Item(
+        name="Martillo", category="Herramientas de obra general", description="",
+        totalAmount=2, actualAmount=0, is_available=True,
+        shed_id=zone.shed_id, zone_id=zone.id, status=1,
+    )
+    db.add(item)
+    db.flush()
+    history = models.History(
+        itemId=item.id, userName="Ana", action=models.ActionEnum.retiro,
+        amountRetired=2, amountNotReturned=2, date=since, place="Obra", turnback=False,
+    )
+    loan = models.OpenLoan(item_id=item.id, place="Obra", person="Ana", amount=2, since=since)
+    db.add_all([history, loan])
+    db.commit()
+    try:
+        NotificationService.check_pending_items()
+
+        db.refresh(history)
+        assert history.lastNotification is None
+        assert db.query(models.OutboxEmail).filter(
+            models.OutboxEmail.subject.like("Notificación de ítems pendientes%")
+        ).count() == 0
+    finally:
+        db.delete(loan)
+        db.delete(history)
+        db.commit()
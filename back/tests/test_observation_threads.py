@@ -0,0 +1,21 @@
+"""An item without a thread has no observations, even if orphan rows exist."""
+import models
+
+
+def test_item_without_thread_does_not_see_orphan_observations(client, db, admin_headers, zone):
+    db.add(models.Observation(description="Huérfana", user_name="Ana"))
+    item = models.Item(
+        name="Pala", category="Herramientas de obra general", description="",
+        totalAmount=1, actualAmount=1, is_available=True,
+        shed_id=zone.shed_id, zone_id=zone.id, status=1,
+    )
+    db.add(item)
+    db.commit()
+
+    detail = client.get(f"/items/{item.id}?include=observations", headers=admin_headers)
+    assert detail.status_code == 200
+    assert detail.json()["relations"]["observations"] == []
+    assert detail.json()["relations"]["observations_count"] == 0
+
+    listed = client.get(f"/api/observations/item/{item.id}", headers=admin_headers)
+    assert listed.status_code == 404
@@ -0,0 +1,27 @@
+"""Shed and zone names written by another process reach the cached lookup."""
+from sqlalchemy import insert, update
+
+import models
+import place_names
+from place_names import place_names as names
+
+
+def test_missing_zone_reloads_once(db, zone, monkeypatch):
+    monkeypatch.setattr(place_names, "MISS_RELOAD_SECONDS", 0)
+    assert names.zone(db, zone.id) == "Zona A"
+    # Core insert: no dispara los eventos de sesión, como una escritura de otro proceso.
+    new_id = db.execute(
+        insert(models.Zone).values(name="Zona C", shed_id=zone.shed_id).returning(models.Zone.id)
+    ).scalar_one()
+    db.commit()
+
+    assert names.zone(db, new_id) == "Zona C"
+
+
+def test_rename_is_picked_up_after_ttl(db, zone, monkeypatch):
+    assert names.shed(db, zone.shed_id).startswith("Galpón")
+    db.execute(update(models.Shed).where(models.Shed.id == zone.shed_id).values(name="Depósito"))
+    db.commit()
+    monkeypatch.setattr(place_names, "PLACE_NAMES_TTL_SECONDS", 0)
+
+    assert names.shed(db, zone.shed_id) == "Depósito"
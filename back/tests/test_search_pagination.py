@@ -0,0 +1,52 @@
+"""Search pages neither repeat nor skip rows while the catalog changes."""
+from urllib.parse import quote
+
+import models
+from item_search import fts_enabled
+from pagination import encode_cursor
+
+PAGE = 3
+
+
+def _add(db, zone, names):
+    db.add_all(
+        models.Item(
+            name=name, category="Herramientas de obra general", description="",
+            totalAmount=1, actualAmount=1, is_available=True,
+            shed_id=zone.shed_id, zone_id=zone.id, status=1,
+        )
+        for name in names
+    )
+    db.commit()
+
+
+def test_pages_are_stable_when_items_are_added_between_requests(client, db, zone):
+    originals = [f"Llave de paso {n}" for n in range(8)]
+    _add(db, zone, originals)
+
+    seen = []
+    cursor = None
+    while True:
+        url = f"/search?name={quote('llave paso')}&limit={PAGE}"
+        if cursor:
+            url += f"&cursor={cursor}"
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.json()
+        seen.extend(row["name"] for row in body["data"])
+        # Cada alta mueve el bm25 de todas las filas que ya coinciden.
+        _add(db, zone, [f"Llave de paso llave paso extra {len(seen)}"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen))
+    assert set(originals) <= set(seen)
+    assert fts_enabled() or seen == sorted(seen)
+
+
+def test_tampered_cursor_is_rejected(client, db, zone):
+    _add(db, zone, [f"Nivel láser {n}" for n in range(PAGE + 1)])
+    cursor = encode_cursor((None, None, ["1; DROP"])) if fts_enabled() else encode_cursor((1,))
+
+    assert client.get(f"/search?name=nivel&cursor={cursor}").status_code == 400
@@ -1,3 +1,31 @@
+const IDEMPOTENT_RETRIES = 3;
+
+function newIdempotencyKey() {
+  if (globalThis.crypto?.randomUUID) return globalThis.crypto.randomUUID();
+  return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+function wait(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+// Reintenta cortes de red y pedidos "en curso" con la misma Idempotency-Key:
+// el backend devuelve la respuesta original en vez de mover stock dos veces.
+async function fetchIdempotent(url, init) {
+  const headers = { ...init.headers, "Idempotency-Key": newIdempotencyKey() };
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await fetch(url, { ...init, headers });
+      if (response.status !== 409 || !response.headers.get("Retry-After") || attempt >= IDEMPOTENT_RETRIES) {
+        return response;
+      }
+    } catch (e) {
+      if (attempt >= IDEMPOTENT_RETRIES) throw e;
+    }
+    await wait(500 * attempt);
+  }
+}
+
 export async function apiFetch(endpoint, options = {}) {
   const token = localStorage.getItem("authToken");
   const base = (import.meta.env.VITE_API_URL || "").replace(/\/$/, "");
@@ -13,14 +41,17 @@ export async function apiFetch(endpoint, options = {}) {
     url += `?${params.toString()}`;
   }
 
-  const response = await fetch(url, {
+  const init = {
     method: options.method || "GET",
     headers: {
       ...(options.headers || {}), 
       ...(token && { Authorization: `Bearer ${token}` }),
     },
     body: options.body,
-  });
+  };
+  const response = options.idempotent
+    ? await fetchIdempotent(url, init)
+    : await fetch(url, init);
 
   const responseClone = response.clone();
 
@@ -45,15 +45,26 @@ export async function addObservation(itemId, description, observedBy = "") {
 
 export async function retirarItem(data) {
   return apiFetch("/historical/retirar", {
+    idempotent: true,
     method: "POST",
     headers: { "Content-Type": "application/json" },  
     body: JSON.stringify(data),
   });
 }
 
+export async function retirarItemsLote(data) {
+  return apiFetch("/historical/retirar/lote", {
+    idempotent: true,
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(data),
+  });
+}
+
 
 export async function devolverItem(data) {
   return apiFetch(`/historical/devolver`, {
+    idempotent: true,
     method: "POST",
     headers: {
       "Content-Type": "application/json"
@@ -62,6 +73,15 @@ export async function devolverItem(data) {
   });
 }
 
+export async function devolverItemsLote(data) {
+  return apiFetch("/historical/devolver/lote", {
+    idempotent: true,
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(data),
+  });
+}
+
 export async function getPendingPlaces(itemId) {
   return apiFetch(`/historical/pending-places/${itemId}`, {
     method: "GET",
@@ -76,6 +96,7 @@ export async function getHistorialPlaces() {
 
 export async function trasladarItem(data) {
   return apiFetch("/historical/trasladar", {
+    idempotent: true,
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(data),
@@ -101,6 +122,7 @@ export async function createItem(data) {
 
 export async function updateItem(item_id, data) {
   return apiFetch(`/items/by-id/${item_id}`, {
+    idempotent: true,
     method: "PUT",
     headers: {
       "Content-Type": "application/json"
@@ -148,6 +170,49 @@ export const getFilteredHistorial = async (filters = {}, page = 1, pageSize = 10
   });
 };
 
+function saveBlob(blob, filename) {
+  const url = window.URL.createObjectURL(blob);
+  const link = document.createElement("a");
+  link.href = url;
+  link.download = filename;
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+  window.URL.revokeObjectURL(url);
+}
+
+export async function exportHistorial(filters = {}, format = "csv") {
+  const token = localStorage.getItem("authToken");
+  const base = (import.meta.env.VITE_API_URL || "").replace(/\/$/, "");
+  const params = new URLSearchParams({ format });
+  const values = {
+    item_name: filters.itemName,
+    user_name: filters.userName,
+    place: filters.place,
+    action: filters.action,
+    item_category: filters.category,
+    shedId: filters.shed,
+    month: filters.showAll ? undefined : filters.month,
+    year: filters.showAll ? undefined : filters.year,
+  };
+  Object.entries(values).forEach(([key, value]) => {
+    if (value) params.set(key, value);
+  });
+  const response = await fetch(`${base}/historical/export?${params}`, {
+    method: "GET",
+    headers: {
+      ...(token && { Authorization: `Bearer ${token}` }),
+    },
+  });
+
+  if (!response.ok) {
+    const errorText = await response.text();
+    throw new Error(errorText || "Error al exportar el historial");
+  }
+
+  saveBlob(await response.blob(), `historial.${format}`);
+}
+
 export async function downloadImportTemplate() {
   const token = localStorage.getItem("authToken");
   const base = (import.meta.env.VITE_API_URL || "").replace(/\/$/, "");
@@ -163,44 +228,79 @@ export async function downloadImportTemplate() {
     throw new Error(errorText || "Error al descargar la plantilla");
   }
 
-  const blob = await response.blob();
-  const url = window.URL.createObjectURL(blob);
-  const link = document.createElement("a");
-  link.href = url;
-  link.download = "plantilla_carga_inventario.xlsx";
-  document.body.appendChild(link);
-  link.click();
-  link.remove();
-  window.URL.revokeObjectURL(url);
+  saveBlob(await response.blob(), "plantilla_carga_inventario.xlsx");
+}
+
+export async function exportStock(filters = {}, format = "xlsx") {
+  const token = localStorage.getItem("authToken");
+  const base = (import.meta.env.VITE_API_URL || "").replace(/\/$/, "");
+  const params = new URLSearchParams({ format });
+  if (filters.name) params.set("name", filters.name);
+  if (filters.category) params.set("category", filters.category);
+  if (filters.shed) params.set("shed_id", filters.shed);
+  if (filters.zone) params.set("zone_id", filters.zone);
+  const response = await fetch(`${base}/items/export?${params}`, {
+    method: "GET",
+    headers: {
+      ...(token && { Authorization: `Bearer ${token}` }),
+    },
+  });
+
+  if (!response.ok) {
+    const errorText = await response.text();
+    throw new Error(errorText || "Error al exportar el stock");
+  }
+
+  saveBlob(await response.blob(), `stock.${format}`);
+}
+
+const IMPORT_POLL_INTERVAL = 1000;
+
+async function importErrorMessage(response) {
+  let message = "Error al importar el archivo";
+  try {
+    const errorData = await response.json();
+    message = errorData.detail || message;
+  } catch {
+    const errorText = await response.text();
+    message = errorText || message;
+  }
+  return typeof message === "string" ? message : "Error al importar el archivo";
 }
 
-export async function importItemsExcel(file) {
+// La carga corre en segundo plano: se envía el archivo y se consulta el
+// estado del trabajo hasta que termina.
+export async function importItemsExcel(file, { onProgress } = {}) {
   const token = localStorage.getItem("authToken");
   const base = (import.meta.env.VITE_API_URL || "").replace(/\/$/, "");
+  const headers = { ...(token && { Authorization: `Bearer ${token}` }) };
   const formData = new FormData();
   formData.append("file", file);
 
   const response = await fetch(base + "/items/import", {
     method: "POST",
-    headers: {
-      ...(token && { Authorization: `Bearer ${token}` }),
-    },
+    headers,
     body: formData,
   });
-
   if (!response.ok) {
-    let message = "Error al importar el archivo";
-    try {
-      const errorData = await response.json();
-      message = errorData.detail || message;
-    } catch {
-      const errorText = await response.text();
-      message = errorText || message;
+    throw new Error(await importErrorMessage(response));
+  }
+
+  let job = await response.json();
+  while (job.status === "pending" || job.status === "running") {
+    onProgress?.(job.progress);
+    await new Promise((resolve) => setTimeout(resolve, IMPORT_POLL_INTERVAL));
+    const poll = await fetch(`${base}/items/import/${job.job_id}`, { headers });
+    if (!poll.ok) {
+      throw new Error(await importErrorMessage(poll));
     }
-    throw new Error(typeof message === "string" ? message : "Error al importar el archivo");
+    job = await poll.json();
   }
 
-  return response.json();
+  if (job.status === "failed") {
+    throw new Error(job.detail || "Error al importar el archivo");
+  }
+  return job.result;
 }
 
 export async function generarRemito(historyIds) {
@@ -64,6 +64,7 @@ export const moveItem = async (movementData) => {
 
     const response = await apiFetch('/movements/', {
       ...getAuthHeaders(),
+      idempotent: true,
       method: 'POST',
       body: JSON.stringify(payload)
     });
@@ -5,6 +5,7 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
   const [file, setFile] = useState(null);
   const [isDownloading, setIsDownloading] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const [error, setError] = useState("");
   const [result, setResult] = useState(null);
   const [showManual, setShowManual] = useState(false);
@@ -16,6 +17,7 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
     setResult(null);
     setIsDownloading(false);
     setIsUploading(false);
+    setProgress(null);
     setShowManual(false);
   }, [isOpen]);
 
@@ -43,18 +45,18 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
   const handleSubmit = async (e) => {
     e.preventDefault();
     if (!file) {
-      setError("Seleccioná un archivo Excel (.xlsx)");
+      setError("Seleccioná un archivo Excel (.xlsx) o CSV");
       return;
     }
-    if (!file.name.toLowerCase().endsWith(".xlsx")) {
-      setError("El archivo debe ser un Excel (.xlsx)");
+    if (!/\.(xlsx|csv|tsv|txt)$/.test(file.name.toLowerCase())) {
+      setError("El archivo debe ser un Excel (.xlsx) o un CSV");
       return;
     }
 
     setError("");
     setIsUploading(true);
     try {
-      const data = await importItemsExcel(file);
+      const data = await importItemsExcel(file, { onProgress: setProgress });
       setResult(data);
       if ((data.created || 0) + (data.updated || 0) > 0) {
         onSuccess?.();
@@ -64,10 +66,12 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
       setResult(null);
     } finally {
       setIsUploading(false);
+      setProgress(null);
     }
   };
 
   const hasErrors = (result?.errors || []).length > 0;
+  const hasSuggestions = (result?.suggestions || []).length > 0;
 
   return (
     <div
@@ -154,7 +158,7 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
                     Cada carga queda en el Historial: vos figurás como usuario que cargó, y{" "}
                     <code>comprado_por</code> como responsable.
                   </li>
-                  <li>El archivo tiene que ser Excel <strong>.xlsx</strong>.</li>
+                  <li>El archivo tiene que ser Excel <strong>.xlsx</strong> o <strong>CSV</strong> (coma, punto y coma o tabulación).</li>
                 </ol>
                 <p className="small text-secondary mb-0">
                   La plantilla también incluye la hoja <strong>Manual</strong> con estas indicaciones.
@@ -164,11 +168,11 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
 
             <form onSubmit={handleSubmit}>
               <div className="mb-3">
-                <label className="form-label fw-bold">Archivo Excel</label>
+                <label className="form-label fw-bold">Archivo Excel o CSV</label>
                 <input
                   type="file"
                   className="form-control"
-                  accept=".xlsx,application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                  accept=".xlsx,.csv,.tsv,.txt,application/vnd.openxmlformats-officedocument.spreadsheetml.sheet,text/csv"
                   onChange={handleFileChange}
                   disabled={isUploading}
                 />
@@ -205,6 +209,29 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
                 </div>
               )}
 
+              {hasSuggestions && (
+                <div className="table-responsive" style={{ maxHeight: "220px" }}>
+                  <table className="table table-sm table-bordered mb-3">
+                    <thead className="table-light">
+                      <tr>
+                        <th style={{ width: "80px" }}>Fila</th>
+                        <th>Creado</th>
+                        <th>¿Quisiste decir?</th>
+                      </tr>
+                    </thead>
+                    <tbody>
+                      {result.suggestions.map((item, index) => (
+                        <tr key={`${item.row}-${index}`}>
+                          <td>{item.row}</td>
+                          <td>{item.name}</td>
+                          <td>{item.did_you_mean.join(", ")}</td>
+                        </tr>
+                      ))}
+                    </tbody>
+                  </table>
+                </div>
+              )}
+
               <div className="d-flex justify-content-end mt-3 gap-2">
                 <button
                   type="button"
@@ -219,7 +246,11 @@ const BulkImportModal = ({ isOpen, onClose, onSuccess }) => {
                   className="btn btn-primary"
                   disabled={isUploading || !file}
                 >
-                  {isUploading ? "Importando..." : "Importar"}
+                  {isUploading
+                    ? progress?.total
+                      ? `Importando... ${progress.processed}/${progress.total}`
+                      : "Importando..."
+                    : "Importar"}
                 </button>
               </div>
             </form>
@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import Dashboard from "./Dashboard";
-import { getFilteredHistorial } from "../api/items"
+import { exportHistorial, getFilteredHistorial } from "../api/items"
 import PackingSlipModal from "../components/CrearRemito";
 import {getSheds} from "../api/sheds"
 const Historial = () => {
@@ -15,6 +15,7 @@ const Historial = () => {
     totalPages: 1
   });
   const [showRemitoModal, setShowRemitoModal] = useState(false);
+  const [exporting, setExporting] = useState(false);
   const [filters, setFilters] = useState({
     itemName: "",
     userName: "",
@@ -147,6 +148,17 @@ useEffect(() => {
     setPagination(prev => ({ ...prev, page: 1 }));
   };
 
+  const handleExport = async () => {
+    try {
+      setExporting(true);
+      await exportHistorial(filters);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setExporting(false);
+    }
+  };
+
   const handlePageChange = (newPage) => {
     setPagination(prev => ({ ...prev, page: newPage }));
   };
@@ -306,7 +318,14 @@ useEffect(() => {
             </div>
           </div>
           
-          <div className="d-flex justify-content-end mt-3">
+          <div className="d-flex justify-content-end gap-2 mt-3">
+            <button
+              onClick={handleExport}
+              className="btn btn-outline-primary"
+              disabled={exporting}
+            >
+              {exporting ? "Exportando..." : "Exportar"}
+            </button>
             <button
               onClick={clearFilters}
               className="btn btn-outline-secondary"
@@ -1,5 +1,5 @@
 import { useEffect, useState } from "react";
-import { getItems} from "../api/items";
+import { exportStock, getItems } from "../api/items";
 import { getSheds } from "../api/sheds";
 import { getZones } from "../api/zones";
 import { getMovements } from "../api/movements";
@@ -37,6 +37,7 @@ const Items = () => {
   const [pagination, setPagination] = useState({ page: 1, pageSize: 10, totalRecords: 0, totalPages: 1 });
   const [itemModal, setItemModal] = useState({ open: false, mode: "create", itemId: null });
   const [showBulkImportModal, setShowBulkImportModal] = useState(false);
+  const [isExporting, setIsExporting] = useState(false);
   const [pendingRemitoData, setPendingRemitoData] = useState(null);
   const [showRemitoModal, setShowRemitoModal] = useState(false);
   const [showTrasladoModal, setShowTrasladoModal] = useState(false);
@@ -130,6 +131,17 @@ const Items = () => {
     setFilters({ name: "", category: "", shed: "", zone: "" });
   };
 
+  const handleExport = async () => {
+    setIsExporting(true);
+    try {
+      await exportStock(filters);
+    } catch (err) {
+      console.error("Error exportando stock:", err);
+    } finally {
+      setIsExporting(false);
+    }
+  };
+
   const filteredItems = items.filter((item) =>
     item.name.toLowerCase().includes(filters.name.toLowerCase())
   );
@@ -273,6 +285,13 @@ const Items = () => {
           {pagination.totalRecords} producto{pagination.totalRecords === 1 ? "" : "s"}
         </p>
         <div className="d-flex gap-2">
+          <button
+            onClick={handleExport}
+            className="btn btn-outline-secondary btn-sm"
+            disabled={isLoading || isExporting}
+          >
+            {isExporting ? "Exportando..." : "Exportar"}
+          </button>
           <button
             onClick={() => setShowBulkImportModal(true)}
             className="btn btn-outline-primary btn-sm"